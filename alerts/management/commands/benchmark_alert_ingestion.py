@@ -0,0 +1,61 @@
+import copy
+import json
+import logging
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from alerts.models import Alert
+from alerts.tasks import alert_from_feature, ingest_alerts
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'testdata', 'nws_alerts_active_nv.json')
+
+
+def load_features(count):
+    """The fixture feed's features repeated (with distinct IDs) up to count"""
+    with open(FIXTURE_PATH) as f:
+        template = json.load(f)['features']
+    features = []
+    for n in range(count):
+        feature = copy.deepcopy(template[n % len(template)])
+        feature['id'] = f"{feature['id']}.{n}"
+        features.append(feature)
+    return features
+
+
+def ingest_one_by_one(features):
+    """Ingestion before set-based upserts: an exists() query and a create() per feature"""
+    for feature in features:
+        alert = alert_from_feature(feature)
+        if alert is not None and not Alert.objects.filter(source_id=alert.source_id).exists():
+            alert.save()
+
+
+class Command(BaseCommand):
+    help = "Time NWS alert ingestion against the fixture feed; every run is rolled back"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--features', type=int, nargs='+', default=[100, 1000])
+
+    def run(self, label, ingest, features, known):
+        with transaction.atomic():
+            if known:
+                ingest_alerts(features[:known])
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                ingest(features)
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        self.stdout.write(f"  {label:<12} {elapsed * 1000:9.1f} ms  {len(queries):6} queries")
+
+    def handle(self, *args, **options):
+        logging.disable(logging.INFO)  # per-alert log lines would dominate the timings
+        for count in options['features']:
+            features = load_features(count)
+            for known in (0, count // 2):
+                self.stdout.write(f"{count} features, {known} already stored")
+                self.run('one-by-one', ingest_one_by_one, features, known)
+                self.run('bulk', ingest_alerts, features, known)
@@ -0,0 +1,162 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .polling import get_poll_state, has_hot_alerts
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {
+    'User-Agent': 'Weather Alert App (contact@yourapp.com)',
+    'Accept': 'application/json'
+}
+
+VALIDATORS_KEY = "alerts:nws:validators:{}"
+FETCHES_KEY = "alerts:nws:fetches"
+NOT_MODIFIED_KEY = "alerts:nws:not_modified"
+LAST_FETCH_KEY = "alerts:nws:last_fetch"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Pooled HTTP session shared by every fetch in this worker process,
+    so polls reuse their TLS connections to the NWS API
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+            # Enough pooled connections for every concurrent feed fetch
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, settings.WEATHER_FETCH_WORKERS))
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+    return _session
+
+
+def alert_feed_urls():
+    """
+    Active-alert feed URLs for every configured state/area and forecast zone
+    """
+    base_url = settings.WEATHER_API_BASE_URL.rstrip('/')
+    urls = [f"{base_url}/alerts/active?area={area}" for area in settings.WEATHER_ALERT_AREAS]
+    urls += [f"{base_url}/alerts/active?zone={zone}" for zone in settings.WEATHER_ALERT_ZONES]
+    return urls
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def stored_validators(url):
+    return cache.get(VALIDATORS_KEY.format(url)) or {'url': url}
+
+
+def fetch_alert_features(url):
+    """
+    Fetch one active alerts feed with a conditional GET.
+    Returns (features, validators). features is None when the feed has not changed
+    since the last processed fetch (HTTP 304), in which case there is nothing to parse.
+    Pass validators to remember_validators() once the features have been stored.
+    """
+    validators = stored_validators(url)
+
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    response = get_session().get(url, headers=headers, timeout=settings.WEATHER_API_TIMEOUT)
+
+    _incr(FETCHES_KEY)
+    cache.set(LAST_FETCH_KEY, {'at': timezone.now().isoformat(), 'status': response.status_code}, timeout=None)
+
+    if response.status_code == 304:
+        _incr(NOT_MODIFIED_KEY)
+        logger.info("NWS alerts feed not modified since last fetch")
+        return None, validators
+
+    response.raise_for_status()
+
+    features = response.json().get('features', [])
+    validators = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'hot': has_hot_alerts(features),  # remembered so an unchanged feed keeps its verdict
+    }
+    return features, validators
+
+
+def fetch_alert_feeds(urls=None):
+    """
+    Fetch every configured feed concurrently over the shared session, so a poll
+    takes as long as the slowest feed rather than the sum of all of them.
+    Returns ({url: (features, validators)}, {url: exception}).
+    """
+    urls = urls or alert_feed_urls()
+    results, errors = {}, {}
+    if not urls:
+        return results, errors
+
+    workers = min(len(urls), settings.WEATHER_FETCH_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='nws-fetch') as executor:
+        futures = {executor.submit(fetch_alert_features, url): url for url in urls}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                results[url] = future.result()
+            except Exception as e:
+                logger.error(f"Fetching {url} failed: {str(e)}")
+                errors[url] = e
+    return results, errors
+
+
+def remember_validators(validators):
+    """
+    Store the feed's ETag/Last-Modified for the next conditional GET. Called only
+    after a fetch has been ingested, so a failed run does not turn the retry into a 304.
+    """
+    cache.set(VALIDATORS_KEY.format(validators['url']), validators, timeout=None)
+
+
+def retry_after_seconds(response):
+    """
+    Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None
+    """
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        return max(0, int((parsedate_to_datetime(value) - timezone.now()).total_seconds()))
+    except (TypeError, ValueError):
+        return None
+
+
+def feed_stats():
+    values = cache.get_many([FETCHES_KEY, NOT_MODIFIED_KEY, LAST_FETCH_KEY])
+    fetches, not_modified = values.get(FETCHES_KEY, 0), values.get(NOT_MODIFIED_KEY, 0)
+    return {
+        'fetches': fetches,
+        'not_modified': not_modified,
+        'not_modified_rate': round(not_modified / fetches, 4) if fetches else 0.0,
+        'last_fetch': values.get(LAST_FETCH_KEY),
+        'poll': get_poll_state(),
+    }
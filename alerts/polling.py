@@ -0,0 +1,68 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+POLL_STATE_KEY = "alerts:poll:state"
+POLL_LOCK_KEY = "alerts:poll:lock"
+
+# Severities that keep the poller on its fast cadence while any such alert is active
+HOT_SEVERITIES = {'Severe', 'Extreme'}
+
+# Beat ticks once a minute; polls due within this many seconds run on the current tick
+SCHEDULE_SLACK = 5
+
+
+def get_poll_state():
+    return cache.get(POLL_STATE_KEY) or {}
+
+
+def save_poll_state(state):
+    cache.set(POLL_STATE_KEY, state, timeout=None)
+
+
+def is_due(state, now):
+    return now + SCHEDULE_SLACK >= state.get('next_at', 0)
+
+
+def has_hot_alerts(features):
+    return any((feature.get('properties') or {}).get('severity') in HOT_SEVERITIES for feature in features)
+
+
+def plan_next_poll(state, now, hot=None, new_alerts=0, retry_after=None, failed=False):
+    """
+    Schedule the next NWS poll after one at `now` and return the new state.
+
+    Polls every WEATHER_POLL_FAST_INTERVAL seconds while a Severe/Extreme alert is
+    active or new alerts arrived within WEATHER_POLL_RECENT_WINDOW. Otherwise (and
+    after failures) the interval doubles from WEATHER_POLL_QUIET_MIN_INTERVAL up to
+    WEATHER_POLL_MAX_INTERVAL. A Retry-After from the API is never undercut.
+    hot=None keeps the previous verdict.
+    """
+    if hot is None:
+        hot = state.get('hot', False)
+    last_new_at = now if new_alerts else state.get('last_new_at')
+    recent = last_new_at is not None and now - last_new_at < settings.WEATHER_POLL_RECENT_WINDOW
+
+    if (hot or recent) and not failed:
+        interval = settings.WEATHER_POLL_FAST_INTERVAL
+        reason = 'severe alerts active' if hot else 'new alerts recently'
+    else:
+        previous = state.get('interval') or 0
+        interval = min(max(previous * 2, settings.WEATHER_POLL_QUIET_MIN_INTERVAL), settings.WEATHER_POLL_MAX_INTERVAL)
+        reason = 'fetch failed' if failed else 'feed quiet'
+
+    if retry_after:
+        interval = max(interval, retry_after)
+        reason += ', Retry-After'
+
+    return {
+        'last_poll_at': now,
+        'next_at': now + interval,
+        'interval': interval,
+        'reason': reason,
+        'hot': hot,
+        'last_new_at': last_new_at,
+    }
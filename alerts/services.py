@@ -1,13 +1,29 @@
 import json
 import logging
 import time
-from firebase_admin import messaging
+from firebase_admin import exceptions, messaging
 from django.conf import settings
 from django.utils import timezone
 from accounts.models import CustomUser
 
 logger = logging.getLogger(__name__)
 
+# Per-token send errors: the token is dead and should be removed
+INVALID_TOKEN_ERRORS = (
+    messaging.UnregisteredError,
+    messaging.SenderIdMismatchError,
+    exceptions.InvalidArgumentError,
+)
+
+# Errors worth retrying: FCM overload, quota, timeouts and server faults
+TRANSIENT_ERRORS = (
+    exceptions.UnavailableError,
+    exceptions.InternalError,
+    exceptions.DeadlineExceededError,
+    exceptions.ResourceExhaustedError,
+    exceptions.UnknownError,
+)
+
 
 class FCMNotificationService:
     """
@@ -26,124 +42,119 @@ class FCMNotificationService:
             logger.error("Firebase Admin SDK not installed")
             return False
     
+    @staticmethod
+    def alert_recipients():
+        """
+        Users with a firebase token who want weather alerts
+        """
+        return CustomUser.objects.filter(
+            firebase_token__isnull=False,
+            receive_weather_alerts=True
+        ).exclude(firebase_token='')
+    
+    @staticmethod
+    def build_alert_message(alert, tokens):
+        """
+        Multicast message for one weather alert to up to FCM_BATCH_SIZE devices
+        """
+        return messaging.MulticastMessage(
+            notification=messaging.Notification(
+                title=alert.event,
+                body=alert.headline
+            ),
+            data={
+                'alert_id': str(alert.id),
+                'severity': alert.severity,
+                'area': alert.area,
+                'type': 'weather_alert'
+            },
+            tokens=tokens,
+            android=messaging.AndroidConfig(
+                priority='high',
+                notification=messaging.AndroidNotification(
+                    icon='ic_weather_alert',
+                    color='#FF5722',
+                    sound='default'
+                )
+            ),
+            apns=messaging.APNSConfig(
+                payload=messaging.APNSPayload(
+                    aps=messaging.Aps(
+                        alert=messaging.ApsAlert(
+                            title=alert.event,
+                            body=alert.headline
+                        ),
+                        sound='default',
+                        badge=1
+                    )
+                )
+            )
+        )
+    
+    @staticmethod
+    def clear_invalid_tokens(tokens):
+        """
+        Remove tokens FCM reported as unregistered or invalid, in one UPDATE
+        """
+        if tokens:
+            cleared = CustomUser.objects.filter(firebase_token__in=tokens).update(firebase_token=None)
+            logger.info(f"Removed {cleared} invalid firebase tokens")
+    
+    @staticmethod
+    def send_alert_batch(alert, recipients):
+        """
+        Send an alert to one chunk of (user_id, token) pairs with send_each_for_multicast.
+        Invalid tokens are cleared; returns the number sent and the user IDs whose
+        delivery failed transiently and is worth retrying.
+        """
+        if not recipients:
+            return 0, []
+        
+        response = messaging.send_each_for_multicast(
+            FCMNotificationService.build_alert_message(alert, [token for _, token in recipients])
+        )
+        
+        invalid_tokens, retry_ids = [], []
+        for (user_id, token), resp in zip(recipients, response.responses):
+            if resp.success:
+                continue
+            if isinstance(resp.exception, INVALID_TOKEN_ERRORS):
+                invalid_tokens.append(token)
+            elif isinstance(resp.exception, TRANSIENT_ERRORS):
+                retry_ids.append(str(user_id))
+            else:
+                logger.error(f"Failed to send alert {alert.id} to user {user_id}: {str(resp.exception)}")
+        
+        FCMNotificationService.clear_invalid_tokens(invalid_tokens)
+        
+        logger.info(f"Sent {response.success_count}/{len(recipients)} notifications for alert {alert.id}")
+        return response.success_count, retry_ids
+    
     @staticmethod
     def send_alert_notification(alert):
         """
-        Send push notification for a new weather alert
+        Send push notification for a new weather alert, one FCM_BATCH_SIZE chunk at a time.
+        Blocks until every chunk is sent; new alerts go through alerts.tasks.notify_alert_task,
+        which fans the chunks out to Celery workers instead.
         """
         if not FCMNotificationService._check_firebase_availability():
             logger.warning("Firebase not available - skipping alert notification")
             return False
             
         try:
-            # Get all users with firebase tokens who want weather alerts
-            users_with_tokens = CustomUser.objects.filter(
-                firebase_token__isnull=False,
-                receive_weather_alerts=True
-            ).exclude(firebase_token='')
-            
-            if not users_with_tokens.exists():
+            recipients = list(FCMNotificationService.alert_recipients().values_list('id', 'firebase_token'))
+            if not recipients:
                 logger.info("No users with firebase tokens found for weather alerts")
                 return False
             
-            # Extract tokens
-            tokens = [user.firebase_token for user in users_with_tokens]
-            
-            # Create notification payload
-            notification = messaging.Notification(
-                title=alert.event,
-                body=alert.headline
-            )
-            
-            # Create data payload
-            data = {
-                'alert_id': str(alert.id),
-                'severity': alert.severity,
-                'area': alert.area,
-                'type': 'weather_alert'
-            }
-            
-            # Send notification - use send_all for batch messaging
-            try:
-                # Try the newer send_all method first
-                response = messaging.send_all([
-                    messaging.Message(
-                        notification=notification,
-                        data=data,
-                        token=token,
-                        android=message.android,
-                        apns=message.apns
-                    ) for token in tokens
-                ])
-                
-                # Log results
-                logger.info(f"Successfully sent {response.success_count} alert notifications")
-                
-                if response.failure_count > 0:
-                    logger.warning(f"Failed to send {response.failure_count} alert notifications")
-                    
-                    # Handle invalid tokens
-                    for idx, resp in enumerate(response.responses):
-                        if not resp.success:
-                            error_code = resp.exception.code if resp.exception else 'unknown'
-                            if error_code in ['registration-token-not-registered', 'invalid-registration-token']:
-                                # Remove invalid token
-                                user = users_with_tokens[idx]
-                                user.firebase_token = None
-                                user.save()
-                                logger.info(f"Removed invalid token for user {user.id}")
-                
-                return response.success_count > 0
-                
-            except AttributeError:
-                # Fallback to individual send calls for older SDK versions
-                logger.info("Using individual send calls as fallback")
-                success_count = 0
-                
-                for idx, token in enumerate(tokens):
-                    try:
-                        individual_message = messaging.Message(
-                            notification=notification,
-                            data=data,
-                            token=token,
-                            android=messaging.AndroidConfig(
-                                priority='high',
-                                notification=messaging.AndroidNotification(
-                                    icon='ic_weather_alert',
-                                    color='#FF5722',
-                                    sound='default'
-                                )
-                            ),
-                            apns=messaging.APNSConfig(
-                                payload=messaging.APNSPayload(
-                                    aps=messaging.Aps(
-                                        alert=messaging.ApsAlert(
-                                            title=alert.event,
-                                            body=alert.headline
-                                        ),
-                                        sound='default',
-                                        badge=1
-                                    )
-                                )
-                            )
-                        )
-                        
-                        response = messaging.send(individual_message)
-                        success_count += 1
-                        
-                    except messaging.UnregisteredError:
-                        logger.warning(f"Invalid token for user {users_with_tokens[idx].id}")
-                        users_with_tokens[idx].firebase_token = None
-                        users_with_tokens[idx].save()
-                    except Exception as e:
-                        logger.error(f"Failed to send to token {idx}: {str(e)}")
-                
-                logger.info(f"Individual sends completed: {success_count}/{len(tokens)} successful")
-                return success_count > 0
+            success_count = 0
+            for start in range(0, len(recipients), settings.FCM_BATCH_SIZE):
+                sent, _ = FCMNotificationService.send_alert_batch(
+                    alert, recipients[start:start + settings.FCM_BATCH_SIZE]
+                )
+                success_count += sent
+            return success_count > 0
             
-        except ImportError as e:
-            logger.error(f"Firebase messaging module not available: {str(e)}")
-            return False
         except Exception as e:
             logger.error(f"Error sending FCM alert notification: {str(e)}")
             return False
@@ -281,7 +292,7 @@ class FCMNotificationService:
             )
             
             # Send notification
-            response = messaging.send_multicast(message)
+            response = messaging.send_each_for_multicast(message)
             
             logger.info(f"Successfully sent {response.success_count} bulk notifications")
             
@@ -289,14 +300,10 @@ class FCMNotificationService:
             if response.failure_count > 0:
                 logger.warning(f"Failed to send {response.failure_count} bulk notifications")
                 
-                for idx, resp in enumerate(response.responses):
-                    if not resp.success:
-                        error_code = resp.exception.code if resp.exception else 'unknown'
-                        if error_code in ['registration-token-not-registered', 'invalid-registration-token']:
-                            user = users_with_tokens[idx]
-                            user.firebase_token = None
-                            user.save()
-                            logger.info(f"Removed invalid token for user {user.id}")
+                FCMNotificationService.clear_invalid_tokens([
+                    token for token, resp in zip(tokens, response.responses)
+                    if not resp.success and isinstance(resp.exception, INVALID_TOKEN_ERRORS)
+                ])
             
             return response.success_count > 0
             
@@ -1,74 +1,218 @@
 import requests
 import logging
+import time
 from celery import shared_task
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
+from django.db import transaction
 from .models import Alert
-from .services import FCMNotificationService
+from .nws import fetch_alert_feeds, stored_validators, remember_validators, retry_after_seconds
+from .polling import (
+    POLL_LOCK_KEY, get_poll_state, save_poll_state, is_due, plan_next_poll
+)
+from .services import FCMNotificationService, TRANSIENT_ERRORS
 
 logger = logging.getLogger(__name__)
 
 
+def alert_from_feature(feature):
+    """
+    Build an unsaved Alert from one GeoJSON feature of the NWS alerts feed
+    """
+    properties = feature.get('properties', {})
+    source_id = feature.get('id')
+    
+    if not source_id:
+        logger.warning("Skipping alert with missing ID")
+        return None
+    
+    return Alert(
+        source_id=source_id,
+        event=(properties.get('event') or '')[:200],  # Limit to field max length
+        headline=(properties.get('headline') or '')[:500],
+        description=properties.get('description') or '',
+        severity=properties.get('severity') or 'Minor',
+        area=(properties.get('areaDesc') or '')[:500]
+    )
+
+
+def ingest_alerts(features):
+    """
+    Insert the alerts from the feed that are not stored yet and return them.
+    Known source IDs are looked up with one IN query and new alerts are written
+    with bulk_create in batches of MAX_ALERTS_PER_BATCH.
+    """
+    candidates = {}
+    for feature in features:
+        try:
+            alert = alert_from_feature(feature)
+        except Exception as e:
+            logger.error(f"Error processing individual alert: {str(e)}")
+            continue
+        if alert is not None:
+            candidates.setdefault(alert.source_id, alert)
+    
+    if not candidates:
+        return []
+    
+    known_ids = set(
+        Alert.objects.filter(source_id__in=list(candidates)).values_list('source_id', flat=True)
+    )
+    new_alerts = [alert for source_id, alert in candidates.items() if source_id not in known_ids]
+    if not new_alerts:
+        return []
+    
+    # ignore_conflicts covers a concurrent run inserting the same source_id first
+    Alert.objects.bulk_create(
+        new_alerts, batch_size=settings.MAX_ALERTS_PER_BATCH, ignore_conflicts=True
+    )
+    
+    # IDs are generated client-side, so the rows this run actually inserted can be identified
+    inserted_ids = set(
+        Alert.objects.filter(id__in=[alert.id for alert in new_alerts]).values_list('id', flat=True)
+    )
+    inserted = [alert for alert in new_alerts if alert.id in inserted_ids]
+    
+    for alert in inserted:
+        logger.info(f"Created new alert: {alert.event} - {alert.area}")
+    
+    return inserted
+
+
+def queue_alert_notification(alert):
+    """
+    Enqueue notify_alert_task for an alert once the current transaction commits
+    """
+    def enqueue():
+        try:
+            notify_alert_task.delay(str(alert.id))
+        except Exception as e:
+            logger.error(f"Error queueing notifications for alert {alert.id}: {str(e)}")
+    
+    logger.info(f"New alert created, queueing notifications: {alert.event}")
+    transaction.on_commit(enqueue)
+
+
+def notify_new_alerts(alerts):
+    """
+    Queue push notifications for newly ingested alerts
+    """
+    for alert in alerts:
+        queue_alert_notification(alert)
+
+
+@shared_task
+def notify_alert_task(alert_id):
+    """
+    Celery task that fans an alert's push notifications out to workers: recipients are
+    split into FCM_BATCH_SIZE chunks and each chunk is sent by its own send_alert_batch_task
+    """
+    if not settings.FCM_ENABLED or not FCMNotificationService._check_firebase_availability():
+        return "FCM disabled - skipping alert notification"
+    
+    user_ids = [
+        str(user_id) for user_id in
+        FCMNotificationService.alert_recipients().order_by('id').values_list('id', flat=True)
+    ]
+    batch_size = settings.FCM_BATCH_SIZE
+    for start in range(0, len(user_ids), batch_size):
+        send_alert_batch_task.delay(alert_id, user_ids[start:start + batch_size])
+    
+    batches = (len(user_ids) + batch_size - 1) // batch_size
+    logger.info(f"Queued {batches} notification batches for {len(user_ids)} users, alert {alert_id}")
+    return f"Queued {batches} notification batches for alert {alert_id}"
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def send_alert_batch_task(self, alert_id, user_ids):
+    """
+    Celery task that sends one alert to one chunk of users. A retry resends only to this
+    chunk: the whole chunk if the FCM call failed, otherwise just the users whose
+    delivery failed transiently.
+    """
+    try:
+        alert = Alert.objects.get(id=alert_id)
+    except Alert.DoesNotExist:
+        return f"Alert {alert_id} no longer exists"
+    
+    # Tokens are read at send time, so users who unsubscribed meanwhile are skipped
+    recipients = list(
+        FCMNotificationService.alert_recipients()
+        .filter(id__in=user_ids).order_by('id').values_list('id', 'firebase_token')
+    )
+    countdown = self.default_retry_delay * 2 ** self.request.retries
+    
+    try:
+        sent, retry_ids = FCMNotificationService.send_alert_batch(alert, recipients)
+    except TRANSIENT_ERRORS + (requests.exceptions.RequestException,) as e:
+        logger.warning(f"Notification batch for alert {alert_id} failed, retrying: {str(e)}")
+        raise self.retry(exc=e, countdown=countdown)
+    
+    if retry_ids:
+        logger.warning(f"Retrying {len(retry_ids)} notifications for alert {alert_id}")
+        raise self.retry(args=(alert_id, retry_ids), countdown=countdown)
+    
+    return f"Sent {sent}/{len(recipients)} notifications for alert {alert_id}"
+
+
+def process_alert_feed():
+    """
+    Fetch every configured NWS feed concurrently, store new alerts and notify for them.
+    Returns the number of features, the new alerts, whether any feed changed, whether
+    any active alert is Severe/Extreme, which feeds failed and the longest Retry-After
+    they asked for. Raises the error with the longest Retry-After when every feed failed.
+    """
+    # Conditional GETs over a pooled session; features are None for unchanged feeds (304)
+    results, errors = fetch_alert_feeds()
+    retry_after = {url: retry_after_seconds(getattr(e, 'response', None)) or 0 for url, e in errors.items()}
+    if errors and not results:
+        raise errors[max(retry_after, key=retry_after.get)]
+    
+    # Union of all changed feeds; ingest_alerts deduplicates it on source_id
+    modified = {url: result for url, result in results.items() if result[0] is not None}
+    features = [feature for feed_features, _ in modified.values() for feature in feed_features]
+    
+    new_alerts = ingest_alerts(features) if features else []
+    for _, validators in modified.values():
+        remember_validators(validators)
+    
+    # bulk_create does not fire post_save, so queue notifications for the inserted set explicitly
+    notify_new_alerts(new_alerts)
+    
+    # Feeds that were unchanged or failed keep the verdict of their last ingested fetch
+    hot = any(
+        (results[url][1] if url in results else stored_validators(url)).get('hot', False)
+        for url in list(results) + list(errors)
+    )
+    
+    return {
+        'features': len(features),
+        'new_alerts': new_alerts,
+        'modified': bool(modified),
+        'hot': hot,
+        'failed_feeds': list(errors),
+        'retry_after': max(retry_after.values(), default=0) or None,
+    }
+
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
 def fetch_weather_alerts_task(self):
     """
-    Celery task to fetch weather alerts from National Weather Service API
-    Runs every 30 minutes via Celery Beat
+    Celery task to fetch weather alerts from National Weather Service API once
+    Unchanged feeds are skipped via ETag/Last-Modified; Beat runs poll_weather_alerts_task instead
     """
     try:
-        # API endpoint for Nevada weather alerts
-        api_url = "https://api.weather.gov/alerts/active?area=NV"
-        
-        # Set appropriate headers for NWS API
-        headers = {
-            'User-Agent': 'Weather Alert App (contact@yourapp.com)',
-            'Accept': 'application/json'
-        }
-        
         logger.info("Fetching weather alerts from NWS API")
         
-        # Make API request
-        response = requests.get(api_url, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
-        features = data.get('features', [])
-        
-        new_alerts_count = 0
-        
-        for feature in features:
-            try:
-                properties = feature.get('properties', {})
-                source_id = feature.get('id')
-                
-                if not source_id:
-                    logger.warning("Skipping alert with missing ID")
-                    continue
-                
-                # Check if alert already exists
-                if Alert.objects.filter(source_id=source_id).exists():
-                    continue
-                
-                # Create new alert
-                alert = Alert.objects.create(
-                    source_id=source_id,
-                    event=properties.get('event', '')[:200],  # Limit to field max length
-                    headline=properties.get('headline', '')[:500],
-                    description=properties.get('description', ''),
-                    severity=properties.get('severity', 'Minor'),
-                    area=properties.get('areaDesc', '')[:500]
-                )
-                
-                new_alerts_count += 1
-                logger.info(f"Created new alert: {alert.event} - {alert.area}")
-                
-            except Exception as e:
-                logger.error(f"Error processing individual alert: {str(e)}")
-                continue
+        result = process_alert_feed()
+        if not result['modified']:
+            return "Alerts feed not modified, nothing to process"
         
+        new_alerts_count = len(result['new_alerts'])
         logger.info(f"Task completed. New alerts created: {new_alerts_count}")
-        return f"Successfully processed {len(features)} alerts, created {new_alerts_count} new alerts"
+        return f"Successfully processed {result['features']} alerts, created {new_alerts_count} new alerts"
         
     except requests.exceptions.RequestException as e:
         logger.error(f"API request failed: {str(e)}")
@@ -80,6 +224,51 @@ def fetch_weather_alerts_task(self):
         raise
 
 
+@shared_task
+def poll_weather_alerts_task():
+    """
+    Celery task run every minute via Celery Beat. Polls the NWS feed only when the
+    adaptive schedule says a poll is due: every minute or two during severe or new
+    alerts, backing off towards WEATHER_POLL_MAX_INTERVAL while the feed is quiet.
+    """
+    if not settings.WEATHER_ALERTS_ENABLED:
+        return "Weather alerts disabled"
+    
+    now = time.time()
+    state = get_poll_state()
+    if not is_due(state, now):
+        return f"Next poll in {int(state['next_at'] - now)}s"
+    
+    # A slow poll must not overlap with the next tick's
+    if not cache.add(POLL_LOCK_KEY, 1, timeout=settings.WEATHER_API_TIMEOUT * 2):
+        return "Poll already in progress"
+    
+    try:
+        try:
+            result = process_alert_feed()
+            # A feed that was throttled still sets a floor on the next poll, even if others answered
+            state = plan_next_poll(
+                state, now, hot=result['hot'], new_alerts=len(result['new_alerts']), retry_after=result['retry_after']
+            )
+            message = f"Processed {result['features']} alerts, created {len(result['new_alerts'])} new alerts"
+        except requests.exceptions.RequestException as e:
+            logger.error(f"API request failed: {str(e)}")
+            state = plan_next_poll(
+                state, now, failed=True, retry_after=retry_after_seconds(getattr(e, 'response', None))
+            )
+            message = "Alerts feed request failed"
+        except Exception as e:
+            logger.error(f"Unexpected error in poll_weather_alerts_task: {str(e)}")
+            state = plan_next_poll(state, now, failed=True)
+            message = "Alerts feed processing failed"
+        
+        save_poll_state(state)
+        logger.info(f"{message}. Next poll in {state['interval']}s ({state['reason']})")
+        return message
+    finally:
+        cache.delete(POLL_LOCK_KEY)
+
+
 @shared_task
 def expire_alerts_task():
     """
@@ -1,3 +1,316 @@
-from django.test import TestCase
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from firebase_admin import exceptions, messaging
+
+from accounts.models import CustomUser
+from .models import Alert
+from .polling import SCHEDULE_SLACK, get_poll_state, is_due, plan_next_poll
+from .tasks import (
+    ingest_alerts, notify_alert_task, poll_weather_alerts_task, process_alert_feed, send_alert_batch_task
+)
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), 'testdata')
+STUB_DELAY = 0.3  # seconds each stub feed takes to answer
+
+
+def feature(source_id, severity='Moderate'):
+    return {
+        'id': source_id,
+        'properties': {'event': 'Heat Advisory', 'headline': source_id, 'severity': severity, 'areaDesc': 'Test'},
+    }
+
+
+# One alert per feed plus a storm that crosses the NV/CA border and shows up in both
+STUB_FEEDS = {
+    'NV': [feature('urn:nv-1'), feature('urn:border-storm', 'Severe')],
+    'CA': [feature('urn:ca-1'), feature('urn:border-storm', 'Severe')],
+    'AZ': [feature('urn:az-1')],
+    'CAZ072': [feature('urn:caz072-1')],
+}
+
+# Feeds the stub rate-limits, with the Retry-After (seconds) it sends back
+THROTTLED_FEEDS = {'UT': 600, 'ID': 300}
+
+
+class StubNWSHandler(BaseHTTPRequestHandler):
+    """Serves /alerts/active?area=X or ?zone=Z after STUB_DELAY, honouring If-None-Match"""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        feed = (query.get('area') or query.get('zone') or [''])[0]
+        time.sleep(STUB_DELAY)
+        if feed in THROTTLED_FEEDS:
+            self.send_response(429)
+            self.send_header('Retry-After', str(THROTTLED_FEEDS[feed]))
+            self.end_headers()
+            return
+        etag = f'"{feed}-v1"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps({'features': STUB_FEEDS.get(feed, [])}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/geo+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@mock.patch('alerts.tasks.notify_alert_task.delay')
+class ConcurrentAlertFetchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubNWSHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            WEATHER_API_BASE_URL=f'http://127.0.0.1:{cls.server.server_address[1]}',
+            WEATHER_ALERT_AREAS=['NV', 'CA', 'AZ'],
+            WEATHER_ALERT_ZONES=['CAZ072'],
+            WEATHER_FETCH_WORKERS=8,
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_poll_time_is_bounded_by_slowest_feed(self, delay):
+        start = time.monotonic()
+        result = process_alert_feed()
+        elapsed = time.monotonic() - start
+
+        # Four feeds fetched one after another would take 4 * STUB_DELAY
+        self.assertLess(elapsed, STUB_DELAY * 2)
+        self.assertEqual(result['failed_feeds'], [])
+        self.assertTrue(result['hot'])
+
+    def test_union_is_deduplicated_on_source_id(self, delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = process_alert_feed()
+
+        self.assertEqual(result['features'], 6)
+        self.assertEqual(len(result['new_alerts']), 5)
+        self.assertEqual(Alert.objects.filter(source_id='urn:border-storm').count(), 1)
+        self.assertEqual(delay.call_count, 5)
+
+    def test_unchanged_feeds_keep_their_verdict(self, delay):
+        process_alert_feed()
+        result = process_alert_feed()
+
+        self.assertFalse(result['modified'])
+        self.assertEqual(result['new_alerts'], [])
+        self.assertTrue(result['hot'])
+
+    @override_settings(WEATHER_ALERTS_ENABLED=True, WEATHER_ALERT_AREAS=['NV', 'CA', 'UT', 'ID'])
+    def test_partial_failure_keeps_longest_retry_after(self, delay):
+        result = poll_weather_alerts_task()
+
+        state = get_poll_state()
+        self.assertIn('created 4 new alerts', result)
+        self.assertCountEqual(
+            [url.rsplit('=', 1)[1] for url in process_alert_feed()['failed_feeds']], ['UT', 'ID']
+        )
+        # NV/CA carry a Severe alert, which alone would poll again in a minute
+        self.assertEqual(state['interval'], 600)
+        self.assertIn('Retry-After', state['reason'])
+
+    @override_settings(WEATHER_ALERTS_ENABLED=True, WEATHER_ALERT_AREAS=['UT', 'ID'], WEATHER_ALERT_ZONES=[])
+    def test_total_failure_backs_off_for_longest_retry_after(self, delay):
+        poll_weather_alerts_task()
+
+        state = get_poll_state()
+        self.assertEqual(state['interval'], 600)
+        self.assertIn('fetch failed', state['reason'])
+
+
+class Retry(Exception):
+    pass
+
+
+def send_response(exception=None):
+    return mock.Mock(success=exception is None, exception=exception)
+
+
+@override_settings(FCM_ENABLED=True, FCM_BATCH_SIZE=2)
+@mock.patch('alerts.services.FCMNotificationService._check_firebase_availability', return_value=True)
+class AlertNotificationFanOutTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(f'user{i}@example.com', firebase_token=f'token-{i}')
+            for i in range(5)
+        ]
+        CustomUser.objects.create_user('optout@example.com', firebase_token='token-x', receive_weather_alerts=False)
+        with mock.patch('alerts.tasks.notify_alert_task.delay'):
+            self.alert = Alert.objects.create(
+                source_id='urn:test', event='Flood Warning', headline='Flooding', severity='Severe', area='Reno'
+            )
+
+    def test_saving_an_alert_queues_the_fan_out_after_commit(self, available):
+        with mock.patch('alerts.tasks.notify_alert_task.delay') as delay:
+            with self.captureOnCommitCallbacks() as callbacks:
+                alert = Alert.objects.create(source_id='urn:other', event='Heat', headline='Hot', area='Reno')
+            delay.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+            delay.assert_called_once_with(str(alert.id))
+
+    @mock.patch('alerts.tasks.send_alert_batch_task.delay')
+    def test_recipients_are_split_into_batches(self, delay, available):
+        notify_alert_task(str(self.alert.id))
+
+        batches = [call.args[1] for call in delay.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(sorted(sum(batches, [])), sorted(str(user.id) for user in self.users))
+
+    @mock.patch('alerts.tasks.send_alert_batch_task.retry', side_effect=Retry)
+    @mock.patch('alerts.services.messaging.send_each_for_multicast')
+    def test_batch_clears_invalid_tokens_and_retries_only_transient_failures(self, send, retry, available):
+        ok, unregistered, unavailable = sorted(self.users[:3], key=lambda user: user.id)
+        send.return_value = mock.Mock(success_count=1, responses=[
+            send_response(),
+            send_response(messaging.UnregisteredError('gone')),
+            send_response(exceptions.UnavailableError('busy')),
+        ])
+
+        with self.assertRaises(Retry):
+            send_alert_batch_task(str(self.alert.id), [str(ok.id), str(unregistered.id), str(unavailable.id)])
+
+        unregistered.refresh_from_db()
+        self.assertIsNone(unregistered.firebase_token)
+        self.assertEqual(retry.call_args.kwargs['args'], (str(self.alert.id), [str(unavailable.id)]))
+
+
+@override_settings(MAX_ALERTS_PER_BATCH=3)
+class AlertIngestionTests(TestCase):
+    """Ingestion of the fixture feed: 8 alerts, one repeated as NWS does for overlapping areas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with open(os.path.join(TESTDATA_DIR, 'nws_alerts_active_nv.json')) as f:
+            cls.features = json.load(f)['features']
+        cls.source_ids = list(dict.fromkeys(feature['id'] for feature in cls.features))
+
+    def test_new_feed_is_one_lookup_and_batched_inserts(self):
+        # IN lookup, ceil(8 / 3) inserts, inserted-id check
+        with self.assertNumQueries(1 + 3 + 1):
+            inserted = ingest_alerts(self.features)
+
+        self.assertEqual(len(inserted), 8)
+        self.assertEqual(sorted(Alert.objects.values_list('source_id', flat=True)), sorted(self.source_ids))
+
+    def test_known_alerts_are_skipped(self):
+        ingest_alerts(self.features[:5])
+
+        with self.assertNumQueries(1 + 1 + 1):
+            inserted = ingest_alerts(self.features)
+
+        self.assertEqual({alert.source_id for alert in inserted}, set(self.source_ids[5:]))
+        self.assertEqual(Alert.objects.count(), 8)
+
+    def test_unchanged_feed_only_looks_up(self):
+        ingest_alerts(self.features)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(ingest_alerts(self.features), [])
+
+    def test_alert_inserted_concurrently_is_ignored(self):
+        bulk_create = Alert.objects.bulk_create
+        racing_id = self.source_ids[2]
+
+        def racing_bulk_create(alerts, **kwargs):
+            # Another worker stores one of the alerts between our lookup and our insert
+            if not Alert.objects.filter(source_id=racing_id).exists():
+                bulk_create([Alert(source_id=racing_id, event='Race', headline='', description='', area='')])
+            return bulk_create(alerts, **kwargs)
+
+        with mock.patch.object(Alert.objects, 'bulk_create', side_effect=racing_bulk_create):
+            inserted = ingest_alerts(self.features)
+
+        self.assertNotIn(racing_id, {alert.source_id for alert in inserted})
+        self.assertEqual(len(inserted), 7)
+        self.assertEqual(Alert.objects.get(source_id=racing_id).event, 'Race')
+
+
+@override_settings(
+    WEATHER_POLL_FAST_INTERVAL=60,
+    WEATHER_POLL_QUIET_MIN_INTERVAL=120,
+    WEATHER_POLL_MAX_INTERVAL=1800,
+    WEATHER_POLL_RECENT_WINDOW=900,
+)
+class PollScheduleTests(TestCase):
+    NOW = 1_000_000
+
+    def test_plan_next_poll(self):
+        # (case, previous state, plan_next_poll kwargs, expected interval, expected reason)
+        cases = [
+            ('first poll, quiet', {}, {'hot': False}, 120, 'feed quiet'),
+            ('severe alert active', {'interval': 960}, {'hot': True}, 60, 'severe alerts active'),
+            ('new alerts now', {'interval': 960}, {'hot': False, 'new_alerts': 2}, 60, 'new alerts recently'),
+            ('new alerts 10 minutes ago', {'interval': 60, 'last_new_at': self.NOW - 600}, {'hot': False}, 60,
+             'new alerts recently'),
+            ('new alerts 15 minutes ago', {'interval': 60, 'last_new_at': self.NOW - 900}, {'hot': False}, 120,
+             'feed quiet'),
+            ('quiet doubles', {'interval': 240}, {'hot': False}, 480, 'feed quiet'),
+            ('quiet hits the ceiling', {'interval': 1200}, {'hot': False}, 1800, 'feed quiet'),
+            ('quiet stays at the ceiling', {'interval': 1800}, {'hot': False}, 1800, 'feed quiet'),
+            ('unchanged feed keeps hot verdict', {'interval': 60, 'hot': True}, {'hot': None}, 60,
+             'severe alerts active'),
+            ('unchanged feed keeps quiet verdict', {'interval': 120, 'hot': False}, {'hot': None}, 240,
+             'feed quiet'),
+            ('failure backs off even when hot', {'interval': 60, 'hot': True}, {'failed': True}, 120,
+             'fetch failed'),
+            ('repeated failures double', {'interval': 480}, {'failed': True}, 960, 'fetch failed'),
+            ('Retry-After floors the fast cadence', {}, {'hot': True, 'retry_after': 300}, 300,
+             'severe alerts active, Retry-After'),
+            ('Retry-After floors a failure', {'interval': 120}, {'failed': True, 'retry_after': 600}, 600,
+             'fetch failed, Retry-After'),
+            ('shorter Retry-After is not a ceiling', {'interval': 480}, {'hot': False, 'retry_after': 30}, 960,
+             'feed quiet, Retry-After'),
+        ]
+        for case, state, kwargs, interval, reason in cases:
+            with self.subTest(case):
+                planned = plan_next_poll(state, self.NOW, **kwargs)
+                self.assertEqual(planned['interval'], interval)
+                self.assertEqual(planned['reason'], reason)
+                self.assertEqual(planned['next_at'], self.NOW + interval)
+
+    def test_plan_records_verdict_and_last_new_alerts(self):
+        planned = plan_next_poll({'last_new_at': self.NOW - 5000}, self.NOW, hot=True, new_alerts=1)
+        self.assertEqual((planned['hot'], planned['last_new_at'], planned['last_poll_at']), (True, self.NOW, self.NOW))
+
+        planned = plan_next_poll(planned, self.NOW + 60, hot=None)
+        self.assertEqual((planned['hot'], planned['last_new_at']), (True, self.NOW))
+
+    def test_is_due(self):
+        cases = [
+            ({}, True),
+            ({'next_at': self.NOW - 1}, True),
+            ({'next_at': self.NOW + SCHEDULE_SLACK}, True),
+            ({'next_at': self.NOW + SCHEDULE_SLACK + 1}, False),
+            ({'next_at': self.NOW + 600}, False),
+        ]
+        for state, due in cases:
+            with self.subTest(state=state):
+                self.assertEqual(is_due(state, self.NOW), due)
@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import AlertListView, AlertDetailView
+from .views import AlertListView, AlertDetailView, AlertFeedStatsView
 
 app_name = 'alerts'
 
 urlpatterns = [
     path('', AlertListView.as_view(), name='alert-list'),
+    path('feed/stats/', AlertFeedStatsView.as_view(), name='alert-feed-stats'),
     path('<uuid:alert_id>/', AlertDetailView.as_view(), name='alert-detail'),
 ]
\ No newline at end of file
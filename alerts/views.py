@@ -1,10 +1,11 @@
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.core.paginator import Paginator
 from django.core.exceptions import ValidationError
 from .models import Alert
+from .nws import feed_stats
 from .serializers import AlertSerializer
 import logging
 from drf_spectacular.utils import extend_schema
@@ -138,3 +139,14 @@ class AlertDetailView(APIView):
                 {'error': 'Internal server error'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class AlertFeedStatsView(APIView):
+    """
+    API View with NWS feed polling statistics, including fetches answered with 304 Not Modified
+    Only staff users can access this endpoint
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(feed_stats())
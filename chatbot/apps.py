@@ -8,4 +8,7 @@ class ChatbotConfig(AppConfig):
 
     def ready(self):
         # Import signals here to ensure they are registered
-        pass
\ No newline at end of file
+        import chatbot.signals
+        # Load the tokenizer up front so no chat request waits on it
+        from .utils.tokens import load_encoding
+        load_encoding()
\ No newline at end of file
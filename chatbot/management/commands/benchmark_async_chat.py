@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chatbot.management.fake_llm import FakeCompletionsServer
+from chatbot.utils.pipeline import HopePipeline
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync chat pipeline on a fixed pool of worker threads with the async "
+        "pipeline on one event loop, against a local fake completions server"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--delay', type=float, default=0.5, help="fake model latency in seconds")
+        parser.add_argument('--threads', type=int, default=8, help="sync worker threads, as in a WSGI worker")
+
+    def run_sync(self, messages, threads):
+        def chat(message):
+            return HopePipeline(api_key=settings.OPENAI_API_KEY).run(message, '', None, [])
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(chat, messages))
+
+    async def run_async(self, messages):
+        return await asyncio.gather(*[
+            HopePipeline(api_key=settings.OPENAI_API_KEY).arun(message, '', None, []) for message in messages
+        ])
+
+    def report(self, label, server, elapsed, count):
+        self.stdout.write(
+            f"  {label:<28} {elapsed:7.2f} s  {count / elapsed:8.1f} req/s  "
+            f"max in flight {server.max_in_flight:4}  connections {server.connections}"
+        )
+
+    def handle(self, *args, **options):
+        logging.disable(logging.INFO)
+        count, delay, threads = options['requests'], options['delay'], options['threads']
+        # Distinct messages, so neither the answer cache nor single-flight can merge requests
+        messages = [f"I need food near stop {number}" for number in range(count)]
+        self.stdout.write(f"{count} requests, fake model latency {delay * 1000:.0f} ms")
+
+        with override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            CHATBOT_LLM_BACKEND='chatbot.utils.llm_backends.OpenAIBackend',
+            CHATBOT_LLM_MAX_CONNECTIONS=max(count, 100),
+        ):
+            for label, run in [
+                (f"sync, {threads} threads", lambda: self.run_sync(messages, threads)),
+                ("async, one event loop", lambda: asyncio.run(self.run_async(messages))),
+            ]:
+                cache.clear()  # answers cached by the previous run would skip the model
+                server = FakeCompletionsServer(delay=delay).start()
+                api_base, openai.api_base = openai.api_base, server.url
+                try:
+                    start = time.perf_counter()
+                    run()
+                    self.report(label, server, time.perf_counter() - start, count)
+                finally:
+                    openai.api_base = api_base
+                    server.stop()
@@ -0,0 +1,77 @@
+import random
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from chatbot.utils.file_uploder import KEYWORDS, file_uploder
+from chatbot.utils.keyword_index import KeywordIndex
+from chatbot.utils.ranking import BM25Ranker
+
+SERVICE_TYPES = [
+    "food pantry", "meal service", "emergency shelter", "family support", "mental health treatment",
+    "medical clinic", "hygiene center", "cooling station", "transitional housing", "legal aid",
+]
+CATEGORIES = ["Food", "Housing", "Medical", "Education", "Support Services", "Abuse", "Employment"]
+QUERIES = [["food"], ["shelter", "housing"], ["medical", "mental", "treatment"], ["dental"]]
+RANK_QUERIES = ["I am hungry, where can I get a meal food meal", "need a family shelter tonight shelter family"]
+
+
+def synthetic_catalog(rows, seed=0):
+    """Resource CSV with the production columns and a realistic spread of services"""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'Provider': [f"Provider {i}" for i in range(rows)],
+        'Category_New': [rng.choice(CATEGORIES) for _ in range(rows)],
+        'Service_Type': [rng.choice(SERVICE_TYPES) if rng.random() > 0.02 else None for _ in range(rows)],
+        'Address': [f"{i} Main St, Las Vegas, NV 89{100 + i % 50}" for i in range(rows)],
+    })
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Time catalog keyword lookups and BM25 ranking on synthetic resource CSVs of increasing size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        for rows in options['rows']:
+            df = synthetic_catalog(rows)
+            self.stdout.write(f"{rows} rows")
+
+            start = time.perf_counter()
+            index = KeywordIndex(df, vocabulary=KEYWORDS)
+            self.stdout.write(f"  keyword index build      {(time.perf_counter() - start) * 1000:9.2f} ms")
+
+            for keywords in QUERIES:
+                index.lookup(keywords)  # out-of-vocabulary keywords are scanned once, then memoized
+                scan = best_of(lambda: file_uploder.filter_by_keywords(df, keywords), repeat)
+                lookup = best_of(lambda: df.iloc[index.lookup(keywords)], repeat)
+                self.stdout.write(
+                    f"  {'+'.join(keywords):<24} regex scan {scan * 1000:8.2f} ms"
+                    f"   index {lookup * 1000:8.3f} ms   x{scan / lookup:,.0f}"
+                )
+
+            start = time.perf_counter()
+            ranker = BM25Ranker(df)
+            self.stdout.write(f"  bm25 build               {(time.perf_counter() - start) * 1000:9.2f} ms")
+
+            for query in RANK_QUERIES:
+                full = best_of(lambda: ranker.rank(query, k=25), repeat)
+                matched = index.lookup(QUERIES[1])
+                subset = best_of(lambda: ranker.rank(query, matched, k=25), repeat)
+                self.stdout.write(
+                    f"  bm25 top-25 {query[:20]!r:<24} all rows {full * 1000:8.3f} ms"
+                    f"   {len(matched)} matches {subset * 1000:8.3f} ms"
+                )
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import threading
+
+
+class FakeCompletionsServer:
+    """
+    Local stand-in for the OpenAI chat completions endpoint, for tests and benchmarks.
+    Every request is answered after `delay` seconds with an OpenAI-shaped reply; the
+    server records how many requests were in flight at once and how many connections
+    clients opened, so connection pooling and concurrency can be checked.
+
+    Use `async with` inside a running event loop, or start()/stop() to run it on a
+    background thread for synchronous callers.
+    """
+
+    def __init__(self, delay=0.2, reply="Here are a few places nearby that may be able to help."):
+        self.delay = delay
+        self.reply = reply
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.url = None
+        self._server = None
+        self._handlers = set()
+        self._loop = None
+        self._thread = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.url = f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}/v1"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        # Pooled clients keep their connections open; end the idle keep-alive handlers
+        for handler in list(self._handlers):
+            handler.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def start(self):
+        """Serve on a background thread; returns once the server is listening"""
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.__aenter__())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.__aexit__(None, None, None))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name='fake-llm', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            # Keep-alive: serve requests on this connection until the client closes it
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode('latin-1').split("\r\n")[1:]:
+                    name, _, value = line.partition(":")
+                    if name.strip().lower() == 'content-length':
+                        length = int(value)
+                body = json.loads(await reader.readexactly(length) or b'{}')
+                await self._respond(writer, body)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(handler)
+            writer.close()
+
+    async def _respond(self, writer, body):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+
+        payload = json.dumps({
+            'id': f"chatcmpl-fake-{self.requests}",
+            'object': 'chat.completion',
+            'model': body.get('model', 'fake'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': self.reply},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        }).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: keep-alive\r\n"
+            + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
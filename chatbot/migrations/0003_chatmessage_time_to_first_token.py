@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_delete_chatfeedback'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='time_to_first_token',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def backfill_session_counters(apps, schema_editor):
+    ChatSession = apps.get_model('chatbot', 'ChatSession')
+    ChatMessage = apps.get_model('chatbot', 'ChatMessage')
+
+    last_message = ChatMessage.objects.filter(session=OuterRef('pk')).order_by('-timestamp')
+    sessions = ChatSession.objects.order_by('pk').annotate(
+        total_messages=Count('messages'),
+        last_content=Subquery(last_message.values('content')[:1]),
+        last_role=Subquery(last_message.values('role')[:1]),
+        last_timestamp=Subquery(last_message.values('timestamp')[:1]),
+    )
+
+    # Walk sessions by primary key so each batch is a bounded query and a bounded update
+    last_pk = None
+    while True:
+        batch_qs = sessions if last_pk is None else sessions.filter(pk__gt=last_pk)
+        batch = list(batch_qs[:BACKFILL_BATCH_SIZE])
+        if not batch:
+            break
+
+        for session in batch:
+            content = session.last_content or ''
+            session.message_count = session.total_messages
+            session.last_message_preview = (content[:100] + '...') if len(content) > 100 else content
+            session.last_message_role = session.last_role or ''
+            session.last_message_at = session.last_timestamp
+
+        ChatSession.objects.bulk_update(
+            batch,
+            ['message_count', 'last_message_preview', 'last_message_role', 'last_message_at'],
+            batch_size=BACKFILL_BATCH_SIZE
+        )
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_chatsession_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=103),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_role',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_session_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_chatsession_message_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerCacheState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enabled', models.BooleanField(default=True)),
+                ('generation', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Answer Cache State',
+            },
+        ),
+    ]
@@ -26,6 +26,23 @@ class CSVFile(models.Model):
         return f"{self.name} - {'Active' if self.is_active else 'Inactive'}"
 
 
+class AnswerCacheState(models.Model):
+    """
+    Single row holding the answer cache switch and key generation. Kept in the
+    database so Redis evicting its copy can never re-enable a disabled cache or
+    roll back an invalidation.
+    """
+    enabled = models.BooleanField(default=True)
+    generation = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Answer Cache State'
+
+    def __str__(self):
+        return f"Answer cache {'enabled' if self.enabled else 'disabled'} (generation {self.generation})"
+
+
 class ChatSession(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(
@@ -42,6 +59,16 @@ class ChatSession(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    # Rolling summary of the turns that have scrolled out of the history window
+    summary = models.TextField(blank=True, default='')
+    summary_message_count = models.PositiveIntegerField(default=0)  # Messages folded into summary
+
+    # Denormalized from messages so session listings need no per-session queries
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_preview = models.CharField(max_length=103, blank=True, default='')
+    last_message_role = models.CharField(max_length=20, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         ordering = ['-updated_at']
         indexes = [
@@ -54,12 +81,20 @@ class ChatSession(models.Model):
             return f"Session by {self.user.email} - {self.title or 'Untitled'}"
         return f"Anonymous Session - {self.title or 'Untitled'}"
 
+    @staticmethod
+    def make_title(content):
+        return (content[:50] + '...') if len(content) > 50 else content
+
+    @staticmethod
+    def make_preview(content):
+        return (content[:100] + '...') if len(content) > 100 else content
+
     def save(self, *args, **kwargs):
-        # Auto-generate title from first message if not provided
-        if not self.title and self.messages.exists():
+        # Auto-generate title from first message if not provided; new sessions have no messages yet
+        if not self.title and not self._state.adding:
             first_message = self.messages.filter(role='user').first()
             if first_message:
-                self.title = (first_message.content[:50] + '...') if len(first_message.content) > 50 else first_message.content
+                self.title = self.make_title(first_message.content)
         super().save(*args, **kwargs)
 
 
@@ -84,6 +119,7 @@ class ChatMessage(models.Model):
     
     # Metadata for tracking
     response_time = models.FloatField(null=True, blank=True)  # Response time in seconds
+    time_to_first_token = models.FloatField(null=True, blank=True)  # Seconds until the first streamed token
     context_used = models.BooleanField(default=False)  # Whether CSV context was used
 
     class Meta:
@@ -35,35 +35,39 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         model = ChatMessage
         fields = [
             'id', 'role', 'content', 'location', 'keywords', 
-            'timestamp', 'context_used', 'response_time'
+            'timestamp', 'context_used', 'response_time', 'time_to_first_token'
         ]
         read_only_fields = [
-            'id', 'timestamp', 'keywords', 'context_used', 'response_time'
+            'id', 'timestamp', 'keywords', 'context_used', 'response_time', 'time_to_first_token'
         ]
 
 
 class ChatSessionSerializer(serializers.ModelSerializer):
-    messages = ChatMessageSerializer(many=True, read_only=True)
-    message_count = serializers.SerializerMethodField()
+    # The page of messages (and the link to the next one) is chosen by the view and passed in context
+    messages = serializers.SerializerMethodField()
+    next_messages = serializers.SerializerMethodField()
     user_email = serializers.CharField(source='user.email', read_only=True)
 
     class Meta:
         model = ChatSession
         fields = [
             'id', 'title', 'user_email', 'session_key', 'created_at', 
-            'updated_at', 'is_active', 'message_count', 'messages'
+            'updated_at', 'is_active', 'message_count', 'messages', 'next_messages'
         ]
         read_only_fields = [
             'id', 'created_at', 'updated_at', 'user_email', 'message_count'
         ]
 
-    @extend_schema_field(serializers.IntegerField())
-    def get_message_count(self, obj):
-        return obj.messages.count()
+    @extend_schema_field(ChatMessageSerializer(many=True))
+    def get_messages(self, obj):
+        return ChatMessageSerializer(self.context.get('messages', []), many=True).data
+
+    @extend_schema_field(serializers.URLField(allow_null=True))
+    def get_next_messages(self, obj):
+        return self.context.get('next_messages')
 
 
 class ChatSessionListSerializer(serializers.ModelSerializer):
-    message_count = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
     user_email = serializers.CharField(source='user.email', read_only=True)
 
@@ -73,19 +77,15 @@ class ChatSessionListSerializer(serializers.ModelSerializer):
             'id', 'title', 'user_email', 'created_at', 'updated_at', 
             'is_active', 'message_count', 'last_message'
         ]
-
-    @extend_schema_field(serializers.IntegerField())
-    def get_message_count(self, obj):
-        return obj.messages.count()
+        read_only_fields = ['message_count']
 
     @extend_schema_field(serializers.CharField(allow_null=True))
     def get_last_message(self, obj):
-        last_msg = obj.messages.last()
-        if last_msg:
+        if obj.last_message_at:
             return {
-                'content': (last_msg.content[:100] + '...') if len(last_msg.content) > 100 else last_msg.content,
-                'role': last_msg.role,
-                'timestamp': last_msg.timestamp
+                'content': obj.last_message_preview,
+                'role': obj.last_message_role,
+                'timestamp': obj.last_message_at
             }
         return None
 
@@ -94,6 +94,8 @@ class ChatRequestSerializer(serializers.Serializer):
     message = serializers.CharField(max_length=5000)
     location = serializers.CharField(max_length=500, required=False, allow_blank=True)
     session_id = serializers.UUIDField(required=False)
+    # 'job' queues the turn on Celery and returns a job id to poll instead of the reply
+    mode = serializers.ChoiceField(choices=['sync', 'job'], required=False, default='sync')
 
     def validate_message(self, value):
         if not value.strip():
@@ -115,4 +117,9 @@ class SessionStatsSerializer(serializers.Serializer):
     total_messages = serializers.IntegerField()
     average_messages_per_session = serializers.FloatField()
     user_sessions = serializers.IntegerField()
-    anonymous_sessions = serializers.IntegerField()
\ No newline at end of file
+    anonymous_sessions = serializers.IntegerField()
+
+
+class AnswerCacheSettingsSerializer(serializers.Serializer):
+    enabled = serializers.BooleanField(required=False)
+    clear = serializers.BooleanField(required=False, default=False)
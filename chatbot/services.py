@@ -0,0 +1,158 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import ChatSession, ChatMessage
+from .utils.context_cache import context_cache
+from .utils.tokens import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+# Set while a summary refresh is queued for a session, so turns do not queue duplicates
+SUMMARY_PENDING_KEY = "chatbot:summary_pending:{}"
+SUMMARY_PENDING_TIMEOUT = 300  # seconds
+
+
+class ChatService:
+    """
+    Session, history and persistence helpers shared by the chat endpoints
+    """
+
+    @staticmethod
+    def get_session_key(request):
+        """Get or generate the Django session key used for anonymous users"""
+        session_key = request.session.session_key
+        if not session_key:
+            request.session.create()
+            session_key = request.session.session_key
+        return session_key
+
+    @staticmethod
+    def get_or_create_session(user, session_id, session_key, first_message=None):
+        """Get existing session or create new one, titled after its first message"""
+        if session_id:
+            try:
+                if user and user.is_authenticated:
+                    session = ChatSession.objects.get(id=session_id, user=user)
+                else:
+                    session = ChatSession.objects.get(id=session_id)
+                return session
+            except ChatSession.DoesNotExist:
+                pass
+
+        # Create new session
+        session_data = {'is_active': True}
+        if first_message:
+            session_data['title'] = ChatSession.make_title(first_message)
+        if user and user.is_authenticated:
+            session_data['user'] = user
+        else:
+            session_data['session_key'] = session_key
+
+        return ChatSession.objects.create(**session_data)
+
+    @staticmethod
+    def build_history(session):
+        """
+        Build conversation history for the pipeline: the rolling summary of older turns
+        followed by the last CHATBOT_HISTORY_WINDOW messages, trimmed from the oldest
+        message to fit CHATBOT_HISTORY_TOKEN_BUDGET. The window is read from the context
+        cache and only falls back to the database on a miss.
+        """
+        history = context_cache.get(session.id)
+        if history is None:
+            version = context_cache.version(session.id)
+            messages = (
+                session.messages.filter(role__in=['user', 'assistant'])
+                .order_by('-timestamp')
+                .values('role', 'content')[:settings.CHATBOT_HISTORY_WINDOW]
+            )
+            history = [{'role': msg['role'], 'content': msg['content']} for msg in reversed(messages)]
+            context_cache.set(session.id, history, version=version)
+
+        summary = []
+        if session.summary:
+            summary = [{'role': 'system', 'content': f"Summary of the earlier conversation:\n{session.summary}"}]
+
+        budget = settings.CHATBOT_HISTORY_TOKEN_BUDGET - count_message_tokens(summary)
+        costs = [count_message_tokens([msg]) for msg in history]
+        used = sum(costs)
+        while history and used > budget:
+            used -= costs.pop(0)
+            history.pop(0)
+
+        return summary + history
+
+    @staticmethod
+    def schedule_summary(session):
+        """
+        Queue a summary refresh once CHATBOT_SUMMARY_EVERY_TURNS turns have scrolled
+        out of the history window without being summarized
+        """
+        every = settings.CHATBOT_SUMMARY_EVERY_TURNS
+        if not every:
+            return
+
+        pending = session.message_count - settings.CHATBOT_HISTORY_WINDOW - session.summary_message_count
+        if pending < every * 2:
+            return
+
+        from .tasks import summarize_session_task
+        try:
+            if cache.add(SUMMARY_PENDING_KEY.format(session.id), 1, timeout=SUMMARY_PENDING_TIMEOUT):
+                summarize_session_task.delay(str(session.id))
+        except Exception as e:
+            logger.warning(f"Could not queue summary for session {session.id}: {e}")
+
+    @staticmethod
+    def save_turn(session, user_message, response, location, keywords, context_used,
+                  response_time, time_to_first_token=None):
+        """Persist the user message and assistant reply of one chat turn in a single transaction"""
+        user_msg = ChatMessage(
+            session=session,
+            role='user',
+            content=user_message,
+            location=location,
+            keywords=keywords,
+            context_used=context_used
+        )
+        assistant_msg = ChatMessage(
+            session=session,
+            role='assistant',
+            content=response,
+            keywords=keywords,
+            context_used=context_used,
+            response_time=response_time,
+            time_to_first_token=time_to_first_token
+        )
+
+        with transaction.atomic():
+            ChatMessage.objects.bulk_create([user_msg, assistant_msg])
+
+            session_fields = {
+                'updated_at': timezone.now(),
+                'last_message_preview': ChatSession.make_preview(response),
+                'last_message_role': assistant_msg.role,
+                'last_message_at': assistant_msg.timestamp,
+            }
+            if not session.title:
+                session_fields['title'] = ChatSession.make_title(user_message)
+
+            # Update session timestamp and counters without re-saving the whole row
+            ChatSession.objects.filter(id=session.id).update(
+                message_count=F('message_count') + 2, **session_fields
+            )
+
+        for field, value in session_fields.items():
+            setattr(session, field, value)
+        session.message_count += 2
+
+        # Write through to the hot context window once the turn is in the database
+        context_cache.append(session.id, [
+            {'role': 'user', 'content': user_message},
+            {'role': 'assistant', 'content': response}
+        ])
+
+        ChatService.schedule_summary(session)
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import CSVFile, ChatSession
+from .utils.catalog import catalog_cache
+from .utils.context_cache import context_cache
+
+
+@receiver(post_save, sender=CSVFile)
+@receiver(post_delete, sender=CSVFile)
+def invalidate_resource_catalog(sender, instance, **kwargs):
+    """
+    Signal handler to re-check the active CSV file when one is saved or deleted
+    """
+    catalog_cache.invalidate()
+
+
+@receiver(post_save, sender=ChatSession)
+@receiver(post_delete, sender=ChatSession)
+def invalidate_session_context(sender, instance, **kwargs):
+    """
+    Signal handler to drop the cached message window of a deleted chat session,
+    including sessions soft-deleted by setting is_active=False
+    """
+    if kwargs['signal'] is post_delete or not instance.is_active:
+        context_cache.invalidate(instance.id)
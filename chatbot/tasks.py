@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from celery import shared_task, current_app
+from django.conf import settings
+from django.core.cache import cache
+from kombu.exceptions import ChannelError
+from .models import ChatSession
+from .services import ChatService, SUMMARY_PENDING_KEY
+from .utils.catalog import catalog_cache
+from .utils.file_uploder import file_uploder
+from .utils.pipeline import HopePipeline
+from .utils.prompt import OpenAIConfig
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MAX_BATCH = 40  # messages folded into the summary per run
+
+
+# Last queue depth read from the broker, reused for CHATBOT_JOB_DEPTH_CACHE_SECONDS
+_queue_depth = {'value': None, 'expires': 0.0}
+_queue_depth_lock = threading.Lock()
+
+
+def read_chat_queue_depth():
+    """
+    Number of chat jobs waiting on the broker queue, or None if it cannot be read
+    """
+    try:
+        with current_app.pool.acquire(block=True) as connection, connection.channel() as channel:
+            declared = channel.queue_declare(queue=settings.CHATBOT_JOB_QUEUE, passive=True)
+            return declared.message_count
+    except ChannelError:
+        # The Redis transport drops the queue key once the queue is empty
+        return 0
+    except Exception as e:
+        logger.warning(f"Could not read chat queue depth: {str(e)}")
+        return None
+
+
+def chat_queue_depth():
+    """
+    Chat queue depth, read from the broker at most once per CHATBOT_JOB_DEPTH_CACHE_SECONDS
+    """
+    if time.monotonic() < _queue_depth['expires']:
+        return _queue_depth['value']
+
+    with _queue_depth_lock:
+        if time.monotonic() >= _queue_depth['expires']:
+            _queue_depth['value'] = read_chat_queue_depth()
+            _queue_depth['expires'] = time.monotonic() + settings.CHATBOT_JOB_DEPTH_CACHE_SECONDS
+        return _queue_depth['value']
+
+
+class ChatQueueFull(Exception):
+    """Raised instead of queueing a chat job while CHATBOT_JOB_MAX_QUEUE_DEPTH jobs are waiting"""
+
+
+def enqueue_chat_job(session, user_message, location, keywords):
+    """Queue one chat turn on the chat queue, refusing when the backlog is too deep"""
+    depth = chat_queue_depth()
+    if depth is not None and depth >= settings.CHATBOT_JOB_MAX_QUEUE_DEPTH:
+        raise ChatQueueFull(f"{depth} chat jobs waiting")
+
+    return process_chat_message_task.apply_async(
+        args=[str(session.id), user_message, location, keywords],
+        queue=settings.CHATBOT_JOB_QUEUE
+    )
+
+
+@shared_task(bind=True, track_started=True)
+def process_chat_message_task(self, session_id, user_message, location='', keywords=None):
+    """
+    Celery task to run one chat turn through HopePipeline off the web worker.
+    Routed to the CHATBOT_JOB_QUEUE queue; the result is polled via ChatJobView.
+    """
+    session = ChatSession.objects.get(id=session_id)
+    if keywords is None:
+        keywords = file_uploder.extract_keywords(user_message)
+    history = ChatService.build_history(session)
+    catalog = catalog_cache.get()
+    csv_data = catalog.data if catalog is not None else None
+
+    start_time = time.time()
+
+    response = HopePipeline(api_key=settings.OPENAI_API_KEY).run(
+        user_input=user_message,
+        location=location,
+        csv_data=csv_data,
+        history=history,
+        catalog=catalog,
+        keywords=keywords
+    )
+
+    response_time = time.time() - start_time
+    context_used = bool(csv_data is not None and keywords)
+
+    ChatService.save_turn(
+        session=session,
+        user_message=user_message,
+        response=response,
+        location=location,
+        keywords=keywords,
+        context_used=context_used,
+        response_time=response_time
+    )
+
+    logger.info(f"Chat job {self.request.id} completed in {response_time:.2f}s")
+    return {
+        'response': response,
+        'session_id': str(session.id),
+        'keywords': keywords,
+        'context_used': context_used,
+        'response_time': round(response_time, 2),
+        'user_id': str(session.user_id) if session.user_id else None,
+        'session_key': session.session_key
+    }
+
+
+@shared_task
+def summarize_session_task(session_id):
+    """
+    Fold the messages that have scrolled out of the history window into the
+    session's rolling summary. Only messages older than the window are folded, so
+    the summary and the window never overlap.
+    """
+    try:
+        session = ChatSession.objects.get(id=session_id)
+        start = session.summary_message_count
+        messages = session.messages.filter(role__in=['user', 'assistant']).order_by('timestamp')
+        end = min(messages.count() - settings.CHATBOT_HISTORY_WINDOW, start + SUMMARY_MAX_BATCH)
+        if end <= start:
+            return 0
+
+        batch = list(messages.values('role', 'content')[start:end])
+        summary = OpenAIConfig(api_key=settings.OPENAI_API_KEY).summarize(session.summary, batch)
+        if summary is None:
+            return 0
+
+        # Conditional update: a concurrent run that already advanced the summary wins
+        updated = ChatSession.objects.filter(
+            id=session.id, summary_message_count=start
+        ).update(summary=summary, summary_message_count=end)
+
+        logger.info(f"Summarized {end - start} messages of session {session_id}")
+        return end - start if updated else 0
+    except ChatSession.DoesNotExist:
+        return 0
+    finally:
+        cache.delete(SUMMARY_PENDING_KEY.format(session_id))
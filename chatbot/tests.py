@@ -1,3 +1,1465 @@
-from django.test import TestCase
+import asyncio
+import base64
+import importlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from kombu.exceptions import ChannelError
+
+from django.apps import apps as django_apps
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from . import tasks
+from .management.commands.benchmark_catalog import synthetic_catalog
+from .management.fake_llm import FakeCompletionsServer
+from .models import CSVFile, ChatSession, ChatMessage
+from .services import ChatService
+from .tasks import process_chat_message_task
+from .utils import answer_cache as answer_cache_module, llm_backends, single_flight as single_flight_module, tokens
+from .utils.answer_cache import answer_cache
+from .utils.catalog import CatalogCache, ResourceCatalog
+from .utils.context_cache import context_cache
+from .utils.file_uploder import KEYWORDS, file_uploder
+from .utils.geo import GeoIndex, haversine_km, parse_location, resolve_coordinates
+from .utils.keyword_index import KeywordIndex
+from .utils.llm_backends import LLMBackendError, LLMTimeoutError, LocalLLMBackend, get_async_client
+from .utils.pipeline import HopePipeline
+from .utils.prompt import CRISIS_NOTE, FALLBACK_REPLY
+from .utils.ranking import BM25Ranker
+from .utils.resilience import CircuitBreaker, CircuitOpenError, ahedged, hedged
+from .utils.single_flight import SingleFlight
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), 'testdata')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+    CHATBOT_SUMMARY_EVERY_TURNS=0,
+)
+@mock.patch('chatbot.views.catalog_cache.get', return_value=None)
+@mock.patch('chatbot.views.HopePipeline.run', return_value="Here are some places that can help.")
+class ChatPersistenceQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('chatbot:chat')
+
+    def test_new_session_turn_query_count(self, run, catalog):
+        # session insert, history read, savepoint, bulk insert, session update, release
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, {'message': 'I need food'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        session = ChatSession.objects.get()
+        self.assertEqual(session.title, 'I need food')
+        self.assertEqual(
+            list(session.messages.order_by('timestamp').values_list('role', flat=True)),
+            ['user', 'assistant']
+        )
+
+    def test_follow_up_turn_query_count(self, run, catalog):
+        response = self.client.post(self.url, {'message': 'I need food'}, format='json')
+        session_id = response.data['data']['session_id']
+
+        # session lookup, savepoint, bulk insert, session update, release; history is cached
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                self.url, {'message': 'Anything open late?', 'session_id': session_id}, format='json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ChatMessage.objects.filter(session_id=session_id).count(), 4)
+        self.assertEqual(ChatSession.objects.get(id=session_id).title, 'I need food')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHATBOT_SUMMARY_EVERY_TURNS=0,
+    CHATBOT_JOB_MAX_QUEUE_DEPTH=10,
+    CHATBOT_JOB_RETRY_AFTER=7,
+)
+@mock.patch('chatbot.views.catalog_cache.get', return_value=None)
+@mock.patch('chatbot.tasks.catalog_cache.get', return_value=None)
+@mock.patch('chatbot.tasks.HopePipeline.run', return_value="Try the pantry on Main St.")
+class ChatJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('chatbot:chat')
+
+    def enqueue(self, client, depth=0):
+        """Queue a job, running the task eagerly in place of the worker; returns (response, result)"""
+        eager = []
+
+        def apply_async(args, queue):
+            eager.append(process_chat_message_task.apply(args=args))
+            return eager[-1]
+
+        with mock.patch('chatbot.tasks.chat_queue_depth', return_value=depth), \
+                mock.patch.object(process_chat_message_task, 'apply_async', side_effect=apply_async) as queued:
+            response = client.post(self.url, {'message': 'I need food', 'mode': 'job'}, format='json')
+        if eager:
+            self.assertEqual(queued.call_args.kwargs['queue'], 'chat')
+        return response, eager[0] if eager else None
+
+    def poll(self, client, result):
+        with mock.patch('chatbot.views.AsyncResult', return_value=result):
+            return client.get(reverse('chatbot:chat-job', args=[result.id]))
+
+    def test_job_is_queued_and_returned_to_its_session(self, run, tasks_catalog, views_catalog):
+        response, result = self.enqueue(self.client)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['data']['job_id'], result.id)
+        self.assertEqual(response.data['data']['status'], 'PENDING')
+
+        response = self.poll(self.client, result)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['status'], 'SUCCESS')
+        self.assertEqual(response.data['data']['result']['response'], "Try the pantry on Main St.")
+        self.assertNotIn('session_key', response.data['data']['result'])
+        self.assertEqual(ChatMessage.objects.count(), 2)
+
+    def test_anonymous_job_is_hidden_from_other_sessions(self, run, tasks_catalog, views_catalog):
+        _, result = self.enqueue(self.client)
+
+        self.assertEqual(self.poll(APIClient(), result).status_code, 404)
+
+    def test_user_job_is_hidden_from_other_users(self, run, tasks_catalog, views_catalog):
+        owner = CustomUser.objects.create_user('owner@example.com', password='secret')
+        other = CustomUser.objects.create_user('other@example.com', password='secret')
+        self.client.force_authenticate(owner)
+        _, result = self.enqueue(self.client)
+
+        intruder = APIClient()
+        intruder.force_authenticate(other)
+        self.assertEqual(self.poll(intruder, result).status_code, 404)
+        self.assertEqual(self.poll(self.client, result).status_code, 200)
+
+    def test_deep_queue_is_refused_with_retry_after(self, run, tasks_catalog, views_catalog):
+        response, result = self.enqueue(self.client, depth=10)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertIsNone(result)
+        run.assert_not_called()
+
+
+@override_settings(CHATBOT_JOB_DEPTH_CACHE_SECONDS=60)
+@mock.patch.dict(tasks._queue_depth, {'value': None, 'expires': 0.0})
+class ChatQueueDepthTests(TestCase):
+    def broker(self, queue_declare):
+        connection = mock.MagicMock()
+        connection.__enter__.return_value.channel.return_value.__enter__.return_value.queue_declare = queue_declare
+        return mock.patch('chatbot.tasks.current_app.pool.acquire', return_value=connection)
+
+    def test_missing_queue_key_reads_as_empty(self):
+        with self.broker(mock.Mock(side_effect=ChannelError('NOT_FOUND'))):
+            self.assertEqual(tasks.chat_queue_depth(), 0)
+
+    def test_depth_is_read_once_per_interval(self):
+        queue_declare = mock.Mock(return_value=mock.Mock(message_count=3))
+        with self.broker(queue_declare) as acquire:
+            depths = [tasks.chat_queue_depth() for _ in range(5)]
+
+        self.assertEqual(depths, [3] * 5)
+        queue_declare.assert_called_once_with(queue='chat', passive=True)
+        acquire.assert_called_once_with(block=True)
+
+    def test_unreachable_broker_reads_as_unknown(self):
+        with self.broker(mock.Mock(side_effect=OSError('connection refused'))):
+            with self.assertLogs('chatbot.tasks', 'WARNING'):
+                self.assertIsNone(tasks.chat_queue_depth())
+
+
+class FallbackAnswerTests(TestCase):
+    def setUp(self):
+        self.pipeline = HopePipeline(api_key='test')
+
+    def test_fallback_lists_top_resources_with_map_links(self):
+        resources = pd.DataFrame([
+            {'Provider': 'Shelter A', 'Service_Type': 'emergency shelter', 'Address': '1 Main St, Las Vegas, NV 89101'},
+            {'Provider': 'Pantry B', 'Service_Type': 'food pantry', 'Address': '2 Oak Ave, Reno, NV 89501'},
+        ])
+
+        answer = self.pipeline.fallback_answer({'resources': (resources, None)})
+
+        self.assertIn('1. Shelter A – emergency shelter', answer)
+        self.assertIn('https://www.google.com/maps/search/?api=1&query=1+Main+St%2C+Las+Vegas%2C+NV+89101', answer)
+        self.assertIn('https://www.google.com/maps/search/?api=1&query=2+Oak+Ave%2C+Reno%2C+NV+89501', answer)
+        self.assertTrue(answer.endswith(CRISIS_NOTE))
+
+    def test_fallback_without_resources_still_gives_crisis_note(self):
+        answer = self.pipeline.fallback_answer({'resources': (pd.DataFrame(), None)})
+
+        self.assertIn(CRISIS_NOTE, answer)
+
+
+class SessionKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('reader@example.com', password='secret')
+        for number in range(5):
+            ChatSession.objects.create(user=self.user, title=f'Session {number}')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('chatbot:session-list')
+
+    def cursor(self, payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def test_pages_cover_every_session_once(self):
+        seen, url = [], f'{self.url}?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [session['id'] for session in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(sorted(seen), sorted(str(pk) for pk in ChatSession.objects.values_list('id', flat=True)))
+
+    def test_invalid_cursors_are_not_found(self):
+        cursors = [
+            'not-base64!',
+            self.cursor(['2024-01-01T00:00:00+00:00', 'abc']),
+            self.cursor(['2024-01-01T00:00:00+00:00', 42]),
+            self.cursor(['yesterday', '6f1c1a52-9f6e-4f2a-8d35-0c1b2a3d4e5f']),
+            self.cursor({'updated_at': '2024-01-01T00:00:00+00:00'}),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+@mock.patch.dict(tokens._encodings, clear=True)
+class TokenizerLoadingTests(TestCase):
+    @mock.patch.dict('os.environ', {'TIKTOKEN_CACHE_DIR': ''})
+    @mock.patch('chatbot.utils.tokens.tiktoken.get_encoding')
+    def test_missing_cache_dir_never_downloads(self, get_encoding):
+        self.assertIsNone(tokens.get_encoding())
+        self.assertEqual(tokens.count_tokens('a' * 40), 10)
+        get_encoding.assert_not_called()
+
+    @mock.patch('chatbot.utils.tokens.bpe_file_cached', return_value=True)
+    @mock.patch('chatbot.utils.tokens.tiktoken.get_encoding')
+    def test_concurrent_first_calls_load_once(self, get_encoding, cached):
+        get_encoding.side_effect = lambda name: threading.Event().wait(0.05) or mock.Mock(name=name)
+        threads = [threading.Thread(target=tokens.get_encoding) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        get_encoding.assert_called_once_with('o200k_base')
+
+
+class KeywordIndexParityTests(TestCase):
+    def setUp(self):
+        self.df = pd.concat([
+            synthetic_catalog(500, seed=1),
+            pd.DataFrame({
+                'Provider': ['Edge A', 'Edge B', 'Edge C', 'Edge D'],
+                'Category_New': ['MENTAL Health', None, 'Dental', float('nan')],
+                'Service_Type': ['Walk-in SHELTER', 'Food-Pantry', None, 'Pantry (mobile)'],
+                'Address': ['1 A St', '2 B St', '3 C St', '4 D St'],
+            }),
+        ], ignore_index=True)
+        self.index = KeywordIndex(self.df)
+
+    def assertMatchesRegexScan(self, keywords):
+        expected = file_uploder.filter_by_keywords(self.df, keywords)
+        actual = self.df.iloc[self.index.lookup(keywords)]
+        self.assertEqual(list(actual.index), list(expected.index))
+
+    def test_lookup_matches_substring_filter(self):
+        cases = [
+            ['food'],
+            ['shelter', 'housing'],
+            ['medical', 'mental', 'treatment'],
+            ['pantry', 'food', 'meal'],
+            ['dental'],  # outside the index vocabulary
+            ['Hous', 'SUPPORT'],  # partial words and mixed case
+            ['nothing-matches-this'],
+        ]
+        for keywords in cases:
+            with self.subTest(keywords=keywords):
+                self.assertMatchesRegexScan(keywords)
+
+    def test_out_of_vocabulary_lookup_is_memoized(self):
+        first = self.index.lookup(['dental'])
+        self.assertIs(self.index.lookup(['dental']), first)
+
+
+class BM25RankingQualityTests(TestCase):
+    """Labeled queries against a small catalog; guards ranking quality against regressions"""
+    TOP_K = 3
+    MIN_HIT_RATE = 0.9
+    MIN_MRR = 0.85
+
+    @classmethod
+    def setUpTestData(cls):
+        with open(os.path.join(TESTDATA_DIR, 'ranking_queries.json')) as f:
+            labeled = json.load(f)
+        cls.catalog = pd.DataFrame(labeled['catalog'])
+        cls.queries = labeled['queries']
+        cls.ranker = BM25Ranker(cls.catalog)
+
+    def first_relevant_rank(self, query, relevant):
+        providers = list(self.catalog['Provider'].iloc[self.ranker.rank(query)])
+        return min(providers.index(provider) + 1 for provider in relevant)
+
+    def test_hit_rate_and_mrr(self):
+        ranks = [self.first_relevant_rank(q['query'], q['relevant']) for q in self.queries]
+        hit_rate = sum(rank <= self.TOP_K for rank in ranks) / len(ranks)
+        mrr = sum(1 / rank for rank in ranks) / len(ranks)
+
+        self.assertGreaterEqual(hit_rate, self.MIN_HIT_RATE)
+        self.assertGreaterEqual(mrr, self.MIN_MRR)
+
+    def test_rank_subset_keeps_file_order_for_ties(self):
+        rows = [20, 3, 7]
+        self.assertEqual(list(self.ranker.rank('zzz no match', rows)), rows)
+        self.assertEqual(list(self.ranker.rank('shelter', rows, k=1)), [3])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+    CHATBOT_LLM_BACKEND='chatbot.utils.llm_backends.OpenAIBackend',
+    CHATBOT_SUMMARY_EVERY_TURNS=0,
+    CHATBOT_LLM_MAX_CONNECTIONS=100,
+)
+@mock.patch('chatbot.views_async.catalog_cache.get', return_value=None)
+class AsyncChatViewConcurrencyTests(TestCase):
+    CONCURRENT_REQUESTS = 20
+    LLM_DELAY = 0.3
+
+    async def test_concurrent_requests_share_the_pooled_client(self, catalog):
+        async with FakeCompletionsServer(delay=self.LLM_DELAY) as server:
+            with mock.patch('openai.api_base', server.url):
+                start = time.monotonic()
+                responses = await asyncio.gather(*[
+                    self.async_client.post(
+                        reverse('chatbot:chat-async'), {'message': f'I need food near stop {number}'},
+                        content_type='application/json'
+                    )
+                    for number in range(self.CONCURRENT_REQUESTS)
+                ])
+                elapsed = time.monotonic() - start
+
+        self.assertEqual([response.status_code for response in responses], [200] * self.CONCURRENT_REQUESTS)
+        self.assertTrue(all(response.json()['data']['response'] == server.reply for response in responses))
+        self.assertEqual(server.requests, self.CONCURRENT_REQUESTS)
+        # Every model call was in flight at once; serially they would take CONCURRENT_REQUESTS * LLM_DELAY
+        self.assertEqual(server.max_in_flight, self.CONCURRENT_REQUESTS)
+        self.assertLess(elapsed, self.CONCURRENT_REQUESTS * self.LLM_DELAY / 4)
+        self.assertLessEqual(server.connections, self.CONCURRENT_REQUESTS)
+        self.assertEqual(await ChatSession.objects.acount(), self.CONCURRENT_REQUESTS)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHATBOT_JOB_MAX_QUEUE_DEPTH=10,
+)
+@mock.patch('chatbot.views_async.catalog_cache.get', return_value=None)
+class AsyncChatJobTests(TestCase):
+    async def post(self):
+        return await self.async_client.post(
+            reverse('chatbot:chat-async'), {'message': 'I need food', 'mode': 'job'}, content_type='application/json'
+        )
+
+    @mock.patch('chatbot.tasks.chat_queue_depth', return_value=0)
+    @mock.patch.object(process_chat_message_task, 'apply_async', return_value=mock.Mock(id='job-1'))
+    async def test_job_mode_is_queued(self, apply_async, depth, catalog):
+        response = await self.post()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['data']['job_id'], 'job-1')
+        self.assertEqual(apply_async.call_args.kwargs['queue'], 'chat')
+        self.assertEqual(await ChatMessage.objects.acount(), 0)
+
+    @mock.patch('chatbot.tasks.chat_queue_depth', return_value=10)
+    @mock.patch.object(process_chat_message_task, 'apply_async')
+    async def test_deep_queue_is_refused(self, apply_async, depth, catalog):
+        response = await self.post()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        apply_async.assert_not_called()
+
+
+class AsyncClientLifecycleTests(TestCase):
+    def test_pooled_client_is_closed_with_its_event_loop(self):
+        async def use_client():
+            client = get_async_client()
+            self.assertIs(get_async_client(), client)
+            return client
+
+        client = asyncio.run(use_client())
+
+        self.assertTrue(client.is_closed)
+        self.assertEqual(len(llm_backends._async_clients), 0)
+
+
+class ContextCacheConcurrencyMixin:
+    """Overlapping turns on one session must never lose messages from the cached window"""
+
+    def turn(self, number):
+        return [{'role': 'user', 'content': f'question {number}'}, {'role': 'assistant', 'content': f'answer {number}'}]
+
+    def test_concurrent_appends_keep_every_turn(self):
+        context_cache.set(self.session_id, self.turn(0))
+
+        threads = [threading.Thread(target=context_cache.append, args=(self.session_id, self.turn(n))) for n in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        cached = context_cache.get(self.session_id)
+        self.assertEqual(len(cached), 10)
+        self.assertCountEqual(cached, sum((self.turn(n) for n in range(5)), []))
+
+    def test_stale_rebuild_is_not_stored(self):
+        # A reader rebuilds the window from the database while another turn is saved
+        version = context_cache.version(self.session_id)
+        stale = self.turn(0)
+        context_cache.append(self.session_id, self.turn(1))
+        context_cache.set(self.session_id, stale, version=version)
+
+        self.assertIsNone(context_cache.get(self.session_id))
+
+        context_cache.set(self.session_id, self.turn(0) + self.turn(1), version=context_cache.version(self.session_id))
+        self.assertEqual(context_cache.get(self.session_id), self.turn(0) + self.turn(1))
+
+    def test_window_is_trimmed(self):
+        context_cache.set(self.session_id, self.turn(0))
+        for number in range(1, 10):
+            context_cache.append(self.session_id, self.turn(number))
+
+        self.assertEqual(context_cache.get(self.session_id), sum((self.turn(n) for n in range(5, 10)), []))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHATBOT_HISTORY_WINDOW=10,
+)
+class LocMemContextCacheTests(ContextCacheConcurrencyMixin, TestCase):
+    session_id = 'locmem-session'
+
+    def setUp(self):
+        cache.clear()
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+        'KEY_PREFIX': 'chatbot-tests',
+    }},
+    CHATBOT_HISTORY_WINDOW=10,
+)
+class RedisContextCacheTests(ContextCacheConcurrencyMixin, TestCase):
+    session_id = 'redis-session'
+
+    def setUp(self):
+        try:
+            caches['default']._cache.get_client(write=True).ping()
+        except Exception:
+            self.skipTest("Redis is not reachable")
+        for key in (context_cache.make_key(self.session_id), context_cache.make_version_key(self.session_id)):
+            cache.delete(key)
+
+
+class FileContextCacheTests(TestCase):
+    """Backends without an atomic append invalidate the window instead"""
+
+    def test_append_invalidates(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }}):
+            context_cache.set('file-session', [{'role': 'user', 'content': 'hi'}])
+            context_cache.append('file-session', [{'role': 'assistant', 'content': 'hello'}])
+
+            self.assertIsNone(context_cache.get('file-session'))
+
+
+@override_settings(CHATBOT_SINGLE_FLIGHT_ENABLED=True, CHATBOT_SINGLE_FLIGHT_DISTRIBUTED=False)
+class SingleFlightTests(TestCase):
+    CALLERS = 8
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def backend(self, result='answer', error=None):
+        def call():
+            self.calls += 1
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return call
+
+    def run_callers(self, fn, count=CALLERS):
+        """Call do() from count threads, releasing the leader once every follower is waiting"""
+        outcomes = [None] * count
+
+        def caller(number):
+            try:
+                outcomes[number] = self.flight.do('key', fn)
+            except Exception as e:
+                outcomes[number] = e
+
+        threads = [threading.Thread(target=caller, args=(number,)) for number in range(count)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while self.flight.followers < count - 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_concurrent_identical_calls_share_one_backend_call(self):
+        outcomes = self.run_callers(self.backend())
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(outcomes, ['answer'] * self.CALLERS)
+        self.assertEqual((self.flight.leaders, self.flight.followers), (1, self.CALLERS - 1))
+
+    def test_leader_error_reaches_every_follower(self):
+        error = ValueError('model unavailable')
+        outcomes = self.run_callers(self.backend(error=error))
+
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(outcome is error for outcome in outcomes))
+
+    @override_settings(CHATBOT_LLM_TIMEOUT=0.2)
+    def test_follower_stops_waiting_for_a_hung_leader(self):
+        leader = threading.Thread(target=self.flight.do, args=('key', self.backend('late')))
+        leader.start()
+        while not self.flight.leaders:
+            time.sleep(0.01)
+
+        start = time.monotonic()
+        self.assertEqual(self.flight.do('key', lambda: 'own call'), 'own call')
+        self.assertLess(time.monotonic() - start, 1)
+
+        self.release.set()
+        leader.join()
+
+    def test_calls_with_different_keys_are_not_merged(self):
+        self.release.set()
+        self.flight.do('a', self.backend())
+        self.flight.do('b', self.backend())
+
+        self.assertEqual(self.calls, 2)
+
+
+@override_settings(CHATBOT_SINGLE_FLIGHT_ENABLED=True)
+class AsyncSingleFlightTests(TestCase):
+    CALLERS = 8
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.calls = 0
+
+    def backend(self, result='answer', error=None, delay=0.1):
+        async def call():
+            self.calls += 1
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            return result
+        return call
+
+    async def test_concurrent_identical_awaits_share_one_backend_call(self):
+        results = await asyncio.gather(*[self.flight.ado('key', self.backend()) for _ in range(self.CALLERS)])
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['answer'] * self.CALLERS)
+
+    async def test_leader_error_reaches_every_follower(self):
+        error = ValueError('model unavailable')
+        results = await asyncio.gather(
+            *[self.flight.ado('key', self.backend(error=error)) for _ in range(self.CALLERS)], return_exceptions=True
+        )
+
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(result is error for result in results))
+
+    async def test_cancelled_leader_does_not_cancel_followers(self):
+        leader = asyncio.ensure_future(self.flight.ado('key', self.backend(delay=5)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(self.flight.ado('key', self.backend('own call', delay=0)))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        self.assertEqual(await follower, 'own call')
+        self.assertEqual(self.calls, 2)
+
+
+def distributed_caller(count_path, results):
+    """Runs in a forked process: one identical model call through a fresh SingleFlight"""
+    def call():
+        with open(count_path, 'a') as f:
+            f.write('call\n')
+        time.sleep(1)
+        return 'answer'
+
+    results.put(SingleFlight().do('key', call))
+
+
+@override_settings(CHATBOT_SINGLE_FLIGHT_ENABLED=True, CHATBOT_SINGLE_FLIGHT_DISTRIBUTED=True)
+class DistributedSingleFlightTests(TestCase):
+    PROCESSES = 4
+
+    def test_identical_calls_in_other_processes_wait_for_the_leader(self):
+        context = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }}):
+            count_path = os.path.join(location, 'calls')
+            results = context.Queue()
+            processes = [context.Process(target=distributed_caller, args=(count_path, results))]
+            processes[0].start()
+            # Start the followers once the leader holds the lock
+            deadline = time.monotonic() + 5
+            while not cache.has_key(f'{single_flight_module.KEY_PREFIX}:lock:key') and time.monotonic() < deadline:
+                time.sleep(0.01)
+            processes += [context.Process(target=distributed_caller, args=(count_path, results))
+                          for _ in range(self.PROCESSES - 1)]
+            for process in processes[1:]:
+                process.start()
+
+            answers = [results.get(timeout=10) for _ in processes]
+            for process in processes:
+                process.join()
+            with open(count_path) as f:
+                calls = f.read().splitlines()
+
+        self.assertEqual(answers, ['answer'] * self.PROCESSES)
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ModelFailureTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.pipeline = HopePipeline(api_key='test')
+
+    def test_reply_matching_the_canned_text_is_a_normal_answer(self):
+        with mock.patch.object(self.pipeline.openai, 'create_completion', return_value=FALLBACK_REPLY):
+            self.assertEqual(self.pipeline.run('hello there', '', None, []), FALLBACK_REPLY)
+        with mock.patch.object(self.pipeline.openai, 'create_completion') as create:
+            self.assertEqual(self.pipeline.run('hello there', '', None, []), FALLBACK_REPLY)
+        create.assert_not_called()  # served from the answer cache
+
+    def test_model_error_falls_back_and_is_not_cached(self):
+        with mock.patch.object(self.pipeline.openai, 'create_completion', side_effect=LLMBackendError('down')):
+            answer = self.pipeline.run('hello there', '', None, [])
+        self.assertIn(CRISIS_NOTE, answer)
+
+        with mock.patch.object(self.pipeline.openai, 'create_completion', return_value='Hi!') as create:
+            self.assertEqual(self.pipeline.run('hello there', '', None, []), 'Hi!')
+        create.assert_called_once()
+
+    async def test_async_model_error_falls_back(self):
+        with mock.patch.object(self.pipeline.openai, 'acreate_completion', side_effect=LLMBackendError('down')):
+            answer = await self.pipeline.arun('hello there', '', None, [])
+        self.assertIn(CRISIS_NOTE, answer)
+
+
+@override_settings(
+    CHATBOT_BREAKER_FAILURE_THRESHOLD=3, CHATBOT_BREAKER_RESET_SECONDS=30, CHATBOT_BREAKER_SLOW_CALL_SECONDS=5
+)
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('test')
+        self.now = 1000.0
+        patcher = mock.patch('chatbot.utils.resilience.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail(self):
+        def call():
+            raise LLMBackendError('down')
+        with self.assertRaises(LLMBackendError):
+            self.breaker.call(call)
+
+    def open_breaker(self):
+        for _ in range(3):
+            self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_opens_after_consecutive_failures_and_rejects_calls(self):
+        self.fail()
+        self.fail()
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')  # a success resets the count
+        self.fail()
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        backend = mock.Mock()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(backend)
+        backend.assert_not_called()
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+
+    def test_half_open_lets_one_trial_through_and_closes_on_success(self):
+        self.open_breaker()
+        self.now += 30
+
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow_request())  # the trial is still in flight
+
+        self.breaker.record(0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+
+    def test_failed_trial_opens_again(self):
+        self.open_breaker()
+        self.now += 30
+
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.times_opened, 2)
+        self.now += 29
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_slow_calls_count_as_failures(self):
+        for _ in range(3):
+            self.breaker.record(6)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+
+@override_settings(CHATBOT_LLM_HEDGE_AFTER=0.2)
+class HedgedCallTests(TestCase):
+    def setUp(self):
+        self.started = []
+        self.lock = threading.Lock()
+
+    def backend(self, delays):
+        """Call n sleeps delays[n] seconds, then answers with its number"""
+        def call():
+            with self.lock:
+                number = len(self.started)
+                self.started.append(time.monotonic())
+            time.sleep(delays[number])
+            return number
+        return call
+
+    def test_fast_reply_sends_no_hedge(self):
+        self.assertEqual(hedged(self.backend([0.05]), deadline=2), 0)
+        self.assertEqual(len(self.started), 1)
+
+    def test_hedge_fires_after_the_delay_and_wins(self):
+        start = time.monotonic()
+        self.assertEqual(hedged(self.backend([1, 0.05]), deadline=2), 1)
+
+        self.assertGreaterEqual(self.started[1] - self.started[0], 0.2)
+        self.assertLess(time.monotonic() - start, 0.6)  # did not wait for the slow first call
+
+    def test_queued_loser_is_cancelled(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        queued = Future()  # the hedge, still waiting for a free worker
+        submit = mock.Mock(side_effect=[executor.submit(self.backend([0.3])), queued])
+
+        with mock.patch('chatbot.utils.resilience.get_hedge_executor', return_value=mock.Mock(submit=submit)):
+            self.assertEqual(hedged(mock.Mock(), deadline=2), 0)
+
+        self.assertEqual(submit.call_count, 2)
+        self.assertTrue(queued.cancelled())
+
+    def test_deadline_bounds_the_wait(self):
+        with self.assertRaises(LLMTimeoutError):
+            hedged(self.backend([1, 1]), deadline=0.4)
+
+
+@override_settings(CHATBOT_LLM_HEDGE_AFTER=0.2)
+class AsyncHedgedCallTests(TestCase):
+    def setUp(self):
+        self.started = []
+        self.cancelled = []
+
+    def backend(self, delays):
+        async def call():
+            number = len(self.started)
+            self.started.append(time.monotonic())
+            try:
+                await asyncio.sleep(delays[number])
+            except asyncio.CancelledError:
+                self.cancelled.append(number)
+                raise
+            return number
+        return call
+
+    async def test_fast_reply_sends_no_hedge(self):
+        self.assertEqual(await ahedged(self.backend([0.05]), deadline=2), 0)
+        self.assertEqual(len(self.started), 1)
+
+    async def test_hedge_fires_after_the_delay_and_the_loser_is_cancelled(self):
+        self.assertEqual(await ahedged(self.backend([1, 0.05]), deadline=2), 1)
+        await asyncio.sleep(0)
+
+        self.assertGreaterEqual(self.started[1] - self.started[0], 0.2)
+        self.assertEqual(self.cancelled, [0])
+
+    async def test_deadline_cancels_both_calls(self):
+        with self.assertRaises(LLMTimeoutError):
+            await ahedged(self.backend([1, 1]), deadline=0.4)
+        await asyncio.sleep(0)
+
+        self.assertCountEqual(self.cancelled, [0, 1])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHATBOT_ANSWER_CACHE_ENABLED=True,
+)
+class AnswerCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.pipeline = HopePipeline(api_key='test')
+        patcher = mock.patch.object(self.pipeline.openai, 'create_completion', return_value='Try the pantry.')
+        self.model = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ask(self, message='Where can I get food?', history=None):
+        return self.pipeline.run(message, '', None, history if history is not None else [])
+
+    def evict_state(self):
+        """What Redis does to the state copy under allkeys-lru memory pressure"""
+        cache.delete(answer_cache_module.STATE_KEY)
+
+    def test_repeated_first_turn_is_a_hit(self):
+        self.assertEqual(self.ask(), 'Try the pantry.')
+        self.assertEqual(self.ask('where can i get FOOD'), 'Try the pantry.')
+
+        self.assertEqual(self.model.call_count, 1)
+        self.assertEqual((answer_cache.stats()['hits'], answer_cache.stats()['misses']), (1, 1))
+
+    def test_turn_with_history_bypasses_the_cache(self):
+        self.ask()
+        with mock.patch.object(answer_cache, 'get') as get:
+            self.ask(history=[{'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'hello'}])
+
+        get.assert_not_called()
+        self.assertEqual(self.model.call_count, 2)
+
+    def test_clear_moves_to_a_new_generation_that_survives_eviction(self):
+        self.ask()
+        answer_cache.clear()
+        self.evict_state()
+
+        self.ask()
+        self.assertEqual(self.model.call_count, 2)
+        self.assertEqual(answer_cache.stats()['generation'], 1)
+
+        self.evict_state()
+        self.ask()
+        self.assertEqual(self.model.call_count, 2)
+
+    def test_staff_switch_disables_the_cache_even_after_eviction(self):
+        staff = CustomUser.objects.create_user('staff@example.com', password='secret', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+
+        response = client.post(reverse('chatbot:answer-cache'), {'enabled': False}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['data']['enabled'])
+
+        self.evict_state()
+        self.ask()
+        self.ask()
+        self.assertEqual(self.model.call_count, 2)
+        self.assertFalse(answer_cache.stats()['enabled'])
+
+    def test_switch_is_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user('user@example.com', password='secret'))
+
+        response = client.post(reverse('chatbot:answer-cache'), {'enabled': False}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(answer_cache.stats()['enabled'])
+
+
+class LocationParsingTests(TestCase):
+    CENTROIDS = {'89101': (36.1727, -115.1410), '89501': (39.5261, -119.8133)}
+
+    def test_locations(self):
+        cases = [
+            ('36.17, -115.14', (36.17, -115.14)),
+            ('near 36.1699,-115.1398 by the bus stop', (36.1699, -115.1398)),
+            ('-33.86, 151.21', (-33.86, 151.21)),
+            ('-115.14, 36.17', None),  # longitude first must not parse as (15.14, 36.17)
+            ('136.17, -115.14', None),
+            ('95.5, -115.14', None),  # latitude out of range
+            ('36.17, -195.14', None),  # longitude out of range
+            ('1234.5, 36.17, -115.14', (36.17, -115.14)),
+            ('123 Main St, Las Vegas, NV 89101', self.CENTROIDS['89101']),
+            ('Reno 89501-1234', self.CENTROIDS['89501']),
+            ('36.17, -115.14 near 89501', (36.17, -115.14)),  # coordinates win over the ZIP
+            ('somewhere in 99999', None),
+            ('', None),
+        ]
+        for location, expected in cases:
+            with self.subTest(location=location):
+                self.assertEqual(parse_location(location, self.CENTROIDS), expected)
+
+
+class GeoIndexTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        size = 2000
+        self.lat = rng.uniform(35.9, 36.4, size)
+        self.lon = rng.uniform(-115.4, -114.9, size)
+        self.lat[rng.choice(size, 100, replace=False)] = np.nan
+        self.index = GeoIndex(self.lat, self.lon)
+
+    def brute_force(self, lat, lon, radius_km, candidates=None, k=None):
+        rows = np.arange(len(self.lat)) if candidates is None else np.asarray(candidates)
+        rows = rows[~np.isnan(self.lat[rows])]
+        distances = haversine_km(lat, lon, self.lat[rows], self.lon[rows])
+        order = np.argsort(distances, kind='stable')
+        order = order[distances[order] <= radius_km][:k]
+        return rows[order], distances[order]
+
+    def test_radius_queries_match_brute_force(self):
+        candidates = np.arange(0, 2000, 3)
+        for lat, lon in [(36.17, -115.14), (35.95, -115.35), (36.5, -115.14)]:
+            for radius in (0.5, 5, 20, 60):
+                for rows, k in [(None, None), (candidates, None), (None, 5)]:
+                    with self.subTest(point=(lat, lon), radius=radius, candidates=rows is not None, k=k):
+                        found, distances = self.index.query(lat, lon, radius, candidates=rows, k=k)
+                        expected, expected_distances = self.brute_force(lat, lon, radius, rows, k)
+                        np.testing.assert_array_equal(found, expected)
+                        np.testing.assert_allclose(distances, expected_distances)
+
+    def test_rows_without_coordinates_are_not_indexed(self):
+        self.assertEqual(self.index.size, 1900)
+        self.assertFalse(GeoIndex(np.array([np.nan]), np.array([np.nan])))
+
+
+@override_settings(CHATBOT_SEARCH_RADII_KM=[5, 10, 500], CHATBOT_NEAREST_K=5)
+class NearestResourceTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        centroids_path = os.path.join(self.directory.name, 'zip_centroids.csv')
+        pd.DataFrame({
+            'zip': ['89101', '89102', '89501'],
+            'latitude': [36.1727, 36.1452, 39.5261],
+            'longitude': [-115.1410, -115.1866, -119.8133],
+        }).to_csv(centroids_path, index=False)
+
+        data = pd.DataFrame({
+            'Provider': ['Downtown Pantry', 'West Pantry', 'Reno Pantry', 'Pinned Shelter', 'Unknown Place'],
+            'Service_Type': ['food pantry', 'food pantry', 'food pantry', 'emergency shelter', 'food pantry'],
+            'Address': ['1 Main St, Las Vegas, NV 89101', '2 West Ave, Las Vegas, NV 89102',
+                        '3 River Rd, Reno, NV 89501', 'no zip', 'somewhere'],
+            'Latitude': [None, None, None, 36.1750, None],
+            'Longitude': [None, None, None, -115.1370, None],
+        })
+        with override_settings(CHATBOT_ZIP_CENTROIDS_PATH=centroids_path):
+            self.catalog = ResourceCatalog('csv', 'v1', data, 0.0)
+        self.pantries = self.catalog.match_rows(['pantry'])
+
+    def providers(self, result):
+        return list(result[0]['Provider'])
+
+    def test_addresses_are_placed_by_zip_centroid_and_columns_win(self):
+        lat, lon = resolve_coordinates(self.catalog.data, self.catalog.zip_centroids)
+
+        self.assertEqual((lat[0], lon[0]), (36.1727, -115.1410))
+        self.assertEqual((lat[3], lon[3]), (36.1750, -115.1370))
+        self.assertTrue(np.isnan(lat[4]))
+
+    def test_zip_location_finds_the_nearest_matches_in_the_first_radius(self):
+        result = self.catalog.nearest(self.pantries, 'I am at 89101')
+
+        # The shelter is closer but does not match; West Pantry is just outside 5 km
+        self.assertEqual(result[1], 5)
+        self.assertEqual(self.providers(result), ['Downtown Pantry'])
+        self.assertEqual(list(result[0]['Distance_km']), [0.0])
+
+        result = self.catalog.nearest(self.pantries, 'I am at 89101', radii=[10])
+        self.assertEqual(self.providers(result), ['Downtown Pantry', 'West Pantry'])
+
+    def test_radius_widens_until_something_matches(self):
+        result = self.catalog.nearest(self.pantries, '39.40, -119.80')
+
+        self.assertEqual(result[1], 500)
+        self.assertEqual(self.providers(result)[0], 'Reno Pantry')
+
+    def test_nothing_in_any_radius_and_unplaceable_locations(self):
+        result = self.catalog.nearest(self.pantries, '40.0, -70.0')
+        self.assertTrue(result[0].empty)
+        self.assertEqual(result[1], 500)
+
+        self.assertIsNone(self.catalog.nearest(self.pantries, 'near the library'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SessionContextInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('reader@example.com', password='secret')
+        self.session = ChatSession.objects.create(user=self.user, title='Food')
+        context_cache.set(self.session.id, [{'role': 'user', 'content': 'I need food'}])
+
+    def test_soft_delete_drops_the_cached_window(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.delete(reverse('chatbot:session-delete', args=[self.session.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(context_cache.get(self.session.id))
+
+    def test_saving_an_active_session_keeps_the_cached_window(self):
+        self.session.title = 'Groceries'
+        self.session.save()
+
+        self.assertIsNotNone(context_cache.get(self.session.id))
+
+    def test_hard_delete_drops_the_cached_window(self):
+        session_id = self.session.id
+        self.session.delete()
+
+        self.assertIsNone(context_cache.get(session_id))
+
+
+class BrokenStreamBackend(LocalLLMBackend):
+    """Local backend whose stream fails after its first two tokens"""
+
+    def stream(self, model, messages, timeout=None, **kwargs):
+        tokens = super().stream(model, messages, timeout, **kwargs)
+        yield next(tokens)
+        yield next(tokens)
+        raise LLMBackendError('connection reset mid-stream')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHATBOT_LLM_BACKEND='chatbot.utils.llm_backends.LocalLLMBackend',
+    CHATBOT_LOCAL_LLM_LATENCY_MS=100,
+    CHATBOT_LOCAL_LLM_LATENCY_SIGMA=0,
+    CHATBOT_LOCAL_LLM_TOKEN_DELAY_MS=0,
+    CHATBOT_LOCAL_LLM_ERROR_RATE=0,
+    CHATBOT_SUMMARY_EVERY_TURNS=0,
+)
+@mock.patch('chatbot.views.catalog_cache.get', return_value=None)
+class ChatStreamViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def stream(self, message='Where can I get food?'):
+        response = self.client.post(reverse('chatbot:chat-stream'), {'message': message}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertTrue(body.endswith('\n\n'))
+        events = []
+        for frame in body[:-2].split('\n\n'):
+            event, data = frame.split('\n')
+            self.assertTrue(event.startswith('event: ') and data.startswith('data: '))
+            events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    def test_tokens_are_framed_and_the_turn_is_saved_once(self, catalog):
+        events = self.stream()
+
+        names = [name for name, _ in events]
+        self.assertGreater(names.count('token'), 1)
+        self.assertEqual(names[-1], 'done')
+        self.assertNotIn('error', names)
+        text = ''.join(data['token'] for name, data in events if name == 'token')
+        done = events[-1][1]
+        self.assertEqual(done['response'], text)
+
+        assistant = ChatMessage.objects.get(role='assistant')
+        self.assertEqual(assistant.content, text)
+        self.assertEqual(str(assistant.session_id), done['session_id'])
+        self.assertGreaterEqual(assistant.time_to_first_token, 0.1)
+        self.assertLessEqual(assistant.time_to_first_token, assistant.response_time)
+        self.assertEqual(done['time_to_first_token'], round(assistant.time_to_first_token, 2))
+        self.assertEqual(ChatMessage.objects.filter(role='user').count(), 1)
+
+    def test_completed_stream_is_cached(self, catalog):
+        first = self.stream()
+        with mock.patch.object(LocalLLMBackend, 'stream') as backend:
+            second = self.stream()
+
+        backend.assert_not_called()
+        self.assertEqual(second[-1][1]['response'], first[-1][1]['response'])
+
+    @override_settings(CHATBOT_LLM_BACKEND='chatbot.tests.BrokenStreamBackend')
+    def test_mid_stream_error_is_not_cached(self, catalog):
+        events = self.stream()
+        partial = events[-1][1]['response']
+        self.assertEqual([name for name, _ in events], ['token', 'token', 'done'])
+
+        with override_settings(CHATBOT_LLM_BACKEND='chatbot.utils.llm_backends.LocalLLMBackend'):
+            events = self.stream()
+        self.assertNotEqual(events[-1][1]['response'], partial)
+        self.assertGreater(len(events), 3)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHATBOT_LOCAL_LLM_LATENCY_MS=20,
+    CHATBOT_LOCAL_LLM_ERROR_RATE=0,
+    CHATBOT_SUMMARY_EVERY_TURNS=0,
+)
+@mock.patch('chatbot.views.catalog_cache.get', return_value=None)
+class LLMBackendSelectionTests(TestCase):
+    """The chat view runs on whichever backend CHATBOT_LLM_BACKEND names"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeCompletionsServer(delay=0.05).start()
+        cls.api_base_patch = mock.patch('openai.api_base', cls.server.url)
+        cls.api_base_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.api_base_patch.stop()
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.requests = 0
+
+    def chat(self, message='Where can I get food tonight?'):
+        response = APIClient().post(reverse('chatbot:chat'), {'message': message}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']['response']
+
+    @override_settings(CHATBOT_LLM_BACKEND='chatbot.utils.llm_backends.OpenAIBackend')
+    def test_openai_backend_calls_the_completions_endpoint(self, catalog):
+        self.assertEqual(self.chat(), self.server.reply)
+        self.assertEqual(self.server.requests, 1)
+
+    @override_settings(CHATBOT_LLM_BACKEND='chatbot.utils.llm_backends.LocalLLMBackend')
+    def test_local_backend_answers_without_the_provider(self, catalog):
+        reply = self.chat()
+        cache.clear()
+
+        self.assertTrue(reply.startswith("I'm here to help."))
+        self.assertEqual(self.chat(), reply)  # same request, same reply
+        self.assertEqual(self.server.requests, 0)
+
+    @override_settings(
+        CHATBOT_LLM_BACKEND='chatbot.utils.llm_backends.LocalLLMBackend', CHATBOT_LOCAL_LLM_ERROR_RATE=1
+    )
+    def test_local_backend_injected_errors_reach_the_fallback(self, catalog):
+        self.assertIn(CRISIS_NOTE, self.chat())
+        self.assertEqual(self.server.requests, 0)
+
+
+@override_settings(CHATBOT_LOCAL_LLM_LATENCY_MS=500, CHATBOT_LOCAL_LLM_LATENCY_SIGMA=0.5, CHATBOT_LOCAL_LLM_ERROR_RATE=0.1)
+class LocalLLMBackendTests(TestCase):
+    def plans(self, count=1000):
+        backend = LocalLLMBackend()
+        return [backend._plan('model', [{'role': 'user', 'content': f'request {n}'}]) for n in range(count)]
+
+    def test_latency_and_errors_follow_the_settings(self):
+        plans = self.plans()
+        latencies = sorted(latency for latency, _, _ in plans)
+
+        self.assertAlmostEqual(latencies[len(latencies) // 2], 0.5, delta=0.05)
+        self.assertGreater(latencies[int(len(latencies) * 0.99)], 1.2)  # log-normal tail
+        self.assertAlmostEqual(sum(fail for _, fail, _ in plans) / len(plans), 0.1, delta=0.03)
+
+    def test_runs_replay_exactly_for_a_seed(self):
+        first = self.plans(50)
+        self.assertEqual(self.plans(50), first)
+        with override_settings(CHATBOT_LOCAL_LLM_SEED=1):
+            self.assertNotEqual(self.plans(50), first)
+
+    @override_settings(CHATBOT_LOCAL_LLM_LATENCY_MS=10, CHATBOT_LOCAL_LLM_TOKEN_DELAY_MS=0, CHATBOT_LOCAL_LLM_ERROR_RATE=0)
+    def test_stream_yields_the_complete_reply_word_by_word(self):
+        backend = LocalLLMBackend()
+        messages = [{'role': 'user', 'content': 'Where can I shower?'}]
+
+        tokens = list(backend.stream('model', messages))
+        self.assertGreater(len(tokens), 5)
+        self.assertEqual(''.join(tokens), backend.complete('model', messages))
+
+
+def legacy_extract_keywords(text):
+    """extract_keywords before the compiled single-pass rewrite"""
+    return [kw for kw in KEYWORDS if kw.lower() in text.lower()]
+
+
+class KeywordExtractionTests(TestCase):
+    SAMPLE_MESSAGES = [
+        "I need food for my family tonight",
+        "Is there a SHELTER or housing support near downtown?",
+        "where can I find a food pantry or a warm meal",
+        "My kid needs medical treatment and mental health support",
+        "looking for education resources",
+        "I was a victim of abuse, need support",
+        "cooling center open today?",
+        "hygiene kits and showers",
+        "Supportive housing for families",
+        "hello, how are you?",
+        "",
+    ]
+
+    def test_plain_keywords_match_the_previous_extractor(self):
+        for message in self.SAMPLE_MESSAGES:
+            with self.subTest(message=message):
+                self.assertEqual(file_uploder.extract_keywords(message), legacy_extract_keywords(message))
+
+    def test_synonyms_add_categories_without_dropping_any(self):
+        cases = {
+            "I'm so hungry": ['food', 'meal', 'pantry'],
+            "I need a doctor": ['medical', 'treatment'],
+            "I feel unsafe at home": ['shelter', 'support', 'abuse', 'housing'],
+            "where can my kids go to school": ['education', 'family'],
+            "it's too HOT outside, need a shower": ['cooling', 'hygiene'],
+            "looking for clinics that help with eating": ['food', 'medical', 'meal'],
+        }
+        for message, expected in cases.items():
+            with self.subTest(message=message):
+                keywords = file_uploder.extract_keywords(message)
+                self.assertCountEqual(keywords, expected)
+                self.assertTrue(set(legacy_extract_keywords(message)) <= set(keywords))
+
+    def test_synonyms_only_match_whole_words(self):
+        # Stop words and ordinary words that merely contain a synonym add nothing
+        for message in ["the hotel is great", "a photo of the weather", "homework is due", "the heat is on"]:
+            with self.subTest(message=message):
+                self.assertEqual(file_uploder.extract_keywords(message), [])
+
+    def test_keywords_are_deduplicated_in_keyword_order(self):
+        keywords = file_uploder.extract_keywords("PANTRY food? Food! hungry, meal meals, food pantry")
+
+        self.assertEqual(keywords, ['food', 'meal', 'pantry'])
+        self.assertEqual(keywords, [kw for kw in KEYWORDS if kw in keywords])
+
+
+def legacy_chunk_dataframe(df, max_chars):
+    """chunk_dataframe before vectorized rendering: one iterrows() pass"""
+    chunks = []
+    header = "| " + " | ".join(df.columns) + " |\n"
+    divider = "| " + " | ".join(["---"] * len(df.columns)) + " |\n"
+    current_chunk = header + divider
+
+    for _, row in df.iterrows():
+        row_str = "| " + " | ".join(str(cell) for cell in row) + " |\n"
+        if len(current_chunk) + len(row_str) > max_chars:
+            chunks.append(current_chunk)
+            current_chunk = header + divider + row_str
+        else:
+            current_chunk += row_str
+
+    if current_chunk.strip() != header.strip() + divider.strip():
+        chunks.append(current_chunk)
+
+    return chunks
+
+
+class ResourceChunkRenderingTests(TestCase):
+    def setUp(self):
+        df = file_uploder.preprocess_csv(synthetic_catalog(300, seed=3))
+        df.loc[df.index[::7], 'Category_New'] = float('nan')
+        df.loc[df.index[::11], 'Address'] = None
+        df['Beds'] = [float('nan') if n % 5 == 0 else n for n in range(len(df))]
+        self.df = df
+
+    def test_rows_render_like_iterrows(self):
+        rendered = list(file_uploder.render_rows(self.df))
+        expected = ["| " + " | ".join(str(cell) for cell in row) + " |\n" for _, row in self.df.iterrows()]
+
+        self.assertEqual(rendered, expected)
+        self.assertIn('| nan |', ''.join(rendered))
+
+    def test_chunks_match_the_row_by_row_rendering(self):
+        header = file_uploder.table_header(self.df)
+        for max_chars in (300, 1000, 3000, 100000):
+            for block_rows in (1, 7, 64, 1000):
+                with self.subTest(max_chars=max_chars, block_rows=block_rows):
+                    chunks = list(file_uploder.iter_chunks(self.df, max_chars, block_rows))
+                    # The old loop also emitted a header-only chunk when the first row did not fit
+                    expected = [chunk for chunk in legacy_chunk_dataframe(self.df, max_chars) if chunk != header]
+                    self.assertEqual(chunks, expected)
+                    self.assertEqual(file_uploder.chunk_dataframe(self.df, max_chars), expected)
+
+    def test_empty_frames_have_no_chunks(self):
+        empty = self.df.iloc[0:0]
+
+        self.assertEqual(list(file_uploder.render_rows(empty)), [])
+        self.assertEqual(list(file_uploder.iter_chunks(empty)), [])
+        self.assertEqual(file_uploder.chunk_dataframe(empty), [])
+        # The old emptiness check never matched, so it returned a lone header chunk
+        self.assertEqual(legacy_chunk_dataframe(empty, 3000), [file_uploder.table_header(empty)])
+
+    def test_chunks_are_rendered_lazily(self):
+        with mock.patch.object(file_uploder, 'render_rows', wraps=file_uploder.render_rows) as render_rows:
+            next(file_uploder.iter_chunks(self.df, max_chars=3000, block_rows=10))
+
+        self.assertLess(render_rows.call_count, len(self.df) / 10)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHATBOT_SUMMARY_EVERY_TURNS=0,
+)
+class SessionCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.session = ChatSession.objects.create(title='Food')
+
+    def save_turn(self, question, answer):
+        ChatService.save_turn(
+            session=self.session, user_message=question, response=answer, location='',
+            keywords=[], context_used=False, response_time=0.1
+        )
+
+    def test_each_turn_updates_the_counters(self):
+        for number in range(1, 4):
+            self.save_turn(f'question {number}', f'answer {number}' + 'x' * 120 * (number == 3))
+
+            stored = ChatSession.objects.get(id=self.session.id)
+            last = stored.messages.order_by('-timestamp', '-role').first()
+            with self.subTest(turn=number):
+                self.assertEqual(stored.message_count, 2 * number)
+                self.assertEqual(stored.message_count, stored.messages.count())
+                self.assertEqual(stored.last_message_at, last.timestamp)
+                self.assertEqual(stored.last_message_role, 'assistant')
+                self.assertEqual(stored.last_message_preview, ChatSession.make_preview(last.content))
+                self.assertEqual(self.session.message_count, stored.message_count)
+
+        self.assertTrue(stored.last_message_preview.endswith('...'))
+
+    def test_backfill_matches_the_messages(self):
+        backfill = importlib.import_module('chatbot.migrations.0005_chatsession_message_counters')
+        start = timezone.now() - timedelta(days=1)
+        sessions = [self.session] + [ChatSession.objects.create(title=f'Session {n}') for n in range(4)]
+        for count, session in enumerate(sessions):
+            for number in range(count):
+                message = ChatMessage.objects.create(
+                    session=session, role='user' if number % 2 == 0 else 'assistant',
+                    content=f'message {number} ' + 'y' * 150 * (number == count - 1)
+                )
+                ChatMessage.objects.filter(id=message.id).update(timestamp=start + timedelta(minutes=number))
+        ChatSession.objects.update(message_count=0, last_message_preview='', last_message_role='', last_message_at=None)
+
+        with mock.patch.object(backfill, 'BACKFILL_BATCH_SIZE', 2):
+            backfill.backfill_session_counters(django_apps, None)
+
+        for count, session in enumerate(sessions):
+            session.refresh_from_db()
+            with self.subTest(messages=count):
+                self.assertEqual(session.message_count, count)
+                if count == 0:
+                    self.assertIsNone(session.last_message_at)
+                    self.assertEqual((session.last_message_role, session.last_message_preview), ('', ''))
+                    continue
+                last = session.messages.latest('timestamp')
+                self.assertEqual(session.last_message_at, start + timedelta(minutes=count - 1))
+                self.assertEqual(session.last_message_role, last.role)
+                self.assertEqual(session.last_message_preview, ChatSession.make_preview(last.content))
+
+
+class CatalogCacheTests(TestCase):
+    CSV = "Provider,Category_New,Service_Type,Address\nPantry A,Food,food pantry,1 Main St\n"
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, CHATBOT_CATALOG_REVALIDATE_SECONDS=30)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.csv_file = CSVFile.objects.create(name='resources', file=SimpleUploadedFile('res.csv', self.CSV.encode()))
+        self.catalog_cache = CatalogCache()
+
+    def rewrite(self, csv_file, content):
+        with open(csv_file.file.path, 'w') as f:
+            f.write(content)
+
+    def test_repeated_gets_share_one_load(self):
+        catalog = self.catalog_cache.get()
+        with self.assertNumQueries(0):
+            for _ in range(4):
+                self.assertIs(self.catalog_cache.get(), catalog)
+
+        stats = self.catalog_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['loads']), (4, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.8)
+        self.assertEqual(stats['rows'], 1)
+        self.assertEqual(stats['csv_id'], str(self.csv_file.id))
+        self.assertGreater(stats['last_load_time'], 0)
+        self.assertEqual(stats['total_load_time'], stats['last_load_time'])
+
+    def test_unchanged_file_is_revalidated_without_reloading(self):
+        catalog = self.catalog_cache.get()
+        self.catalog_cache.invalidate()
+
+        with self.assertNumQueries(1):
+            self.assertIs(self.catalog_cache.get(), catalog)
+        self.assertEqual(self.catalog_cache.stats()['loads'], 1)
+
+    def test_new_revision_of_the_file_is_reloaded(self):
+        first = self.catalog_cache.get()
+        self.rewrite(self.csv_file, self.CSV + "Shelter B,Housing,emergency shelter,2 Oak Ave\n")
+
+        self.assertIs(self.catalog_cache.get(), first)  # still inside the revalidation window
+        second = self.catalog_cache.reload()
+
+        self.assertIsNot(second, first)
+        self.assertNotEqual(second.version, first.version)
+        self.assertEqual(len(second), 2)
+        stats = self.catalog_cache.stats()
+        self.assertEqual((stats['misses'], stats['loads']), (2, 2))
+        self.assertAlmostEqual(stats['total_load_time'], first.load_time + second.load_time, places=3)
+
+    def test_switching_the_active_file_reloads(self):
+        first = self.catalog_cache.get()
+        self.csv_file.is_active = False
+        self.csv_file.save()
+        other = CSVFile.objects.create(name='other', file=SimpleUploadedFile('other.csv', self.CSV.encode()))
+
+        with override_settings(CHATBOT_CATALOG_REVALIDATE_SECONDS=0):
+            catalog = self.catalog_cache.get()
+        self.assertEqual(catalog.csv_id, str(other.id))
+        self.assertIsNot(catalog, first)
+
+    def test_failed_load_keeps_the_previous_catalog(self):
+        first = self.catalog_cache.get()
+        self.rewrite(self.csv_file, self.CSV * 2)
+
+        with mock.patch('chatbot.utils.catalog.ResourceCatalog.load', side_effect=ValueError('bad csv')):
+            self.assertIs(self.catalog_cache.reload(), first)
+        self.assertEqual(self.catalog_cache.stats()['load_errors'], 1)
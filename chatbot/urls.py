@@ -1,19 +1,33 @@
 from django.urls import path
 from .views import (
     ChatView,
+    ChatStreamView,
+    ChatJobView,
     ChatSessionListView,
     ChatSessionDetailView,
+    ChatSessionMessagesView,
     ChatSessionDeleteView,
+    ReloadCSVView,
+    AnswerCacheView,
 )
+from .views_async import AsyncChatView
 
 app_name = 'chatbot'
 
 urlpatterns = [
     # Chat endpoints
     path('chat/', ChatView.as_view(), name='chat'),
+    path('chat/stream/', ChatStreamView.as_view(), name='chat-stream'),
+    path('chat/async/', AsyncChatView.as_view(), name='chat-async'),
+    path('chat/jobs/<uuid:job_id>/', ChatJobView.as_view(), name='chat-job'),
     
     # Session management (for authenticated users)
     path('sessions/', ChatSessionListView.as_view(), name='session-list'),
     path('sessions/<uuid:pk>/', ChatSessionDetailView.as_view(), name='session-detail'),
+    path('sessions/<uuid:pk>/messages/', ChatSessionMessagesView.as_view(), name='session-messages'),
     path('sessions/<uuid:pk>/delete/', ChatSessionDeleteView.as_view(), name='session-delete'),
+
+    # Resource catalog management (staff only)
+    path('csv/reload/', ReloadCSVView.as_view(), name='csv-reload'),
+    path('answer-cache/', AnswerCacheView.as_view(), name='answer-cache'),
 ]
\ No newline at end of file
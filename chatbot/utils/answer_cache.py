@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .geo import parse_location, extract_zip
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "chatbot:answer_cache"
+STATE_KEY = f"{KEY_PREFIX}:state"
+STATE_TIMEOUT = 60  # seconds a process may use the cached copy of AnswerCacheState
+HITS_KEY = f"{KEY_PREFIX}:hits"
+MISSES_KEY = f"{KEY_PREFIX}:misses"
+
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_message(text):
+    text = PUNCTUATION_PATTERN.sub("", text.lower().replace("’", "'"))
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def location_bucket(location, zip_centroids=None):
+    """Coarse location key: rounded coordinates, else the ZIP, else the normalized text"""
+    if not location:
+        return ""
+    point = parse_location(location, zip_centroids or {})
+    if point is not None:
+        precision = getattr(settings, 'CHATBOT_ANSWER_CACHE_LOCATION_PRECISION', 2)
+        return f"{round(point[0], precision)},{round(point[1], precision)}"
+    return extract_zip(location) or normalize_message(location)
+
+
+class AnswerCache:
+    """
+    Shared cache of first-turn chatbot answers in the Django cache (Redis).
+    Entries expire after CHATBOT_ANSWER_CACHE_TTL seconds; eviction under memory
+    pressure is left to Redis (maxmemory-policy allkeys-lru). Staff can switch the
+    cache off at runtime or clear it by bumping its generation; both live in the
+    AnswerCacheState row, and Redis only holds a short-lived copy of it, so an
+    evicted copy is re-read from the database rather than reset to the defaults.
+    """
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'CHATBOT_ANSWER_CACHE_ALIAS', 'default')]
+
+    def _load_state(self):
+        from chatbot.models import AnswerCacheState
+
+        # No row yet means staff never changed the defaults
+        state = AnswerCacheState.objects.filter(pk=1).values('enabled', 'generation').first()
+        return state or {'enabled': True, 'generation': 0}
+
+    def _state(self):
+        state = self.cache.get(STATE_KEY)
+        if state is None:
+            state = self._load_state()
+            self.cache.set(STATE_KEY, state, timeout=STATE_TIMEOUT)
+        return state['enabled'], state['generation']
+
+    def make_key(self, message, keywords, location, catalog_version, prompt_version, zip_centroids=None):
+        """Return the cache key for this request, or None when the cache is switched off"""
+        if not getattr(settings, 'CHATBOT_ANSWER_CACHE_ENABLED', True):
+            return None
+        try:
+            enabled, generation = self._state()
+        except Exception as e:
+            logger.warning(f"Answer cache unavailable: {e}")
+            return None
+        if not enabled:
+            return None
+
+        payload = json.dumps([
+            normalize_message(message),
+            sorted(keywords or []),
+            location_bucket(location, zip_centroids),
+            catalog_version,
+            prompt_version,
+        ])
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+        return f"{KEY_PREFIX}:{generation}:{digest}"
+
+    def _incr(self, key):
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 0, timeout=None)
+            self.cache.incr(key)
+
+    def get(self, key):
+        try:
+            answer = self.cache.get(key)
+            self._incr(HITS_KEY if answer is not None else MISSES_KEY)
+            return answer
+        except Exception as e:
+            logger.warning(f"Answer cache read failed: {e}")
+            return None
+
+    def set(self, key, answer):
+        try:
+            self.cache.set(key, answer, timeout=getattr(settings, 'CHATBOT_ANSWER_CACHE_TTL', 3600))
+        except Exception as e:
+            logger.warning(f"Answer cache write failed: {e}")
+
+    def _update_state(self, **fields):
+        from chatbot.models import AnswerCacheState
+
+        AnswerCacheState.objects.get_or_create(pk=1)
+        AnswerCacheState.objects.filter(pk=1).update(**fields)
+        # Other processes pick the change up from the database once the copy is gone
+        self.cache.delete(STATE_KEY)
+
+    def set_enabled(self, enabled):
+        self._update_state(enabled=bool(enabled))
+
+    def clear(self):
+        """Invalidate every cached answer by moving to a new key generation"""
+        self._update_state(generation=F('generation') + 1)
+
+    def stats(self):
+        enabled, generation = self._state()
+        values = self.cache.get_many([HITS_KEY, MISSES_KEY])
+        hits, misses = values.get(HITS_KEY, 0), values.get(MISSES_KEY, 0)
+        return {
+            'enabled': getattr(settings, 'CHATBOT_ANSWER_CACHE_ENABLED', True) and enabled,
+            'generation': generation,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            'ttl': getattr(settings, 'CHATBOT_ANSWER_CACHE_TTL', 3600),
+        }
+
+
+answer_cache = AnswerCache()
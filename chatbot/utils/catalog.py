@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+from django.conf import settings
+
+from .keyword_index import KeywordIndex
+from .geo import GeoIndex, load_zip_centroids, parse_location, resolve_coordinates
+from .ranking import BM25Ranker
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceCatalog:
+    """
+    Immutable snapshot of the active resource CSV.
+    One instance is shared by every request and thread until the active file changes.
+    """
+
+    def __init__(self, csv_id, version, data, load_time):
+        self.csv_id = csv_id
+        self.version = version
+        self.data = data
+        self.keyword_index = KeywordIndex(data)
+        self.zip_centroids = load_zip_centroids(getattr(settings, 'CHATBOT_ZIP_CENTROIDS_PATH', ''))
+        self.geo_index = GeoIndex(*resolve_coordinates(data, self.zip_centroids))
+        self.ranker = BM25Ranker(data)
+        self.load_time = load_time
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, csv_id, version, path):
+        start_time = time.perf_counter()
+        catalog = cls(csv_id, version, pd.read_csv(path), 0.0)
+        catalog.load_time = time.perf_counter() - start_time
+        return catalog
+
+    def __len__(self):
+        return len(self.data)
+
+    def match_rows(self, keywords):
+        """Row positions whose Service_Type or Category_New match any keyword"""
+        return self.keyword_index.lookup(keywords)
+
+    def filter_by_keywords(self, keywords):
+        if not keywords:
+            return pd.DataFrame()
+        return self.data.iloc[self.match_rows(keywords)]
+
+    def rank(self, rows, query, k=None):
+        """Top-k of the given rows by BM25 relevance to the query"""
+        k = k or getattr(settings, 'CHATBOT_CONTEXT_TOP_K', 25)
+        return self.ranker.rank(query, rows, k=k)
+
+    def nearest(self, rows, location, k=None, radii=None):
+        """
+        Nearest of the given rows to the user's location, widening the search
+        radius until something is found. Returns (DataFrame, radius_km), or
+        None when the location or the catalog rows cannot be placed on a map.
+        """
+        if not self.geo_index:
+            return None
+        point = parse_location(location, self.zip_centroids)
+        if point is None:
+            return None
+
+        k = k or getattr(settings, 'CHATBOT_NEAREST_K', 5)
+        radii = radii or getattr(settings, 'CHATBOT_SEARCH_RADII_KM', [5, 10, 20])
+        for radius in radii:
+            found, distances = self.geo_index.query(point[0], point[1], radius, candidates=rows, k=k)
+            if len(found):
+                nearby = self.data.iloc[found].copy()
+                nearby['Distance_km'] = distances.round(1)
+                return nearby, radius
+        return self.data.iloc[[]], radii[-1]
+
+
+class CatalogCache:
+    """
+    Process-level cache of the active ResourceCatalog, keyed by the active
+    CSVFile id and the file's mtime/size. The catalog is swapped atomically
+    when a different file (or a new revision of the same file) becomes active.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._catalog = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.total_load_time = 0.0
+
+    def _revalidate_seconds(self):
+        return getattr(settings, 'CHATBOT_CATALOG_REVALIDATE_SECONDS', 30)
+
+    def _record(self, counter, amount=1):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _active_source(self):
+        """Return (csv_id, version, path) for the active CSV file, or None"""
+        from chatbot.models import CSVFile
+
+        active_csv = CSVFile.objects.filter(is_active=True).values_list('id', 'file').first()
+        if not active_csv or not active_csv[1]:
+            return None
+
+        csv_id, name = active_csv
+        path = CSVFile._meta.get_field('file').storage.path(name)
+        stat = os.stat(path)
+        return str(csv_id), f"{csv_id}:{stat.st_mtime_ns}:{stat.st_size}", path
+
+    def get(self):
+        """Return the current catalog, reloading it only if the active file changed"""
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() - self._checked_at < self._revalidate_seconds():
+            self._record('hits')
+            return catalog
+
+        try:
+            source = self._active_source()
+        except Exception as e:
+            logger.error(f"Error resolving active CSV file: {e}")
+            return catalog
+
+        if source is None:
+            self._catalog = None
+            self._checked_at = time.monotonic()
+            return None
+
+        csv_id, version, path = source
+        if catalog is not None and catalog.version == version:
+            self._checked_at = time.monotonic()
+            self._record('hits')
+            return catalog
+
+        with self._lock:
+            # Another thread may have loaded this version while we waited
+            catalog = self._catalog
+            if catalog is not None and catalog.version == version:
+                self._record('hits')
+                return catalog
+
+            self._record('misses')
+            try:
+                catalog = ResourceCatalog.load(csv_id, version, path)
+            except Exception as e:
+                logger.error(f"Error loading CSV data: {e}")
+                self._record('load_errors')
+                return self._catalog
+
+            self._record('loads')
+            self._record('total_load_time', catalog.load_time)
+            self._catalog = catalog
+            self._checked_at = time.monotonic()
+            return catalog
+
+    def invalidate(self):
+        """Force the next get() to re-check the active CSV file"""
+        self._checked_at = 0.0
+
+    def reload(self):
+        self.invalidate()
+        return self.get()
+
+    def stats(self):
+        catalog = self._catalog
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'csv_id': catalog.csv_id if catalog else None,
+                'version': catalog.version if catalog else None,
+                'rows': len(catalog) if catalog else 0,
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'load_errors': self.load_errors,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'last_load_time': round(catalog.load_time, 4) if catalog else None,
+                'total_load_time': round(self.total_load_time, 4),
+            }
+
+
+catalog_cache = CatalogCache()
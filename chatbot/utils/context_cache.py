@@ -0,0 +1,170 @@
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from redis.exceptions import WatchError
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "chatbot:context"
+
+
+class ContextCache:
+    """
+    Per-session cache of the recent message window in Redis, in the form sent to the model.
+    The database stays the source of truth: turns are written to it first and then appended
+    here, and a missing or unreadable entry is rebuilt from it. Idle sessions expire after
+    CHATBOT_CONTEXT_CACHE_TTL seconds.
+
+    On Redis the window is a list of JSON messages and a turn is appended with RPUSHX + LTRIM
+    in one transaction, so overlapping turns of a session cannot drop each other's messages.
+    Every append also bumps a per-session version; a window rebuilt from the database is only
+    stored if no turn was appended while it was being read. Other backends cannot append
+    atomically, so there a turn invalidates the entry instead (LocMemCache, being process-local,
+    appends under a lock).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'CHATBOT_CONTEXT_CACHE_ALIAS', 'default')]
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'CHATBOT_CONTEXT_CACHE_ENABLED', True)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'CHATBOT_CONTEXT_CACHE_TTL', 3600)
+
+    def make_key(self, session_id):
+        return f"{KEY_PREFIX}:{session_id}"
+
+    def make_version_key(self, session_id):
+        return f"{KEY_PREFIX}:{session_id}:version"
+
+    def _window(self, messages):
+        return messages[-settings.CHATBOT_HISTORY_WINDOW:] if settings.CHATBOT_HISTORY_WINDOW else []
+
+    def _redis(self, cache, key):
+        """Raw redis-py client and full key, or (None, None) for non-Redis backends"""
+        if not isinstance(cache, RedisCache):
+            return None, None
+        key = cache.make_and_validate_key(key)
+        return cache._cache.get_client(key, write=True), key
+
+    def get(self, session_id):
+        """Cached message window of the session, or None on a miss"""
+        if not self.enabled:
+            return None
+        cache = self.cache
+        try:
+            client, key = self._redis(cache, self.make_key(session_id))
+            if client is not None:
+                # An empty list does not exist in Redis, so an empty window reads as a miss
+                messages = [json.loads(item) for item in client.lrange(key, 0, -1)] or None
+            else:
+                messages = cache.get(self.make_key(session_id))
+        except Exception as e:
+            logger.warning(f"Context cache read failed: {e}")
+            return None
+        return self._window(messages) if messages is not None else None
+
+    def version(self, session_id):
+        """Current version of the session's window; read before rebuilding it from the database"""
+        if not self.enabled:
+            return None
+        try:
+            return self.cache.get(self.make_version_key(session_id), 0)
+        except Exception as e:
+            logger.warning(f"Context cache read failed: {e}")
+            return None
+
+    def set(self, session_id, messages, version=None):
+        """
+        Store a window read from the database. With a version from version(), the window is
+        dropped if a turn was appended since, as the database read may predate that turn.
+        """
+        if not self.enabled:
+            return
+        cache = self.cache
+        messages = self._window(messages)
+        try:
+            client, key = self._redis(cache, self.make_key(session_id))
+            if client is None:
+                with self._lock:
+                    if version is None or cache.get(self.make_version_key(session_id), 0) == version:
+                        cache.set(self.make_key(session_id), messages, timeout=self.timeout)
+                return
+
+            version_key = cache.make_and_validate_key(self.make_version_key(session_id))
+            with client.pipeline() as pipe:
+                pipe.watch(version_key)
+                if version is not None and int(pipe.get(version_key) or 0) != version:
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                if messages:
+                    pipe.rpush(key, *[json.dumps(message) for message in messages])
+                    pipe.expire(key, self.timeout)
+                pipe.execute()
+        except WatchError:
+            pass  # a turn was appended meanwhile; the next read rebuilds the window
+        except Exception as e:
+            logger.warning(f"Context cache write failed: {e}")
+
+    def append(self, session_id, messages):
+        """
+        Add a turn to a cached window. Sessions without an entry are left alone so the
+        next read rebuilds the full window from the database.
+        """
+        if not self.enabled:
+            return
+        cache = self.cache
+        try:
+            client, key = self._redis(cache, self.make_key(session_id))
+            if client is not None:
+                version_key = cache.make_and_validate_key(self.make_version_key(session_id))
+                window = settings.CHATBOT_HISTORY_WINDOW
+                with client.pipeline() as pipe:
+                    pipe.incr(version_key)
+                    pipe.expire(version_key, self.timeout)
+                    pipe.rpushx(key, *[json.dumps(message) for message in messages])
+                    if window:
+                        pipe.ltrim(key, -window, -1)
+                    else:
+                        pipe.delete(key)
+                    pipe.expire(key, self.timeout)
+                    pipe.execute()
+            elif isinstance(cache, LocMemCache):
+                with self._lock:
+                    self._bump_version(cache, session_id)
+                    cached = cache.get(self.make_key(session_id))
+                    if cached is not None:
+                        cache.set(self.make_key(session_id), self._window(cached + messages), timeout=self.timeout)
+            else:
+                self._bump_version(cache, session_id)
+                cache.delete(self.make_key(session_id))
+        except Exception as e:
+            logger.warning(f"Context cache write failed: {e}")
+            self.invalidate(session_id)
+
+    def _bump_version(self, cache, session_id):
+        version_key = self.make_version_key(session_id)
+        if not cache.add(version_key, 1, timeout=self.timeout):
+            cache.incr(version_key)
+
+    def invalidate(self, session_id):
+        try:
+            self.cache.delete(self.make_key(session_id))
+        except Exception as e:
+            logger.warning(f"Context cache delete failed: {e}")
+
+
+context_cache = ContextCache()
@@ -1,7 +1,9 @@
 from urllib.parse import quote_plus
+import re
 import pandas as pd
  
 MAX_CHARS = 3000
+CHUNK_BLOCK_ROWS = 64
  
 KEYWORDS = [
     "food", "medical", "resources", "shelter", "support", "abuse", "cooling",
@@ -26,6 +28,19 @@ SEMANTIC_MAP = {
     "harassment": ["abuse", "support"]
 }
  
+# Canonical categories for every matchable term (KEYWORDS map to themselves)
+TERM_CATEGORIES = {kw: [kw] for kw in KEYWORDS}
+for term, categories in SEMANTIC_MAP.items():
+    TERM_CATEGORIES[term] = list(dict.fromkeys(TERM_CATEGORIES.get(term, []) + categories))
+ 
+# One compiled pass over the text: keywords keep their substring semantics,
+# synonyms must be whole words (optionally plural/-ing) so "hot" skips "hotel"
+KEYWORD_PATTERN = re.compile(
+    r"(?P<keyword>" + "|".join(map(re.escape, sorted(KEYWORDS, key=len, reverse=True))) + r")"
+    r"|\b(?P<synonym>" + "|".join(map(re.escape, sorted(SEMANTIC_MAP, key=len, reverse=True))) + r")(?:s|es|ing)?\b",
+    re.IGNORECASE
+)
+ 
  
 class file_uploder:
  
@@ -37,7 +52,11 @@ class file_uploder:
         return df_subset
  
     def extract_keywords(text):
-        return [kw for kw in KEYWORDS if kw.lower() in text.lower()]
+        """Canonical categories for all keywords and synonyms in the text, in KEYWORDS order"""
+        found = set()
+        for match in KEYWORD_PATTERN.finditer(text):
+            found.update(TERM_CATEGORIES[match.group(match.lastgroup).lower()])
+        return [kw for kw in KEYWORDS if kw in found]
  
     def filter_by_keywords(df, keywords):
         if not keywords:
@@ -48,24 +67,40 @@ class file_uploder:
         return df[mask_service | mask_category]
  
  
-    def chunk_dataframe(df, max_chars=MAX_CHARS):
-        chunks = []
-        header = "| " + " | ".join(df.columns) + " |\n"
+    def render_rows(df):
+        """Render every row as a markdown table line in one vectorized pass"""
+        if df.empty:
+            return pd.Series([], dtype=object)
+        cells = df.astype(str)
+        rows = "| " + cells.iloc[:, 0]
+        for position in range(1, cells.shape[1]):
+            rows = rows + " | " + cells.iloc[:, position]
+        return rows + " |\n"
+ 
+    def table_header(df):
+        header = "| " + " | ".join(str(column) for column in df.columns) + " |\n"
         divider = "| " + " | ".join(["---"] * len(df.columns)) + " |\n"
-        current_chunk = header + divider
+        return header + divider
+ 
+    def iter_chunks(df, max_chars=MAX_CHARS, block_rows=CHUNK_BLOCK_ROWS):
+        """Yield markdown table chunks lazily, rendering only the rows a consumer asks for"""
+        prefix = file_uploder.table_header(df)
+        parts, size = [], len(prefix)
  
-        for _, row in df.iterrows():
-            row_str = "| " + " | ".join(str(cell) for cell in row) + " |\n"
-            if len(current_chunk) + len(row_str) > max_chars:
-                chunks.append(current_chunk)
-                current_chunk = header + divider + row_str
-            else:
-                current_chunk += row_str
+        for start in range(0, len(df), block_rows):
+            for row_str in file_uploder.render_rows(df.iloc[start:start + block_rows]):
+                if parts and size + len(row_str) > max_chars:
+                    yield prefix + "".join(parts)
+                    parts, size = [], len(prefix)
+                parts.append(row_str)
+                size += len(row_str)
  
-        if current_chunk.strip() != header.strip() + divider.strip():
-            chunks.append(current_chunk)
+        if parts:
+            yield prefix + "".join(parts)
  
-        return chunks
+    def chunk_dataframe(df, max_chars=MAX_CHARS):
+        # Every row is needed here, so render them all in a single pass
+        return list(file_uploder.iter_chunks(df, max_chars, block_rows=max(len(df), 1)))
  
     def build_prompt(user_input, context_chunk, keywords):
         return f"""Here is data related to {', '.join(keywords)}:\n{context_chunk}\n\nUser said: {user_input}"""
@@ -0,0 +1,172 @@
+import logging
+import math
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+GRID_CELL_DEGREES = 0.05  # roughly 5.5 km of latitude
+
+LATITUDE_COLUMNS = ('latitude', 'lat')
+LONGITUDE_COLUMNS = ('longitude', 'lon', 'lng', 'long')
+ZIP_COLUMNS = ('zip', 'zipcode', 'zip_code', 'postal_code')
+
+ZIP_PATTERN = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+# The lookarounds stop a match from starting or ending inside a longer number ("-115.14" is not "15.14")
+COORDINATES_PATTERN = re.compile(r'(?<![\d.])(-?\d{1,2}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)(?![\d.])')
+
+
+def _find_column(df, names):
+    lookup = {str(column).strip().lower(): column for column in df.columns}
+    for name in names:
+        if name in lookup:
+            return lookup[name]
+    return None
+
+
+def _valid_point(lat, lon):
+    return -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+
+
+@lru_cache(maxsize=4)
+def load_zip_centroids(path):
+    """
+    Load an offline ZIP -> (lat, lon) table from a CSV with zip/latitude/longitude columns
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        df = pd.read_csv(path, dtype=str)
+        zip_column = _find_column(df, ZIP_COLUMNS)
+        lat_column = _find_column(df, LATITUDE_COLUMNS)
+        lon_column = _find_column(df, LONGITUDE_COLUMNS)
+        if zip_column is None or lat_column is None or lon_column is None:
+            logger.warning(f"ZIP centroid table {path} is missing zip/latitude/longitude columns")
+            return {}
+        zips = df[zip_column].str.strip().str[:5]
+        lats = pd.to_numeric(df[lat_column], errors='coerce')
+        lons = pd.to_numeric(df[lon_column], errors='coerce')
+        return {
+            code: (lat, lon)
+            for code, lat, lon in zip(zips, lats, lons)
+            if isinstance(code, str) and not (math.isnan(lat) or math.isnan(lon))
+        }
+    except Exception as e:
+        logger.error(f"Error loading ZIP centroid table: {e}")
+        return {}
+
+
+def extract_zip(text):
+    """Return the last 5-digit ZIP in an address (house numbers come first)"""
+    if not isinstance(text, str):
+        return None
+    matches = ZIP_PATTERN.findall(text)
+    return matches[-1] if matches else None
+
+
+def resolve_coordinates(df, zip_centroids):
+    """
+    Latitude/longitude arrays for every row, taken from CSV columns when present
+    and filled from the ZIP centroid of the Address otherwise. Unknown rows are NaN.
+    """
+    size = len(df)
+    lat = np.full(size, np.nan)
+    lon = np.full(size, np.nan)
+
+    lat_column = _find_column(df, LATITUDE_COLUMNS)
+    lon_column = _find_column(df, LONGITUDE_COLUMNS)
+    if lat_column is not None and lon_column is not None:
+        lat = pd.to_numeric(df[lat_column], errors='coerce').to_numpy(dtype=float)
+        lon = pd.to_numeric(df[lon_column], errors='coerce').to_numpy(dtype=float)
+
+    missing = np.isnan(lat) | np.isnan(lon)
+    if zip_centroids and missing.any() and 'Address' in df.columns:
+        for position in np.flatnonzero(missing):
+            centroid = zip_centroids.get(extract_zip(df['Address'].iat[position]))
+            if centroid:
+                lat[position], lon[position] = centroid
+
+    return lat, lon
+
+
+def parse_location(location, zip_centroids):
+    """Resolve a user location string to (lat, lon) from coordinates or a ZIP centroid"""
+    if not location:
+        return None
+    for match in COORDINATES_PATTERN.finditer(location):
+        lat, lon = float(match.group(1)), float(match.group(2))
+        if _valid_point(lat, lon):
+            return lat, lon
+    return zip_centroids.get(extract_zip(location))
+
+
+def haversine_km(lat, lon, lats, lons):
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class GeoIndex:
+    """
+    Uniform grid over row coordinates. A radius query only computes distances
+    for rows in the grid cells overlapping the search circle.
+    """
+
+    def __init__(self, lat, lon, cell_degrees=GRID_CELL_DEGREES):
+        self.lat = lat
+        self.lon = lon
+        self.cell_degrees = cell_degrees
+        self._cells = {}
+
+        rows = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        if len(rows):
+            cells = np.stack([
+                np.floor(lat[rows] / cell_degrees).astype(np.int64),
+                np.floor(lon[rows] / cell_degrees).astype(np.int64),
+            ], axis=1)
+            keys, inverse = np.unique(cells, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            grouped = np.split(rows[np.argsort(inverse, kind='stable')], np.cumsum(np.bincount(inverse))[:-1])
+            self._cells = {(int(y), int(x)): members for (y, x), members in zip(keys, grouped)}
+        self.size = len(rows)
+
+    def __bool__(self):
+        return self.size > 0
+
+    def query(self, lat, lon, radius_km, candidates=None, k=None):
+        """Return (rows, distances_km) within radius_km of the point, nearest first"""
+        reach_y = int(math.ceil(radius_km / KM_PER_DEGREE / self.cell_degrees))
+        reach_x = int(math.ceil(radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)) / self.cell_degrees))
+        cell_y = int(math.floor(lat / self.cell_degrees))
+        cell_x = int(math.floor(lon / self.cell_degrees))
+
+        buckets = [
+            self._cells[(y, x)]
+            for y in range(cell_y - reach_y, cell_y + reach_y + 1)
+            for x in range(cell_x - reach_x, cell_x + reach_x + 1)
+            if (y, x) in self._cells
+        ]
+        if not buckets:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+
+        rows = np.concatenate(buckets)
+        if candidates is not None:
+            allowed = np.zeros(len(self.lat), dtype=bool)
+            allowed[candidates] = True
+            rows = rows[allowed[rows]]
+
+        distances = haversine_km(lat, lon, self.lat[rows], self.lon[rows])
+        within = distances <= radius_km
+        rows, distances = rows[within], distances[within]
+
+        order = np.argsort(distances, kind='stable')
+        if k is not None:
+            order = order[:k]
+        return rows[order], distances[order]
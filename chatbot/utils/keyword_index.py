@@ -0,0 +1,59 @@
+import threading
+
+import numpy as np
+
+from .file_uploder import KEYWORDS
+
+SEARCH_COLUMNS = ['Service_Type', 'Category_New']
+
+
+class KeywordIndex:
+    """
+    Inverted index from keyword to the sorted row positions whose Service_Type
+    or Category_New contain it. Postings use the same case-insensitive
+    substring test as file_uploder.filter_by_keywords, so a multi-keyword
+    lookup returns exactly the rows the regex scan would, in file order.
+    """
+
+    def __init__(self, df, vocabulary=KEYWORDS):
+        self._columns = [self._searchable(df, column) for column in SEARCH_COLUMNS]
+        self._size = len(df)
+        self._lock = threading.Lock()
+        self._postings = {}
+        for keyword in vocabulary:
+            self._postings[keyword.lower()] = self._scan(keyword)
+
+    @staticmethod
+    def _searchable(df, column):
+        if column not in df.columns:
+            return None
+        series = df[column]
+        if series.dtype != object:
+            series = series.astype(str).where(series.notna())
+        return series
+
+    def _scan(self, keyword):
+        mask = np.zeros(self._size, dtype=bool)
+        for series in self._columns:
+            if series is not None:
+                mask |= series.str.contains(keyword, case=False, na=False).to_numpy(dtype=bool)
+        return np.flatnonzero(mask)
+
+    def postings(self, keyword):
+        key = keyword.lower()
+        rows = self._postings.get(key)
+        if rows is None:
+            # Keywords outside the vocabulary are scanned once and memoized
+            rows = self._scan(keyword)
+            with self._lock:
+                self._postings[key] = rows
+        return rows
+
+    def lookup(self, keywords):
+        """Return sorted row positions matching any of the keywords"""
+        if not keywords:
+            return np.empty(0, dtype=np.intp)
+        postings = [self.postings(keyword) for keyword in keywords]
+        if len(postings) == 1:
+            return postings[0]
+        return np.unique(np.concatenate(postings))
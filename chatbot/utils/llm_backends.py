@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import weakref
+from functools import lru_cache
+
+import httpx
+import openai
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class LLMBackendError(Exception):
+    """Raised by a backend when the model call fails"""
+
+
+class LLMTimeoutError(LLMBackendError):
+    """Raised when the model does not answer within the call's deadline"""
+
+
+class BaseLLMBackend:
+    """
+    Chat completion backend used by OpenAIConfig. Select one with the
+    CHATBOT_LLM_BACKEND setting (dotted path to a subclass).
+    """
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+
+    def complete(self, model, messages, timeout=None, **kwargs):
+        """Return the full reply text, raising LLMTimeoutError after timeout seconds"""
+        raise NotImplementedError
+
+    def stream(self, model, messages, timeout=None, **kwargs):
+        """Yield reply tokens as they are produced"""
+        raise NotImplementedError
+
+    async def acomplete(self, model, messages, timeout=None, **kwargs):
+        """Async complete()"""
+        raise NotImplementedError
+
+
+# One pooled HTTP client per event loop (httpx clients cannot be shared across loops)
+_async_clients = weakref.WeakKeyDictionary()
+_client_closers = set()  # strong references to the pending close_on_shutdown tasks
+
+
+async def close_on_shutdown(loop, client):
+    """
+    Park until the event loop shuts down, then close its client. asyncio.run(), and so
+    ASGI servers and async_to_sync, cancel leftover tasks before closing the loop.
+    """
+    try:
+        await loop.create_future()
+    finally:
+        _async_clients.pop(loop, None)
+        await client.aclose()
+
+
+def get_async_client():
+    """Connection-pooled client shared by every coroutine on the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=getattr(settings, 'CHATBOT_LLM_MAX_CONNECTIONS', 100),
+                max_keepalive_connections=getattr(settings, 'CHATBOT_LLM_MAX_KEEPALIVE', 20),
+            ),
+            timeout=httpx.Timeout(getattr(settings, 'CHATBOT_LLM_TIMEOUT', 60)),
+        )
+        _async_clients[loop] = client
+        closer = loop.create_task(close_on_shutdown(loop, client))
+        _client_closers.add(closer)
+        closer.add_done_callback(_client_closers.discard)
+    return client
+
+
+class OpenAIBackend(BaseLLMBackend):
+    """OpenAI chat completions: the SDK for sync calls, the pooled httpx client for async ones"""
+
+    def __init__(self, api_key=None):
+        super().__init__(api_key)
+        openai.api_key = api_key
+
+    def complete(self, model, messages, timeout=None, **kwargs):
+        try:
+            response = openai.ChatCompletion.create(
+                model=model, messages=messages, request_timeout=timeout, **kwargs
+            )
+        except openai.error.Timeout as e:
+            raise LLMTimeoutError(str(e)) from e
+        return response.choices[0].message['content']
+
+    def stream(self, model, messages, timeout=None, **kwargs):
+        try:
+            for chunk in openai.ChatCompletion.create(
+                model=model, messages=messages, stream=True, request_timeout=timeout, **kwargs
+            ):
+                token = chunk.choices[0].delta.get('content')
+                if token:
+                    yield token
+        except openai.error.Timeout as e:
+            raise LLMTimeoutError(str(e)) from e
+
+    async def acomplete(self, model, messages, timeout=None, **kwargs):
+        try:
+            response = await get_async_client().post(
+                f"{openai.api_base}/chat/completions",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                json={"model": model, "messages": messages, **kwargs},
+                timeout=timeout if timeout else httpx.USE_CLIENT_DEFAULT,
+            )
+        except httpx.TimeoutException as e:
+            raise LLMTimeoutError(str(e)) from e
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+
+class LocalLLMBackend(BaseLLMBackend):
+    """
+    Deterministic stand-in for load testing the chat stack offline. The reply,
+    latency and injected failures are derived from a hash of the request and
+    CHATBOT_LOCAL_LLM_SEED, so the same run can be replayed exactly.
+
+    Latency is log-normal with median CHATBOT_LOCAL_LLM_LATENCY_MS and shape
+    CHATBOT_LOCAL_LLM_LATENCY_SIGMA; streamed tokens are spaced by
+    CHATBOT_LOCAL_LLM_TOKEN_DELAY_MS and a CHATBOT_LOCAL_LLM_ERROR_RATE share
+    of requests fail with LLMBackendError.
+    """
+
+    REPLY_TEMPLATE = (
+        "I'm here to help. You asked about: {topic}. "
+        "Here are a few places nearby that may be able to support you today."
+    )
+
+    def _rng(self, model, messages):
+        payload = json.dumps([getattr(settings, 'CHATBOT_LOCAL_LLM_SEED', 0), model, messages], sort_keys=True)
+        return random.Random(hashlib.sha256(payload.encode()).digest())
+
+    def _plan(self, model, messages):
+        """Latency in seconds, whether to fail, and the reply for this request"""
+        rng = self._rng(model, messages)
+        median = getattr(settings, 'CHATBOT_LOCAL_LLM_LATENCY_MS', 500) / 1000
+        sigma = getattr(settings, 'CHATBOT_LOCAL_LLM_LATENCY_SIGMA', 0.5)
+        latency = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        fail = rng.random() < getattr(settings, 'CHATBOT_LOCAL_LLM_ERROR_RATE', 0.0)
+
+        user_messages = [message['content'] for message in messages if message['role'] == 'user']
+        lines = [line.strip() for line in user_messages[-1].splitlines() if line.strip()] if user_messages else []
+        topic = lines[0][:80] if lines else "your request"
+        return latency, fail, self.REPLY_TEMPLATE.format(topic=topic)
+
+    def _sleep(self, latency, timeout):
+        if timeout and latency > timeout:
+            time.sleep(timeout)
+            raise LLMTimeoutError(f"No reply within {timeout}s")
+        time.sleep(latency)
+
+    def complete(self, model, messages, timeout=None, **kwargs):
+        latency, fail, reply = self._plan(model, messages)
+        self._sleep(latency, timeout)
+        if fail:
+            raise LLMBackendError("Injected local backend failure")
+        return reply
+
+    def stream(self, model, messages, timeout=None, **kwargs):
+        latency, fail, reply = self._plan(model, messages)
+        self._sleep(latency, timeout)  # time to first token
+        if fail:
+            raise LLMBackendError("Injected local backend failure")
+        token_delay = getattr(settings, 'CHATBOT_LOCAL_LLM_TOKEN_DELAY_MS', 20) / 1000
+        for index, word in enumerate(reply.split(" ")):
+            if index:
+                time.sleep(token_delay)
+            yield word if index == 0 else " " + word
+
+    async def acomplete(self, model, messages, timeout=None, **kwargs):
+        latency, fail, reply = self._plan(model, messages)
+        if timeout and latency > timeout:
+            await asyncio.sleep(timeout)
+            raise LLMTimeoutError(f"No reply within {timeout}s")
+        await asyncio.sleep(latency)
+        if fail:
+            raise LLMBackendError("Injected local backend failure")
+        return reply
+
+
+@lru_cache(maxsize=8)
+def _backend_class(path):
+    return import_string(path)
+
+
+def get_llm_backend(api_key=None):
+    """Instantiate the backend named by CHATBOT_LLM_BACKEND"""
+    path = getattr(settings, 'CHATBOT_LLM_BACKEND', 'chatbot.utils.llm_backends.OpenAIBackend')
+    return _backend_class(path)(api_key=api_key)
@@ -1,32 +1,177 @@
+import logging
+from urllib.parse import quote_plus
+
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from .file_uploder import file_uploder
-from .prompt import OpenAIConfig
+from .prompt import (
+    OpenAIConfig, ModelUnavailableError, PROMPT_VERSION, FALLBACK_REPLY, RESOURCE_FALLBACK_INTRO, CRISIS_NOTE
+)
+from .answer_cache import answer_cache
+from .tokens import count_tokens, count_message_tokens, pack_context
+
+logger = logging.getLogger(__name__)
  
 class HopePipeline:
     def __init__(self, api_key):
         self.openai = OpenAIConfig(api_key=api_key)
  
-    def run(self, user_input, location, csv_data, history):
+    def run(self, user_input, location, csv_data, history, catalog=None, keywords=None):
+        request = self.prepare(user_input, location, csv_data, history, catalog, keywords)
+ 
+        response = request['cached']
+        if response is None:
+            try:
+                response = self.openai.get_response(request['prompt'], history, request['keywords'])
+            except ModelUnavailableError:
+                response = self.fallback_answer(request)
+            else:
+                if request['cache_key']:
+                    answer_cache.set(request['cache_key'], response)
+ 
+        history.append({"role": "user", "content": user_input})
+        history.append({"role": "assistant", "content": response})
+ 
+        return response
+ 
+    async def arun(self, user_input, location, csv_data, history, catalog=None, keywords=None):
+        """Async run(); only the model call awaits, cache I/O runs in a worker thread"""
+        request = await sync_to_async(self.prepare, thread_sensitive=False)(
+            user_input, location, csv_data, history, catalog, keywords
+        )
+ 
+        response = request['cached']
+        if response is None:
+            try:
+                response = await self.openai.aget_response(request['prompt'], history, request['keywords'])
+            except ModelUnavailableError:
+                response = self.fallback_answer(request)
+            else:
+                if request['cache_key']:
+                    await sync_to_async(answer_cache.set, thread_sensitive=False)(request['cache_key'], response)
+ 
+        history.append({"role": "user", "content": user_input})
+        history.append({"role": "assistant", "content": response})
+ 
+        return response
+ 
+    def stream(self, user_input, location, csv_data, history, catalog=None, keywords=None):
+        """Same as run(), but yields the reply token by token as the model produces it"""
+        request = self.prepare(user_input, location, csv_data, history, catalog, keywords)
+ 
+        response = request['cached']
+        if response is not None:
+            yield response
+        else:
+            parts = []
+            try:
+                for token in self.openai.stream_response(request['prompt'], history, request['keywords']):
+                    parts.append(token)
+                    yield token
+            except Exception as e:
+                logger.error(f"Error streaming from OpenAI API: {e}")
+                if not parts:
+                    fallback = self.fallback_answer(request)
+                    parts.append(fallback)
+                    yield fallback
+            else:
+                if request['cache_key']:
+                    answer_cache.set(request['cache_key'], "".join(parts))
+            response = "".join(parts)
+ 
+        history.append({"role": "user", "content": user_input})
+        history.append({"role": "assistant", "content": response})
+ 
+    def prepare(self, user_input, location, csv_data, history, catalog=None, keywords=None):
+        """Build the prompt for a turn, or return a cached answer for it"""
         enriched_input = user_input
         if location:
             enriched_input += f"\n\n[User is currently located at: {location}]"
  
         context = ""
-        keywords = file_uploder.extract_keywords(user_input)
+        if keywords is None:
+            keywords = file_uploder.extract_keywords(user_input)
+ 
+        # First-turn answers do not depend on the session, so identical requests can share them
+        cache_key = None
+        if not history:
+            cache_key = answer_cache.make_key(
+                user_input, keywords, location,
+                catalog.version if catalog is not None else None, PROMPT_VERSION,
+                catalog.zip_centroids if catalog is not None else None
+            )
+            cached = answer_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                return {'prompt': None, 'keywords': keywords, 'cache_key': cache_key, 'cached': cached}
  
-        if csv_data is not None and keywords:
-            filtered_df = file_uploder.filter_by_keywords(csv_data, keywords)
+        resources = None
+        if keywords and (catalog is not None or csv_data is not None):
+            resources = filtered_df, radius = self.select_resources(user_input, keywords, location, csv_data, catalog)
             if not filtered_df.empty:
-                chunks = file_uploder.chunk_dataframe(filtered_df)
-                context = chunks[0]
+                note = f"Resources within {radius:g} km of the user, nearest first (Distance_km):\n" if radius else ""
+                # Pack the highest-ranked rows into what is left of the request's token budget
+                budget = self.context_budget(enriched_input, history, keywords) - count_tokens(note, self.openai.model)
+                table, _ = pack_context(filtered_df, budget, self.openai.model)
+                if table:
+                    context = note + table
  
         prompt = self.build_prompt(enriched_input, context)
+        return {
+            'prompt': prompt, 'keywords': keywords, 'cache_key': cache_key, 'cached': None,
+            'resources': resources
+        }
  
-        response = self.openai.get_response(prompt, history, context)
+    def fallback_answer(self, request):
+        """
+        Templated reply built from the top-ranked resources, for when the model is
+        unavailable (breaker open, deadline passed or provider error)
+        """
+        resources, _ = request.get('resources') or (None, None)
+        if resources is None or resources.empty:
+            return f"{FALLBACK_REPLY}\n\n{CRISIS_NOTE}"
  
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": response})
+        lines = [RESOURCE_FALLBACK_INTRO, ""]
+        top = resources.head(getattr(settings, 'CHATBOT_FALLBACK_RESOURCES', 3)).to_dict('records')
+        for number, row in enumerate(top, 1):
+            line = f"{number}. {row.get('Provider', 'Resource')}"
+            if pd.notna(row.get('Service_Type')):
+                line += f" – {row['Service_Type']}"
+            if pd.notna(row.get('Distance_km')):
+                line += f" ({row['Distance_km']:.1f} km away)"
+            lines.append(line)
+            if pd.notna(row.get('Address')):
+                lines.append(f"   {row['Address']}")
+                lines.append(f"   Map: https://www.google.com/maps/search/?api=1&query={quote_plus(str(row['Address']))}")
+        lines += ["", CRISIS_NOTE]
+        return "\n".join(lines)
  
-        return response
+    def select_resources(self, user_input, keywords, location, csv_data, catalog):
+        """Return (rows, radius_km) to use as context; radius_km is None when not ranked by distance"""
+        if catalog is None:
+            return file_uploder.filter_by_keywords(csv_data, keywords), None
+ 
+        # The catalog's inverted index avoids a regex scan over every row
+        rows = catalog.match_rows(keywords)
+        if len(rows) and location:
+            nearby = catalog.nearest(rows, location)
+            if nearby is not None and not nearby[0].empty:
+                return nearby
+ 
+        # Without a usable location, put the most relevant matches first
+        rows = catalog.rank(rows, f"{user_input} {' '.join(keywords)}")
+        return catalog.data.iloc[rows], None
+ 
+    def context_budget(self, enriched_input, history, keywords=None):
+        """Tokens left for resource data once the system prompt, history and message are counted"""
+        model = self.openai.model
+        used = (
+            count_tokens(self.openai.build_system_prompt(keywords), model)
+            + count_message_tokens(history, model)
+            + count_tokens(self.build_prompt(enriched_input, "-"), model)
+        )
+        remaining = getattr(settings, 'CHATBOT_PROMPT_TOKEN_BUDGET', 8000) - used
+        return max(0, min(getattr(settings, 'CHATBOT_CONTEXT_TOKEN_BUDGET', 1000), remaining))
  
     def build_prompt(self, enriched_input, context):
         if context:
@@ -1,5 +1,58 @@
-import openai
-from .scenario import All_Scenario
+import inspect
+import logging
+import time
+from functools import lru_cache
+from django.conf import settings
+from .llm_backends import LLMBackendError, get_llm_backend
+from .resilience import llm_breaker, hedged, ahedged, CircuitOpenError
+from .scenario import All_Scenario, select_scenarios
+from .single_flight import single_flight
+from .tokens import count_tokens, count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever prompt wording changes so cached answers from older prompts are not reused
+PROMPT_VERSION = "2"
+
+FALLBACK_REPLY = "Sorry, I couldn't process your request at the moment. Please try again later."
+
+# Retrieval-only answer used when the model is unavailable (see HopePipeline.fallback_answer)
+RESOURCE_FALLBACK_INTRO = "I'm having trouble reaching our assistant right now, but these places may be able to help:"
+CRISIS_NOTE = "If you are in immediate danger, call 911. For crisis support, call or text 988."
+
+
+class ModelUnavailableError(LLMBackendError):
+    """Raised by OpenAIConfig.get_response when the model could not produce a reply"""
+
+# Stable prefix shared by every request; it is sent first so provider-side prompt caching can reuse it
+SYSTEM_PROMPT_PREFIX = """You are Hope AI – a compassionate assistant for vulnerable individuals in Nevada, USA, providing support for homelessness, trauma, and safety.
+
+Core Duties:
+- Start each session with a warm greeting (e.g.: “Hi, I’m here to help. Would you like to start now or later?”).
+- Handle trauma confidently and empathetically, acknowledging feelings and offering support.
+- A short, emotionally supportive message based on the user's need (e.g. hunger, shelter, hygiene).
+- Redirect outside of your scope with gentle fallbacks.
+- Prioritize safety, emotional well-being, and empowering the user to guide the conversation.
+
+Conversation Style:
+- Be concise, empathetic, safety-focused and use trauma-sensitive language.
+- If the request is outside your scope, offer a gentle fallback: “This sounds like something else might handle. Should I guide you there?”
+- Your goal is to help needy people.
+
+Scenarios to follow:
+"""
+
+SUMMARY_PROMPT = """You maintain a running summary of a support conversation between a user and Hope AI.
+Merge the new messages into the summary so far. Keep the user's needs, location, circumstances,
+resources already suggested and any safety concerns; drop greetings and repetition.
+Write in third person, plain prose, as briefly as possible."""
+
+
+@lru_cache(maxsize=64)
+def _system_prompt(scenarios):
+    blocks = [f"{number}. {inspect.cleandoc(getattr(All_Scenario, name))}" for number, name in enumerate(scenarios, 1)]
+    return SYSTEM_PROMPT_PREFIX + "\n".join(blocks)
+
  
 class OpenAIConfig:
     def __init__(self, api_key: str = None, model: str = "gpt-4.1-mini"):
@@ -8,55 +61,115 @@ class OpenAIConfig:
         """
         self.api_key = api_key
         self.model = model
-        openai.api_key = self.api_key
+        self.backend = get_llm_backend(api_key=self.api_key)
         self.conversation_history = [{"role": "system", "content": "You are a helpful for people who are homeless. Provide concise and accurate information."}]
  
-    def get_response(self, prompt: str, history: list, context: str = "") -> str:
+    @property
+    def deadline(self) -> float:
+        """Seconds a single model call may take before it is abandoned"""
+        return getattr(settings, 'CHATBOT_LLM_DEADLINE', 20)
+ 
+    def build_system_prompt(self, keywords=None) -> str:
+        return _system_prompt(select_scenarios(keywords))
+ 
+    def build_messages(self, prompt: str, history: list, keywords: list = None) -> list:
+        # Resource data travels in the user prompt only, sized by the pipeline's token budget
+        system_prompt = self.build_system_prompt(keywords)
+        self.log_prompt_tokens(system_prompt, history, prompt)
+        return [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": prompt}]
+ 
+    def get_response(self, prompt: str, history: list, keywords: list = None) -> str:
+        """Return the model's reply, raising ModelUnavailableError if there is none"""
         try:
-            system_prompt = f"""
-            You are Hope AI – a compassionate assistant for vulnerable individuals in Nevada, USA, providing support for homelessness, trauma, and safety.
- 
-            Core Duties:
-            - Start each session with a warm greeting (e.g.: “Hi, I’m here to help. Would you like to start now or later?”).
-            - Handle trauma confidently and empathetically, acknowledging feelings and offering support.
-            - A short, emotionally supportive message based on the user's need (e.g. hunger, shelter, hygiene).
-            - Redirect outside of your scope with gentle fallbacks.
-            - Prioritize safety, emotional well-being, and empowering the user to guide the conversation.
- 
-            Conversation Style:
-            - Be concise, empathetic, safety-focused and use trauma-sensitive language.
-            - If the request is outside your scope, offer a gentle fallback: “This sounds like something else might handle. Should I guide you there?”
-            - Your goal is to help needy people.
- 
-            Contextual Data:
-            {context}
- 
-            Scenarios to follow:
-            1. {All_Scenario.shelter}
-            2. {All_Scenario.medical}
-            3. {All_Scenario.hygiene}
-            4. {All_Scenario.suggestions}
-            5. {All_Scenario.scenario1}
-            6. {All_Scenario.scenario2}
-            7. {All_Scenario.food}
-            8. {All_Scenario.support}
-            9. {All_Scenario.all_services}
-            """
- 
-            api_history = [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": prompt}]
- 
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=api_history
-            )
+            api_history = self.build_messages(prompt, history, keywords)
  
-            reply = response.choices[0].message['content']
-            return reply
+            # Identical concurrent requests share one in-flight completion
+            return single_flight.do(
+                single_flight.make_key(self.model, api_history),
+                lambda: self.create_completion(api_history)
+            )
         except Exception as e:
-            print(f"Error communicating with OpenAI API: {e}")
-            return "Sorry, I couldn't process your request at the moment. Please try again later."
+            logger.error(f"Error communicating with OpenAI API: {e}")
+            raise ModelUnavailableError(str(e)) from e
+ 
+    def create_completion(self, api_history: list) -> str:
+        # Bounded by the call deadline and skipped outright while the breaker is open
+        return llm_breaker.call(lambda: hedged(
+            lambda: self.backend.complete(self.model, api_history, timeout=self.deadline), self.deadline
+        ))
  
    
  
+    async def aget_response(self, prompt: str, history: list, keywords: list = None) -> str:
+        """Async get_response() for the ASGI chat view"""
+        try:
+            api_history = self.build_messages(prompt, history, keywords)
+ 
+            return await single_flight.ado(
+                single_flight.make_key(self.model, api_history),
+                lambda: self.acreate_completion(api_history)
+            )
+        except Exception as e:
+            logger.error(f"Error communicating with OpenAI API: {e}")
+            raise ModelUnavailableError(str(e)) from e
+ 
+    async def acreate_completion(self, api_history: list) -> str:
+        return await llm_breaker.acall(lambda: ahedged(
+            lambda: self.backend.acomplete(self.model, api_history, timeout=self.deadline), self.deadline
+        ))
+ 
+    def stream_response(self, prompt: str, history: list, keywords: list = None):
+        """
+        Yield reply tokens as they arrive. Errors are raised to the caller,
+        which decides how to finish a partially streamed reply.
+        """
+        api_history = self.build_messages(prompt, history, keywords)
+ 
+        if not llm_breaker.allow_request():
+            raise CircuitOpenError("Circuit breaker 'llm' is open")
+        start = time.monotonic()
+        first_token = True
+        try:
+            for token in self.backend.stream(self.model, api_history, timeout=self.deadline):
+                if first_token:
+                    # Time to first token is what the user waits on
+                    llm_breaker.record(time.monotonic() - start)
+                    first_token = False
+                yield token
+        except Exception:
+            llm_breaker.record_failure()
+            raise
+        if first_token:
+            llm_breaker.record(time.monotonic() - start)
+ 
+    def summarize(self, previous_summary: str, messages: list):
+        """Fold messages into the rolling conversation summary; returns None on failure"""
+        transcript = "\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+        if previous_summary:
+            transcript = f"Summary so far:\n{previous_summary}\n\nNew messages:\n{transcript}"
+        try:
+            summary = self.backend.complete(
+                self.model,
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript}
+                ],
+                timeout=self.deadline,
+                max_tokens=getattr(settings, 'CHATBOT_SUMMARY_MAX_TOKENS', 300)
+            )
+            return summary.strip()
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {e}")
+            return None
+ 
+    def log_prompt_tokens(self, system_prompt, history, prompt):
+        system_tokens = count_tokens(system_prompt, self.model)
+        history_tokens = count_message_tokens(history, self.model)
+        prompt_tokens = count_tokens(prompt, self.model)
+        logger.info(
+            f"Prompt tokens: system={system_tokens} history={history_tokens} "
+            f"user={prompt_tokens} total={system_tokens + history_tokens + prompt_tokens}"
+        )
+ 
     def get_history(self):
         return self.conversation_history
\ No newline at end of file
@@ -0,0 +1,75 @@
+import re
+
+import numpy as np
+
+RANK_COLUMNS = ['Provider', 'Category_New', 'Service_Type', 'Address']
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if isinstance(text, str) else []
+
+
+class BM25Ranker:
+    """
+    BM25 relevance over the catalog's text columns.
+
+    Term weights are precomputed once per catalog version and stored term-major
+    as a sparse CSR matrix (indptr / row ids / weights), so scoring a query
+    against every row is a single bincount over the query terms' postings.
+    """
+
+    def __init__(self, df, columns=RANK_COLUMNS, k1=1.2, b=0.75):
+        self.size = len(df)
+        columns = [column for column in columns if column in df.columns]
+        if columns and self.size:
+            text = df[columns[0]].fillna('').astype(str)
+            for column in columns[1:]:
+                text = text + ' ' + df[column].fillna('').astype(str)
+            documents = [tokenize(document) for document in text]
+        else:
+            documents = [[] for _ in range(self.size)]
+
+        self.vocabulary = {}
+        term_ids, row_ids = [], []
+        for row, tokens in enumerate(documents):
+            for token in tokens:
+                term_ids.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                row_ids.append(row)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        lengths = np.bincount(row_ids, minlength=self.size).astype(float)
+        average_length = lengths.mean() if self.size and lengths.any() else 1.0
+
+        # Collapse repeated (term, row) pairs into term frequencies, sorted by term
+        pairs, tf = np.unique(term_ids * max(self.size, 1) + row_ids, return_counts=True)
+        terms = pairs // max(self.size, 1)
+        self.rows = pairs % max(self.size, 1)
+
+        document_frequency = np.bincount(terms, minlength=len(self.vocabulary)).astype(float)
+        idf = np.log1p((self.size - document_frequency + 0.5) / (document_frequency + 0.5))
+        norm = k1 * (1 - b + b * lengths[self.rows] / average_length)
+        self.weights = idf[terms] * tf * (k1 + 1) / (tf + norm)
+        self.indptr = np.concatenate([[0], np.cumsum(document_frequency.astype(np.int64))])
+
+    def score(self, query):
+        """BM25 score of the query against every row"""
+        term_ids = sorted({self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary})
+        if not term_ids:
+            return np.zeros(self.size)
+        slices = [slice(self.indptr[term], self.indptr[term + 1]) for term in term_ids]
+        return np.bincount(
+            np.concatenate([self.rows[s] for s in slices]),
+            weights=np.concatenate([self.weights[s] for s in slices]),
+            minlength=self.size,
+        )
+
+    def rank(self, query, rows=None, k=None):
+        """Rows (all, or the given subset) ordered by descending score; ties keep file order"""
+        scores = self.score(query)
+        rows = np.arange(self.size) if rows is None else np.asarray(rows)
+        order = np.argsort(-scores[rows], kind='stable')
+        if k is not None:
+            order = order[:k]
+        return rows[order]
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FuturesTimeout, wait
+
+from django.conf import settings
+
+from .llm_backends import LLMBackendError, LLMTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(LLMBackendError):
+    """Raised instead of calling the model while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Process-local circuit breaker for model calls. After CHATBOT_BREAKER_FAILURE_THRESHOLD
+    consecutive failures or slow calls (longer than CHATBOT_BREAKER_SLOW_CALL_SECONDS) it
+    opens and rejects calls for CHATBOT_BREAKER_RESET_SECONDS, then lets a single trial
+    call through (half-open) to decide whether to close again.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= settings.CHATBOT_BREAKER_RESET_SECONDS:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, duration):
+        """Record a completed call; slow calls count as failures"""
+        if duration > settings.CHATBOT_BREAKER_SLOW_CALL_SECONDS:
+            self.record_failure()
+            return
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED
+                and self.consecutive_failures >= settings.CHATBOT_BREAKER_FAILURE_THRESHOLD
+            ):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                logger.warning(f"Circuit breaker '{self.name}' opened after {self.consecutive_failures} failures")
+
+    def call(self, fn):
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception:
+            self.record_failure()
+            raise
+        self.record(time.monotonic() - start)
+        return result
+
+    async def acall(self, fn):
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+        start = time.monotonic()
+        try:
+            result = await fn()
+        except Exception:
+            self.record_failure()
+            raise
+        self.record(time.monotonic() - start)
+        return result
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+        }
+
+
+llm_breaker = CircuitBreaker('llm')
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def get_hedge_executor():
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CHATBOT_LLM_HEDGE_WORKERS', 32),
+                thread_name_prefix='llm-hedge'
+            )
+    return _hedge_executor
+
+
+def hedged(fn, deadline):
+    """
+    Call fn(), and if it has not answered after CHATBOT_LLM_HEDGE_AFTER seconds fire one
+    duplicate call; the first successful result wins. Gives up after deadline seconds.
+    """
+    hedge_after = getattr(settings, 'CHATBOT_LLM_HEDGE_AFTER', 0)
+    if not hedge_after or hedge_after >= deadline:
+        return fn()
+
+    end = time.monotonic() + deadline
+    executor = get_hedge_executor()
+    first = executor.submit(fn)
+    try:
+        return first.result(timeout=hedge_after)
+    except FuturesTimeout:
+        pass
+
+    pending = {first, executor.submit(fn)}
+    error = None
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=max(0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise LLMTimeoutError(f"No reply within {deadline}s")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        # A running call cannot be interrupted, but one still queued for a worker is dropped
+        for future in pending:
+            future.cancel()
+
+
+async def ahedged(fn, deadline):
+    """Async hedged(): fn is a coroutine function"""
+    hedge_after = getattr(settings, 'CHATBOT_LLM_HEDGE_AFTER', 0)
+    if not hedge_after or hedge_after >= deadline:
+        return await asyncio.wait_for(fn(), deadline)
+
+    end = time.monotonic() + deadline
+    first = asyncio.ensure_future(fn())
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+
+    pending = {first, asyncio.ensure_future(fn())}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0, end - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise LLMTimeoutError(f"No reply within {deadline}s")
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -58,4 +58,44 @@ class All_Scenario:
             - Offer supportive resources or coping strategies.
             - Encourage them to seek professional help if needed, but avoid giving direct medical advice."""
    
-    scenario2 = """Avoid providing information that is outside your scope like user say unrelated to homelessness, trauma, or safety. Instead, respond with a gentle fallback."""
\ No newline at end of file
+    scenario2 = """Avoid providing information that is outside your scope like user say unrelated to homelessness, trauma, or safety. Instead, respond with a gentle fallback."""
+
+# Canonical order of scenario blocks in the system prompt
+SCENARIO_ORDER = [
+    "shelter", "medical", "hygiene", "food", "support", "all_services",
+    "suggestions", "scenario1", "scenario2"
+]
+
+# Scenario blocks relevant to each extracted keyword
+KEYWORD_SCENARIOS = {
+    "food": ["food"],
+    "meal": ["food"],
+    "pantry": ["food"],
+    "medical": ["medical"],
+    "treatment": ["medical"],
+    "shelter": ["shelter"],
+    "housing": ["shelter"],
+    "hygiene": ["hygiene"],
+    "support": ["support"],
+    "abuse": ["support", "scenario1"],
+    "mental": ["support", "scenario1"],
+    "cooling": ["all_services"],
+    "education": ["all_services"],
+    "family": ["all_services"],
+    "resources": ["all_services"],
+}
+
+# Always carried, plus the general blocks used when no keyword was found
+BASE_SCENARIOS = ["suggestions"]
+NO_KEYWORD_SCENARIOS = ["all_services", "scenario1", "scenario2"]
+
+
+def select_scenarios(keywords):
+    """Scenario names for the extracted keywords, in SCENARIO_ORDER"""
+    selected = set(BASE_SCENARIOS)
+    if keywords:
+        for keyword in keywords:
+            selected.update(KEYWORD_SCENARIOS.get(keyword, ["all_services"]))
+    else:
+        selected.update(NO_KEYWORD_SCENARIOS)
+    return tuple(name for name in SCENARIO_ORDER if name in selected)
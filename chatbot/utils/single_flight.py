@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "chatbot:single_flight"
+POLL_INTERVAL = 0.1  # seconds between result checks while another process holds the lock
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent model calls: the first caller for a key makes the
+    call and every caller that arrives while it is in flight waits for and shares its
+    result (or its error). With CHATBOT_SINGLE_FLIGHT_DISTRIBUTED the leader also takes
+    a Redis lock, so identical calls in other processes wait on it too and read the
+    result from the cache. Only the sync path coalesces across processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = weakref.WeakKeyDictionary()  # event loop -> {key: future}
+        self.leaders = 0
+        self.followers = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'CHATBOT_SINGLE_FLIGHT_ENABLED', True)
+
+    @property
+    def wait_timeout(self):
+        return getattr(settings, 'CHATBOT_LLM_TIMEOUT', 60)
+
+    def make_key(self, model, messages):
+        payload = json.dumps([model, messages], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def do(self, key, fn):
+        """Return fn(), sharing one call among concurrent callers with the same key"""
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            # A leader that never finishes must not hold followers forever
+            if not call.done.wait(self.wait_timeout):
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if getattr(settings, 'CHATBOT_SINGLE_FLIGHT_DISTRIBUTED', False):
+                call.result = self._do_distributed(key, fn)
+            else:
+                call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _do_distributed(self, key, fn):
+        lock_key, result_key = f"{KEY_PREFIX}:lock:{key}", f"{KEY_PREFIX}:result:{key}"
+        try:
+            acquired = cache.add(lock_key, 1, timeout=self.wait_timeout)
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable: {e}")
+            return fn()
+
+        if acquired:
+            try:
+                result = fn()
+                cache.set(result_key, result, timeout=getattr(settings, 'CHATBOT_SINGLE_FLIGHT_RESULT_TTL', 10))
+                return result
+            finally:
+                cache.delete(lock_key)
+
+        # Another process is making this call; wait for its result while it holds the lock
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            values = cache.get_many([result_key, lock_key])
+            if result_key in values:
+                return values[result_key]
+            if lock_key not in values:
+                break  # the other process finished without publishing a result
+            time.sleep(POLL_INTERVAL)
+        return fn()
+
+    async def ado(self, key, fn):
+        """Async do(): concurrent coroutines on the same event loop share one await of fn()"""
+        if not self.enabled:
+            return await fn()
+
+        calls = self._async_calls.setdefault(asyncio.get_running_loop(), {})
+        future = calls.get(key)
+        if future is not None:
+            self.followers += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():  # the leader was cancelled, not us
+                    return await fn()
+                raise
+
+        self.leaders += 1
+        future = calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody was waiting
+            raise
+        finally:
+            calls.pop(key, None)
+
+
+single_flight = SingleFlight()
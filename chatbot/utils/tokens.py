@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+import threading
+
+from .file_uploder import file_uploder, CHUNK_BLOCK_ROWS
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4.1-mini"
+FALLBACK_ENCODING = "o200k_base"
+CHARS_PER_TOKEN = 4  # rough estimate when no tokenizer is available
+MESSAGE_OVERHEAD_TOKENS = 4  # role/separator framing per chat message
+BPE_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+
+_encodings = {}  # encoding name -> Encoding, or None when unavailable
+_encodings_lock = threading.Lock()
+
+
+def encoding_name(model=DEFAULT_MODEL):
+    try:
+        return tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        return FALLBACK_ENCODING
+
+
+def bpe_file_cached(name):
+    """
+    Whether the encoding's BPE file is already in TIKTOKEN_CACHE_DIR, so loading it
+    cannot reach out to the network (tiktoken downloads without a timeout)
+    """
+    cache_dir = os.environ.get('TIKTOKEN_CACHE_DIR')
+    if not cache_dir:
+        return False
+    cache_key = hashlib.sha1(BPE_URL.format(name).encode()).hexdigest()
+    return os.path.exists(os.path.join(cache_dir, cache_key))
+
+
+def load_encoding(model=DEFAULT_MODEL):
+    """
+    Load the model's tokenizer once per process, from TIKTOKEN_CACHE_DIR only.
+    Called at startup; without a populated cache directory tokens are estimated
+    from characters instead of downloading the BPE file during a request.
+    """
+    if tiktoken is None:
+        return None
+    name = encoding_name(model)
+    with _encodings_lock:
+        if name not in _encodings:
+            encoding = None
+            if not bpe_file_cached(name):
+                logger.warning(
+                    f"Tokenizer {name} not found in TIKTOKEN_CACHE_DIR, estimating tokens from characters"
+                )
+            else:
+                try:
+                    encoding = tiktoken.get_encoding(name)
+                except Exception as e:
+                    logger.error(f"Tokenizer {name} unavailable, estimating tokens from characters: {e}")
+            _encodings[name] = encoding
+        return _encodings[name]
+
+
+def get_encoding(model=DEFAULT_MODEL):
+    """Local tokenizer for the model, or None if tiktoken or its BPE file is unavailable"""
+    if tiktoken is None:
+        return None
+    encoding = _encodings.get(encoding_name(model), False)
+    return load_encoding(model) if encoding is False else encoding
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode_ordinary(text))
+
+
+def count_message_tokens(messages, model=DEFAULT_MODEL):
+    return sum(count_tokens(message.get('content', ''), model) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def pack_context(df, budget_tokens, model=DEFAULT_MODEL):
+    """
+    Markdown table of the leading rows of df that fit in budget_tokens.
+    Rows should already be ordered by priority; the header is emitted once.
+    Returns (table, rows_packed).
+    """
+    if df.empty or budget_tokens <= 0:
+        return "", 0
+
+    header = file_uploder.table_header(df)
+    used = count_tokens(header, model)
+    parts = []
+
+    for start in range(0, len(df), CHUNK_BLOCK_ROWS):
+        for row_str in file_uploder.render_rows(df.iloc[start:start + CHUNK_BLOCK_ROWS]):
+            cost = count_tokens(row_str, model)
+            if used + cost > budget_tokens:
+                return (header + "".join(parts), len(parts)) if parts else ("", 0)
+            parts.append(row_str)
+            used += cost
+
+    return header + "".join(parts), len(parts)
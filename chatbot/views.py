@@ -3,21 +3,31 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.conf import settings
+from django.http import StreamingHttpResponse
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from celery.result import AsyncResult
 from django.db.models import Count, Avg
-from django.utils import timezone
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from utils.response import CustomResponse
-import pandas as pd
 import time
+import json
 import os
 import re
 
 from .models import CSVFile, ChatSession, ChatMessage
 from .serializers import (
     CSVFileSerializer, ChatSessionSerializer, ChatSessionListSerializer,
-    ChatMessageSerializer, ChatRequestSerializer, ChatResponseSerializer, SessionStatsSerializer
+    ChatMessageSerializer, ChatRequestSerializer, ChatResponseSerializer, SessionStatsSerializer,
+    AnswerCacheSettingsSerializer
 )
+from .pagination import SessionKeysetPagination, MessageKeysetPagination
+from .services import ChatService
+from .tasks import process_chat_message_task, enqueue_chat_job, ChatQueueFull
 from .utils.file_uploder import file_uploder
 from .utils.pipeline import HopePipeline
+from .utils.catalog import catalog_cache
+from .utils.answer_cache import answer_cache
 
 class ChatView(APIView):
     permission_classes = [AllowAny]
@@ -26,49 +36,8 @@ class ChatView(APIView):
     def __init__(self):
         super().__init__()
         self.pipeline = HopePipeline(api_key=settings.OPENAI_API_KEY)
-        self.csv_data = self.load_csv_data()
-
-    def load_csv_data(self):
-        """Load the active CSV data"""
-        try:
-            active_csv = CSVFile.objects.filter(is_active=True).first()
-            if active_csv and active_csv.file:
-                return pd.read_csv(active_csv.file.path)
-        except Exception as e:
-            print(f"Error loading CSV data: {e}")
-        return None
-
-    def get_or_create_session(self, user, session_id, session_key):
-        """Get existing session or create new one"""
-        if session_id:
-            try:
-                if user and user.is_authenticated:
-                    session = ChatSession.objects.get(id=session_id, user=user)
-                else:
-                    session = ChatSession.objects.get(id=session_id)
-                return session
-            except ChatSession.DoesNotExist:
-                pass
-
-        # Create new session
-        session_data = {'is_active': True}
-        if user and user.is_authenticated:
-            session_data['user'] = user
-        else:
-            session_data['session_key'] = session_key
-
-        return ChatSession.objects.create(**session_data)
-
-    def build_history(self, session):
-        """Build conversation history for the pipeline"""
-        messages = session.messages.filter(role__in=['user', 'assistant']).order_by('timestamp')
-        history = []
-        for msg in messages:
-            history.append({
-                'role': msg.role,
-                'content': msg.content
-            })
-        return history
+        self.catalog = catalog_cache.get()
+        self.csv_data = self.catalog.data if self.catalog is not None else None
 
     def post(self, request):
         serializer = ChatRequestSerializer(data=request.data)
@@ -81,24 +50,26 @@ class ChatView(APIView):
         session_id = serializer.validated_data.get('session_id')
 
         # Get or generate session key for anonymous users
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
+        session_key = ChatService.get_session_key(request)
 
         # Get or create session
-        session = self.get_or_create_session(
+        session = ChatService.get_or_create_session(
             user=request.user if request.user.is_authenticated else None,
             session_id=session_id,
-            session_key=session_key
+            session_key=session_key,
+            first_message=user_message
         )
 
-        # Build conversation history
-        history = self.build_history(session)
-
         # Extract keywords before processing
         keywords = file_uploder.extract_keywords(user_message)
 
+        # Job mode: hand the turn to a Celery worker and return immediately
+        if serializer.validated_data['mode'] == 'job':
+            return self.enqueue_job(session, user_message, location, keywords)
+
+        # Build conversation history
+        history = ChatService.build_history(session)
+
         start_time = time.time()
 
         try:
@@ -107,36 +78,25 @@ class ChatView(APIView):
                 user_input=user_message,
                 location=location,
                 csv_data=self.csv_data,
-                history=history
+                history=history,
+                catalog=self.catalog,
+                keywords=keywords
             )
 
             response_time = time.time() - start_time
             context_used = bool(self.csv_data is not None and keywords)
 
-            # Save user message
-            user_msg = ChatMessage.objects.create(
+            # Save user message and assistant response
+            ChatService.save_turn(
                 session=session,
-                role='user',
-                content=user_message,
+                user_message=user_message,
+                response=response,
                 location=location,
                 keywords=keywords,
-                context_used=context_used
-            )
-
-            # Save assistant response
-            assistant_msg = ChatMessage.objects.create(
-                session=session,
-                role='assistant',
-                content=response,
-                keywords=keywords,
                 context_used=context_used,
                 response_time=response_time
             )
 
-            # Update session timestamp
-            session.updated_at = timezone.now()
-            session.save()
-
             # Prepare response
             response_data = {
                 'response': response,
@@ -152,18 +112,172 @@ class ChatView(APIView):
             return CustomResponse.error(f"Error processing message: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
+    def enqueue_job(self, session, user_message, location, keywords):
+        """Queue the turn on the chat Celery queue, refusing when the backlog is too deep"""
+        try:
+            job = enqueue_chat_job(session, user_message, location, keywords)
+        except ChatQueueFull:
+            response = CustomResponse.error(
+                "Chat service is busy, please try again shortly", status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = str(settings.CHATBOT_JOB_RETRY_AFTER)
+            return response
+        except Exception as e:
+            return CustomResponse.error(f"Error queueing message: {str(e)}", status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        return CustomResponse.success("Message queued for processing", {
+            'job_id': job.id,
+            'session_id': str(session.id),
+            'status': 'PENDING'
+        }, status.HTTP_202_ACCEPTED)
+
+
+class ChatJobView(APIView):
+    """
+    Poll for the result of a chat job queued with mode='job'.
+    Pass ?wait=<seconds> to long-poll until the job finishes (capped by CHATBOT_JOB_MAX_WAIT).
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        try:
+            wait = min(max(float(request.query_params.get('wait', 0)), 0), settings.CHATBOT_JOB_MAX_WAIT)
+        except ValueError:
+            return CustomResponse.error("Invalid wait parameter", status.HTTP_400_BAD_REQUEST)
+
+        result = AsyncResult(str(job_id), app=process_chat_message_task.app)
+        if wait and not result.ready():
+            try:
+                result.get(timeout=wait, interval=0.5, propagate=False)
+            except CeleryTimeoutError:
+                pass
+
+        data = {'job_id': str(job_id), 'status': result.status}
+        if result.successful():
+            payload = dict(result.result)
+            owner = payload.pop('user_id', None)
+            session_key = payload.pop('session_key', None)
+            # Jobs are only visible to the user, or anonymous browser session, that queued them
+            if owner:
+                allowed = request.user.is_authenticated and str(request.user.id) == owner
+            else:
+                allowed = session_key is not None and request.session.session_key == session_key
+            if not allowed:
+                return CustomResponse.error("Job not found", status.HTTP_404_NOT_FOUND)
+            data['result'] = payload
+        elif result.failed():
+            data['error'] = "Error processing message"
+
+        return CustomResponse.success("Job status retrieved", data)
+
+
+class ChatStreamView(APIView):
+    """
+    Streaming variant of ChatView. Tokens are sent as Server-Sent Events while
+    the model generates them, and the turn is saved once the stream completes.
+    """
+    permission_classes = [AllowAny]
+    serializer_class = ChatRequestSerializer
+
+    def __init__(self):
+        super().__init__()
+        self.pipeline = HopePipeline(api_key=settings.OPENAI_API_KEY)
+        self.catalog = catalog_cache.get()
+        self.csv_data = self.catalog.data if self.catalog is not None else None
+
+    @staticmethod
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def post(self, request):
+        serializer = ChatRequestSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return CustomResponse.error(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        user_message = serializer.validated_data['message']
+        location = serializer.validated_data.get('location', '')
+        session_id = serializer.validated_data.get('session_id')
+
+        session = ChatService.get_or_create_session(
+            user=request.user if request.user.is_authenticated else None,
+            session_id=session_id,
+            session_key=ChatService.get_session_key(request),
+            first_message=user_message
+        )
+        history = ChatService.build_history(session)
+        keywords = file_uploder.extract_keywords(user_message)
+        context_used = bool(self.csv_data is not None and keywords)
+
+        def event_stream():
+            start_time = time.time()
+            time_to_first_token = None
+            parts = []
+
+            try:
+                for token in self.pipeline.stream(
+                    user_input=user_message,
+                    location=location,
+                    csv_data=self.csv_data,
+                    history=history,
+                    catalog=self.catalog,
+                    keywords=keywords
+                ):
+                    if time_to_first_token is None:
+                        time_to_first_token = time.time() - start_time
+                    parts.append(token)
+                    yield self.sse('token', {'token': token})
+
+                response = "".join(parts)
+                response_time = time.time() - start_time
+
+                ChatService.save_turn(
+                    session=session,
+                    user_message=user_message,
+                    response=response,
+                    location=location,
+                    keywords=keywords,
+                    context_used=context_used,
+                    response_time=response_time,
+                    time_to_first_token=time_to_first_token
+                )
+
+                yield self.sse('done', {
+                    'response': response,
+                    'session_id': str(session.id),
+                    'keywords': keywords,
+                    'context_used': context_used,
+                    'response_time': round(response_time, 2),
+                    'time_to_first_token': round(time_to_first_token, 2) if time_to_first_token is not None else None
+                })
+
+            except Exception as e:
+                yield self.sse('error', {'message': f"Error processing message: {str(e)}"})
+
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+        return response
+
+
 class ChatSessionListView(generics.ListAPIView):
     serializer_class = ChatSessionListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = SessionKeysetPagination
 
     def get_queryset(self):
+        # Counters and last-message fields live on the session row; no message prefetch needed
         return ChatSession.objects.filter(
             user=self.request.user,
             is_active=True
-        ).prefetch_related('messages')
+        ).select_related('user')
 
 
 class ChatSessionDetailView(generics.RetrieveAPIView):
+    """
+    Session details with only its newest page of messages (newest first);
+    older messages are fetched from ChatSessionMessagesView with next_messages
+    """
     serializer_class = ChatSessionSerializer
     permission_classes = [IsAuthenticated]
 
@@ -171,7 +285,35 @@ class ChatSessionDetailView(generics.RetrieveAPIView):
         return ChatSession.objects.filter(
             user=self.request.user,
             is_active=True
-        ).prefetch_related('messages')
+        ).select_related('user')
+
+    def retrieve(self, request, *args, **kwargs):
+        session = self.get_object()
+        paginator = MessageKeysetPagination()
+        messages = paginator.paginate_queryset(session.messages.all(), request, view=self)
+        next_messages = paginator.get_next_link(
+            request.build_absolute_uri(reverse('chatbot:session-messages', args=[session.id]))
+        )
+
+        context = self.get_serializer_context()
+        context.update(messages=messages, next_messages=next_messages)
+        return Response(self.get_serializer_class()(session, context=context).data)
+
+
+class ChatSessionMessagesView(generics.ListAPIView):
+    """
+    Messages of a session, newest first, paginated by a (timestamp, id) cursor
+    so the client can scroll back through long histories
+    """
+    serializer_class = ChatMessageSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = MessageKeysetPagination
+
+    def get_queryset(self):
+        session = get_object_or_404(
+            ChatSession, id=self.kwargs['pk'], user=self.request.user, is_active=True
+        )
+        return ChatMessage.objects.filter(session=session)
 
 
 class ChatSessionDeleteView(generics.DestroyAPIView):
@@ -208,6 +350,38 @@ class ReloadCSVView(APIView):
         if not request.user.is_staff:
             return CustomResponse.error("Permission denied", status.HTTP_403_FORBIDDEN)
         
-        # This endpoint can be used to reload CSV data in the chat service
-        # For now, we'll just return success as the CSV is loaded per request
-        return CustomResponse.success("CSV data reloaded successfully")
+        # Drop this process's cached catalog and load the active CSV again
+        catalog_cache.reload()
+        return CustomResponse.success("CSV data reloaded successfully", catalog_cache.stats())
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return CustomResponse.error("Permission denied", status.HTTP_403_FORBIDDEN)
+
+        return CustomResponse.success("CSV catalog stats", catalog_cache.stats())
+
+
+class AnswerCacheView(APIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = AnswerCacheSettingsSerializer
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return CustomResponse.error("Permission denied", status.HTTP_403_FORBIDDEN)
+
+        return CustomResponse.success("Answer cache stats", answer_cache.stats())
+
+    def post(self, request):
+        if not request.user.is_staff:
+            return CustomResponse.error("Permission denied", status.HTTP_403_FORBIDDEN)
+
+        serializer = AnswerCacheSettingsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return CustomResponse.error(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        if 'enabled' in serializer.validated_data:
+            answer_cache.set_enabled(serializer.validated_data['enabled'])
+        if serializer.validated_data['clear']:
+            answer_cache.clear()
+
+        return CustomResponse.success("Answer cache updated", answer_cache.stats())
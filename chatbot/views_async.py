@@ -0,0 +1,133 @@
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from utils.response import CustomJsonResponse
+
+from .serializers import ChatRequestSerializer
+from .services import ChatService
+from .tasks import enqueue_chat_job, ChatQueueFull
+from .utils.catalog import catalog_cache
+from .utils.file_uploder import file_uploder
+from .utils.pipeline import HopePipeline
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatView(View):
+    """
+    Native async counterpart of ChatView for ASGI deployments.
+    The model call awaits a shared, connection-pooled HTTP client instead of
+    holding a worker thread, and ORM/session access goes through async-safe
+    wrappers. Under WSGI it still works, but without the concurrency benefit.
+    """
+
+    async def authenticate(self, request):
+        """Optional JWT authentication, as DRF would apply it to ChatView"""
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+        return result[0] if result else None
+
+    async def get_session_key(self, request):
+        session_key = request.session.session_key
+        if not session_key:
+            await request.session.acreate()
+            session_key = request.session.session_key
+        return session_key
+
+    async def enqueue_job(self, session, user_message, location, keywords):
+        try:
+            job = await sync_to_async(enqueue_chat_job)(session, user_message, location, keywords)
+        except ChatQueueFull:
+            response = CustomJsonResponse.error(
+                "Chat service is busy, please try again shortly", status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = str(settings.CHATBOT_JOB_RETRY_AFTER)
+            return response
+        except Exception as e:
+            return CustomJsonResponse.error(f"Error queueing message: {str(e)}", status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        return CustomJsonResponse.success("Message queued for processing", {
+            'job_id': job.id,
+            'session_id': str(session.id),
+            'status': 'PENDING'
+        }, status.HTTP_202_ACCEPTED)
+
+    async def post(self, request):
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return CustomJsonResponse.error("Invalid JSON body", status.HTTP_400_BAD_REQUEST)
+
+        serializer = ChatRequestSerializer(data=payload)
+        if not serializer.is_valid():
+            return CustomJsonResponse.error(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = await self.authenticate(request)
+        except AuthenticationFailed as e:
+            detail = e.detail.get('detail', e.detail) if isinstance(e.detail, dict) else e.detail
+            return CustomJsonResponse.error(str(detail), status.HTTP_401_UNAUTHORIZED)
+
+        user_message = serializer.validated_data['message']
+        location = serializer.validated_data.get('location', '')
+        session_id = serializer.validated_data.get('session_id')
+
+        session = await sync_to_async(ChatService.get_or_create_session)(
+            user=user,
+            session_id=session_id,
+            session_key=await self.get_session_key(request),
+            first_message=user_message
+        )
+        keywords = file_uploder.extract_keywords(user_message)
+
+        # Job mode: hand the turn to a Celery worker, as ChatView does
+        if serializer.validated_data['mode'] == 'job':
+            return await self.enqueue_job(session, user_message, location, keywords)
+
+        history = await sync_to_async(ChatService.build_history)(session)
+        catalog = await sync_to_async(catalog_cache.get)()
+        csv_data = catalog.data if catalog is not None else None
+
+        start_time = time.time()
+
+        try:
+            response = await HopePipeline(api_key=settings.OPENAI_API_KEY).arun(
+                user_input=user_message,
+                location=location,
+                csv_data=csv_data,
+                history=history,
+                catalog=catalog,
+                keywords=keywords
+            )
+
+            response_time = time.time() - start_time
+            context_used = bool(csv_data is not None and keywords)
+
+            await sync_to_async(ChatService.save_turn)(
+                session=session,
+                user_message=user_message,
+                response=response,
+                location=location,
+                keywords=keywords,
+                context_used=context_used,
+                response_time=response_time
+            )
+
+            response_data = {
+                'response': response,
+                'session_id': str(session.id),
+                'keywords': keywords,
+                'context_used': context_used,
+                'response_time': round(response_time, 2)
+            }
+
+            return CustomJsonResponse.success("Message processed successfully", response_data)
+
+        except Exception as e:
+            return CustomJsonResponse.error(f"Error processing message: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
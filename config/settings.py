@@ -13,7 +13,7 @@ from datetime import timedelta
 import os
 from pathlib import Path
 from celery.schedules import crontab
-from decouple import config
+from decouple import config, Csv
 import logging
 
 # Firebase Admin SDK imports
@@ -201,9 +201,9 @@ CELERY_TIMEZONE = TIME_ZONE
 # Celery Beat Schedule
 CELERY_BEAT_SCHEDULE = {
     # ... existing schedules
-    'fetch-weather-alerts': {
-        'task': 'alerts.tasks.fetch_weather_alerts_task',
-        'schedule': crontab(minute='*/30'),  # Every 30 minutes
+    'poll-weather-alerts': {
+        'task': 'alerts.tasks.poll_weather_alerts_task',
+        'schedule': crontab(minute='*'),  # Every minute; the task decides whether a poll is due
     },
     'expire-old-alerts': {
         'task': 'alerts.tasks.expire_alerts_task',
@@ -382,6 +382,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'chatbot': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -404,8 +409,18 @@ SESSION_CACHE_ALIAS = 'default'
 # Weather alerts configuration
 WEATHER_ALERTS_ENABLED = config('WEATHER_ALERTS_ENABLED', default=True, cast=bool)
 WEATHER_API_TIMEOUT = config('WEATHER_API_TIMEOUT', default=30, cast=int)  # seconds
+WEATHER_API_BASE_URL = config('WEATHER_API_BASE_URL', default='https://api.weather.gov')
+WEATHER_ALERT_AREAS = config('WEATHER_ALERT_AREAS', default='NV', cast=Csv())  # state/marine area codes
+WEATHER_ALERT_ZONES = config('WEATHER_ALERT_ZONES', default='', cast=Csv())  # forecast zones, e.g. CAZ072
+WEATHER_FETCH_WORKERS = config('WEATHER_FETCH_WORKERS', default=8, cast=int)  # concurrent feed fetches
 MAX_ALERTS_PER_BATCH = config('MAX_ALERTS_PER_BATCH', default=100, cast=int)
 
+# Adaptive NWS polling (seconds): fast during Severe/Extreme or recent new alerts, backing off when quiet
+WEATHER_POLL_FAST_INTERVAL = config('WEATHER_POLL_FAST_INTERVAL', default=60, cast=int)
+WEATHER_POLL_QUIET_MIN_INTERVAL = config('WEATHER_POLL_QUIET_MIN_INTERVAL', default=120, cast=int)
+WEATHER_POLL_MAX_INTERVAL = config('WEATHER_POLL_MAX_INTERVAL', default=1800, cast=int)
+WEATHER_POLL_RECENT_WINDOW = config('WEATHER_POLL_RECENT_WINDOW', default=900, cast=int)
+
 # FCM notification settings
 FCM_BATCH_SIZE = config('FCM_BATCH_SIZE', default=500, cast=int)  # FCM limit is 500
 FCM_ENABLED = config('FCM_ENABLED', default=FIREBASE_AVAILABLE, cast=bool)
@@ -414,6 +429,84 @@ FCM_ENABLED = config('FCM_ENABLED', default=FIREBASE_AVAILABLE, cast=bool)
 ALERT_RETENTION_DAYS = config('ALERT_RETENTION_DAYS', default=7, cast=int)
 
 
+# CHATBOT APP SPECIFIC SETTINGS
+
+# Resource catalog cache (seconds between checks of the active CSV file)
+CHATBOT_CATALOG_REVALIDATE_SECONDS = config('CHATBOT_CATALOG_REVALIDATE_SECONDS', default=30, cast=int)
+
+# Nearest-resource search (offline ZIP centroid CSV with zip/latitude/longitude columns)
+CHATBOT_ZIP_CENTROIDS_PATH = config('CHATBOT_ZIP_CENTROIDS_PATH', default='')
+CHATBOT_NEAREST_K = config('CHATBOT_NEAREST_K', default=5, cast=int)
+CHATBOT_SEARCH_RADII_KM = config('CHATBOT_SEARCH_RADII_KM', default='5,10,20', cast=Csv(float))
+
+# Number of BM25-ranked resources considered for the prompt context
+CHATBOT_CONTEXT_TOP_K = config('CHATBOT_CONTEXT_TOP_K', default=25, cast=int)
+
+# Directory holding tiktoken's BPE files; the tokenizer is never downloaded at runtime
+TIKTOKEN_CACHE_DIR = config('TIKTOKEN_CACHE_DIR', default='')
+if TIKTOKEN_CACHE_DIR:
+    os.environ.setdefault('TIKTOKEN_CACHE_DIR', TIKTOKEN_CACHE_DIR)
+
+# Per-request prompt budget in model tokens (system prompt + history + message + resource data)
+CHATBOT_PROMPT_TOKEN_BUDGET = config('CHATBOT_PROMPT_TOKEN_BUDGET', default=8000, cast=int)
+CHATBOT_CONTEXT_TOKEN_BUDGET = config('CHATBOT_CONTEXT_TOKEN_BUDGET', default=1000, cast=int)
+
+# Conversation history sent to the model: rolling summary + last CHATBOT_HISTORY_WINDOW messages
+CHATBOT_HISTORY_WINDOW = config('CHATBOT_HISTORY_WINDOW', default=10, cast=int)  # messages
+CHATBOT_HISTORY_TOKEN_BUDGET = config('CHATBOT_HISTORY_TOKEN_BUDGET', default=2000, cast=int)
+CHATBOT_SUMMARY_EVERY_TURNS = config('CHATBOT_SUMMARY_EVERY_TURNS', default=5, cast=int)  # 0 disables
+CHATBOT_SUMMARY_MAX_TOKENS = config('CHATBOT_SUMMARY_MAX_TOKENS', default=300, cast=int)
+
+# Hot per-session message window kept in Redis and written through on each turn
+CHATBOT_CONTEXT_CACHE_ENABLED = config('CHATBOT_CONTEXT_CACHE_ENABLED', default=True, cast=bool)
+CHATBOT_CONTEXT_CACHE_ALIAS = config('CHATBOT_CONTEXT_CACHE_ALIAS', default='default')
+CHATBOT_CONTEXT_CACHE_TTL = config('CHATBOT_CONTEXT_CACHE_TTL', default=3600, cast=int)  # seconds idle
+
+# First-turn answer cache (Redis; configure the server with maxmemory-policy allkeys-lru)
+CHATBOT_ANSWER_CACHE_ENABLED = config('CHATBOT_ANSWER_CACHE_ENABLED', default=True, cast=bool)
+CHATBOT_ANSWER_CACHE_ALIAS = config('CHATBOT_ANSWER_CACHE_ALIAS', default='default')
+CHATBOT_ANSWER_CACHE_TTL = config('CHATBOT_ANSWER_CACHE_TTL', default=3600, cast=int)  # seconds
+CHATBOT_ANSWER_CACHE_LOCATION_PRECISION = config('CHATBOT_ANSWER_CACHE_LOCATION_PRECISION', default=2, cast=int)  # decimal places
+
+# Model backend: chatbot.utils.llm_backends.OpenAIBackend, or LocalLLMBackend for offline load tests
+CHATBOT_LLM_BACKEND = config('CHATBOT_LLM_BACKEND', default='chatbot.utils.llm_backends.OpenAIBackend')
+CHATBOT_LOCAL_LLM_LATENCY_MS = config('CHATBOT_LOCAL_LLM_LATENCY_MS', default=500, cast=float)  # median
+CHATBOT_LOCAL_LLM_LATENCY_SIGMA = config('CHATBOT_LOCAL_LLM_LATENCY_SIGMA', default=0.5, cast=float)  # log-normal shape
+CHATBOT_LOCAL_LLM_TOKEN_DELAY_MS = config('CHATBOT_LOCAL_LLM_TOKEN_DELAY_MS', default=20, cast=float)
+CHATBOT_LOCAL_LLM_ERROR_RATE = config('CHATBOT_LOCAL_LLM_ERROR_RATE', default=0.0, cast=float)
+CHATBOT_LOCAL_LLM_SEED = config('CHATBOT_LOCAL_LLM_SEED', default=0, cast=int)
+
+# Pooled HTTP client used by the async chat path to reach the model provider
+CHATBOT_LLM_TIMEOUT = config('CHATBOT_LLM_TIMEOUT', default=60, cast=int)  # seconds
+CHATBOT_LLM_MAX_CONNECTIONS = config('CHATBOT_LLM_MAX_CONNECTIONS', default=100, cast=int)
+CHATBOT_LLM_MAX_KEEPALIVE = config('CHATBOT_LLM_MAX_KEEPALIVE', default=20, cast=int)
+
+# Latency bounds for model calls; while the breaker is open replies fall back to a resource list
+CHATBOT_LLM_DEADLINE = config('CHATBOT_LLM_DEADLINE', default=20, cast=float)  # seconds per call
+CHATBOT_LLM_HEDGE_AFTER = config('CHATBOT_LLM_HEDGE_AFTER', default=0, cast=float)  # seconds; 0 disables hedging
+CHATBOT_LLM_HEDGE_WORKERS = config('CHATBOT_LLM_HEDGE_WORKERS', default=32, cast=int)
+CHATBOT_BREAKER_FAILURE_THRESHOLD = config('CHATBOT_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)
+CHATBOT_BREAKER_SLOW_CALL_SECONDS = config('CHATBOT_BREAKER_SLOW_CALL_SECONDS', default=15, cast=float)
+CHATBOT_BREAKER_RESET_SECONDS = config('CHATBOT_BREAKER_RESET_SECONDS', default=30, cast=int)
+CHATBOT_FALLBACK_RESOURCES = config('CHATBOT_FALLBACK_RESOURCES', default=3, cast=int)
+
+# Identical concurrent model calls share one in-flight request; DISTRIBUTED extends this across processes via Redis
+CHATBOT_SINGLE_FLIGHT_ENABLED = config('CHATBOT_SINGLE_FLIGHT_ENABLED', default=True, cast=bool)
+CHATBOT_SINGLE_FLIGHT_DISTRIBUTED = config('CHATBOT_SINGLE_FLIGHT_DISTRIBUTED', default=False, cast=bool)
+CHATBOT_SINGLE_FLIGHT_RESULT_TTL = config('CHATBOT_SINGLE_FLIGHT_RESULT_TTL', default=10, cast=int)  # seconds
+
+# Chat job mode (POST chat/ with mode='job'); run a worker with: celery -A config worker -Q chat
+CHATBOT_JOB_QUEUE = config('CHATBOT_JOB_QUEUE', default='chat')
+CHATBOT_JOB_MAX_QUEUE_DEPTH = config('CHATBOT_JOB_MAX_QUEUE_DEPTH', default=200, cast=int)
+CHATBOT_JOB_MAX_WAIT = config('CHATBOT_JOB_MAX_WAIT', default=25, cast=int)  # seconds of long-poll
+CHATBOT_JOB_RETRY_AFTER = config('CHATBOT_JOB_RETRY_AFTER', default=5, cast=int)  # seconds
+CHATBOT_JOB_DEPTH_CACHE_SECONDS = config('CHATBOT_JOB_DEPTH_CACHE_SECONDS', default=1, cast=float)
+
+CELERY_TASK_ROUTES = {
+    'chatbot.tasks.process_chat_message_task': {'queue': CHATBOT_JOB_QUEUE},
+}
+
+
 # SECURITY SETTINGS (Production considerations)
 
 # CSRF settings
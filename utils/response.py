@@ -1,4 +1,5 @@
 from rest_framework.response import Response
+from django.http import JsonResponse
 from django.utils import timezone
 from rest_framework import status
 
@@ -30,3 +31,18 @@ class CustomResponse:
             response_data["data"] = data
             
         return Response(response_data, status=status_code)
+
+
+class CustomJsonResponse:
+    """
+    Same envelope as CustomResponse for plain (async) Django views outside DRF
+    """
+    @staticmethod
+    def success(message, data=None, status_code=200):
+        response = CustomResponse.success(message, data, status_code)
+        return JsonResponse(response.data, status=status_code)
+
+    @staticmethod
+    def error(message, status_code=400, data=None):
+        response = CustomResponse.error(message, status_code, data)
+        return JsonResponse(response.data, status=status_code)